@@ -20,7 +20,15 @@ from mypl_printer import PrintVisitor
 from mypl_semantic_checker import SemanticChecker
 from mypl_code_gen import CodeGenerator
 from mypl_vm import VM
+from mypl_reg_vm import RegVM
+from mypl_reg_code_gen import RegCodeGenerator
+from mypl_compiler import CompiledProgram
+from mypl_tier import TieredVM
 from mypl_python import PythonConverter
+from mypl_heap import HeapCollector, GC_THRESHOLD
+from mypl_profile import Profiler, SamplingProfiler, SAMPLE_INTERVAL
+from mypl_phases import (PhaseTimer, TokenList, InstructionCounter,
+                         count_nodes, instruction_count)
 
 
 def run_lex_mode(in_stream):
@@ -105,13 +113,40 @@ def run_check_mode(in_stream):
 
 
     
-def run_ir_mode(in_stream):
+def build_vm(ast, backend, collector=None):
+    """Returns a VM (of the given backend) loaded with the code generated
+    for the given checked AST.
+
+    Args:
+        ast -- The (semantically checked) program AST.
+        backend -- Either 'stack', 'reg', 'py' (the stack VM program
+                   compiled to python functions), or 'tiered' (the stack
+                   VM, compiling hot functions to python).
+        collector -- The heap collector of the VM (if not the default).
+                     The register VM does not schedule collections.
+
+    """
+    if backend == 'reg':
+        vm = RegVM()
+        ast.accept(RegCodeGenerator(vm))
+    else:
+        vm = TieredVM() if backend == 'tiered' else VM()
+        if collector != None:
+            vm.collector = collector
+        ast.accept(CodeGenerator(vm))
+        if backend == 'py':
+            return CompiledProgram(vm)
+    return vm
+
+    
+def run_ir_mode(in_stream, backend='stack'):
     """Generates the intermediate representation (VM instructions) for the
     given mypl program and prints to standard output the resulting
     instructions.
 
     Args: 
         in_stream -- A wrapped input stream containing a mypl program.
+        backend -- The VM to generate instructions for.
 
     """
     try: 
@@ -120,9 +155,7 @@ def run_ir_mode(in_stream):
         ast = parser.parse()
         visitor = SemanticChecker()
         ast.accept(visitor)
-        vm = VM()
-        codegen = CodeGenerator(vm)
-        ast.accept(codegen)
+        vm = build_vm(ast, backend)
         print(vm)
     except MyPLError as ex:
         print(ex)
@@ -136,34 +169,110 @@ def run_py_model(in_stream):
     ast.accept(visitor)
 
     
-def run_normal_mode(in_stream):
+def run_normal_mode(in_stream, backend='stack', tier_stats=False,
+                    collector=None, gc_stats=False, profile=None,
+                    sample=None, sample_interval=SAMPLE_INTERVAL,
+                    time_phases=False, phases_json=None):
     """Executes the given mypl program. Any output produced by the program
     is printed to standard output. 
 
     Args: 
         in_stream -- A wrapped input stream containing a mypl program.
+        backend -- The VM to run the program on ('stack', 'reg', 'py', or
+                   'tiered').
+        tier_stats -- If true, runs the tiered VM and prints its report
+                      of promoted functions to standard error.
+        collector -- The heap collector to run with (or None for the
+                     default one).
+        gc_stats -- If true, prints the collector's report to standard
+                    error.
+        profile -- If given, runs the stack VM with a profiler, prints
+                   its report to standard error, and writes it as JSON
+                   to this file.
+        sample -- If given, runs the stack VM with a sampling profiler,
+                  writing its samples as collapsed stacks to this file.
+        sample_interval -- Seconds of CPU time between samples.
+        time_phases -- If true, prints the time, peak memory, and item
+                       counts of each phase to standard error.
+        phases_json -- If given, times the phases and writes them as
+                       JSON to this file.
 
     """
+    if collector == None:
+        collector = HeapCollector()
+    vm = None
+    profiler = None
+    sampler = None
+    counter = None
+    timer = PhaseTimer(time_phases or phases_json != None)
     try: 
+        timer.begin('lex', 'tokens')
         lexer = Lexer(in_stream)
+        if timer.enabled:
+            # lex the whole program before it is parsed
+            lexer = TokenList(lexer)
+        timer.end(lambda: len(lexer.tokens))
+        timer.begin('parse', 'nodes')
         parser = ASTParser(lexer)
         ast = parser.parse()
+        timer.end(lambda: count_nodes(ast))
+        timer.begin('check', 'nodes')
         visitor = SemanticChecker()
         ast.accept(visitor)
-        vm = VM()
-        codegen = CodeGenerator(vm)
-        ast.accept(codegen)
+        timer.end(lambda: count_nodes(ast))
+        if profile != None or sample != None:
+            backend = 'stack'
+        timer.begin('codegen', 'instructions')
+        vm = build_vm(ast, 'tiered' if tier_stats else backend, collector)
+        timer.end(lambda: instruction_count(vm))
+        if hasattr(vm, 'source_name'):
+            vm.source_name = getattr(in_stream.stream, 'name', '<stdin>')
+        if profile != None:
+            profiler = Profiler()
+            vm.add_tracer(profiler)
+            profiler.start(vm)
+        if sample != None:
+            sampler = SamplingProfiler(vm, sample_interval)
+            sampler.start()
+        if timer.enabled and hasattr(vm, 'add_tracer'):
+            counter = InstructionCounter()
+            vm.add_tracer(counter)
+        timer.begin('execute', 'executed')
         vm.run()
+        timer.end(lambda: None if counter == None else counter.count)
     except MyPLError as ex:
         print(ex)
         exit(1)
+    finally:
+        if tier_stats and vm != None:
+            print(vm.tier_stats(), end='', file=sys.stderr)
+        if profiler != None:
+            profiler.stop()
+            print(profiler.report(), end='', file=sys.stderr)
+            with open(profile, 'w') as f:
+                f.write(profiler.to_json())
+        if sampler != None:
+            sampler.stop()
+            with open(sample, 'w') as f:
+                f.write(sampler.collapsed())
+        # hand collection back to python (if the run did not)
+        collector.stop()
+        if gc_stats:
+            print(collector.gc_stats(), end='', file=sys.stderr)
+        timer.stop()
+        if time_phases:
+            print(timer.report(), end='', file=sys.stderr)
+        if phases_json != None:
+            with open(phases_json, 'w') as f:
+                f.write(timer.to_json())
 
 
     
 if __name__ == '__main__':
     # initial help/usage info
     about = ('Run the mypl interpreter.\n'
-             'If filename missing, reads from standard input.')
+             'If filename missing, reads from standard input. Options go'
+             ' before the filename.')
     # set up the argument parser
     argparser = argparse.ArgumentParser(prog='mypl', description=about)
     group = argparser.add_mutually_exclusive_group()
@@ -180,6 +289,43 @@ if __name__ == '__main__':
     group.add_argument('--ir', action='store_true', help=help_msg)
     help_msg = 'mypl program file (optional)'
     group.add_argument('--py', action='store_true', help=help_msg)
+    help_msg = 'virtual machine to generate code for and run'
+    argparser.add_argument('--backend',
+                           choices=['stack', 'reg', 'py', 'tiered'],
+                           default='stack', help=help_msg)
+    help_msg = 'run the tiered VM and report the functions it promoted'
+    argparser.add_argument('--tier-stats', action='store_true', help=help_msg)
+    help_msg = 'heap objects allocated between garbage collections'
+    argparser.add_argument('--gc-threshold', type=int, default=GC_THRESHOLD,
+                           help=help_msg)
+    help_msg = ('collect only objects allocated since the last collection '
+                '(except every 10th collection)')
+    argparser.add_argument('--gc-incremental', action='store_true',
+                           help=help_msg)
+    help_msg = 'report garbage collections (to standard error)'
+    argparser.add_argument('--gc-stats', action='store_true', help=help_msg)
+    help_msg = ('profile the program on the stack VM (report to standard'
+                ' error, JSON to the --profile-out file)')
+    argparser.add_argument('--profile', action='store_true', help=help_msg)
+    help_msg = 'file the profile is written to as JSON'
+    argparser.add_argument('--profile-out', default='mypl-profile.json',
+                           metavar='JSON_FILE', help=help_msg)
+    help_msg = ('sample the call stack of the program on the stack VM'
+                ' (collapsed stacks to the --sample-out file)')
+    argparser.add_argument('--sample', action='store_true', help=help_msg)
+    help_msg = 'file the sampled collapsed stacks are written to'
+    argparser.add_argument('--sample-out', default='mypl-stacks.txt',
+                           metavar='STACKS_FILE', help=help_msg)
+    help_msg = 'milliseconds of CPU time between samples'
+    argparser.add_argument('--sample-interval', type=float,
+                           default=SAMPLE_INTERVAL * 1000, help=help_msg)
+    help_msg = ('report the time, peak memory, and item counts of each'
+                ' phase (to standard error)')
+    argparser.add_argument('--time-phases', action='store_true',
+                           help=help_msg)
+    help_msg = 'time the phases and write them as JSON to the given file'
+    argparser.add_argument('--time-phases-json', metavar='JSON_FILE',
+                           help=help_msg)
     help_msg = 'convert mypl to python'
     argparser.add_argument('filename', nargs='?', help=help_msg)
     args = argparser.parse_args()
@@ -201,11 +347,17 @@ if __name__ == '__main__':
     elif args.check:
         run_check_mode(in_stream)
     elif args.ir:
-        run_ir_mode(in_stream)
+        run_ir_mode(in_stream, args.backend)
     elif args.py:
         run_py_model(in_stream)
     else:
-        run_normal_mode(in_stream)
+        collector = HeapCollector(args.gc_threshold, args.gc_incremental)
+        run_normal_mode(in_stream, args.backend, args.tier_stats, collector,
+                        args.gc_stats,
+                        args.profile_out if args.profile else None,
+                        args.sample_out if args.sample else None,
+                        args.sample_interval / 1000, args.time_phases,
+                        args.time_phases_json)
     # close the (wrapped) input stream
     in_stream.close()
 
@@ -11,7 +11,8 @@ from src.mypl_lexer import *
 from src.mypl_ast import *
 
 BUILT_INS = ['print', 'input', 'itos', 'itod', 'dtos', 'dtoi', 'stoi', 'stod',
-             'length', 'get']
+             'length', 'get', 'fill', 'copy', 'total', 'min', 'max', 'scale',
+             'builder', 'append', 'input_lines']
 
 class ASTParser:
 
@@ -392,9 +393,6 @@ class ASTParser:
             self.eat(TokenType.LBRACE, 'expecting LBRACE token type')
             while not self.match(TokenType.RBRACE):
                 stmt_result = self.stmt()
-                if type(stmt_result) == CallExpr:
-                    expr_node = Expr(None, SimpleTerm(stmt_result), None, None)
-                    basic_if_node.stmts.append(expr_node)
                 basic_if_node.stmts.append(stmt_result)
             self.eat(TokenType.RBRACE, 'expecting RBRACE token type')
             if_stmt_node.else_ifs.append(basic_if_node)
@@ -404,9 +402,6 @@ class ASTParser:
             self.eat(TokenType.LBRACE, 'expecting LBRACE token type')
             while not self.match(TokenType.RBRACE):
                 stmt_result = self.stmt()
-                if type(stmt_result) == CallExpr:
-                    expr_node = Expr(None, SimpleTerm(stmt_result), None, None)
-                    if_stmt_node.else_stmts.append(expr_node)
                 if_stmt_node.else_stmts.append(stmt_result)
             self.eat(TokenType.RBRACE, 'expecting RBRACE token type')
     
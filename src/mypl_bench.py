@@ -0,0 +1,398 @@
+"""Benchmark driver for comparing MyPL VM configurations.
+
+Runs each program in examples/ and bench/ under several configurations
+(the stack VM with and without the code generator's optimizations, the
+register VM, the stack VM program compiled to python, and the tiered
+stack VM that compiles only its hot functions), reporting the number of
+dispatched VM instructions and the wall-clock time of each run. With
+--memory it instead reports the calls made, the bytes allocated per call,
+and the peak memory of each run (as traced by tracemalloc), and with
+--arrays the memory and speed of large typed (unboxed) arrays compared
+to boxed ones.
+
+NAME: Alicia Domingo
+DATE: Spring 2024
+CLASS: CPSC 326
+
+"""
+
+import argparse
+import contextlib
+import glob
+import io
+import os
+import sys
+import time
+import tracemalloc
+
+from src.mypl_iowrapper import FileWrapper
+from src.mypl_lexer import Lexer
+from src.mypl_ast_parser import ASTParser
+from src.mypl_semantic_checker import SemanticChecker
+from src.mypl_code_gen import CodeGenerator
+from src.mypl_frame import *
+from src.mypl_vm import VM
+from src.mypl_reg_vm import RegVM
+from src.mypl_reg_code_gen import RegCodeGenerator
+from src.mypl_compiler import CompiledProgram
+from src.mypl_tier import TieredVM
+
+
+PROGRAM_DIRS = ['examples', 'bench']
+
+
+class CountingList(list):
+    """Instruction list that counts instruction fetches (dispatches)."""
+
+    def __init__(self, instrs, counter):
+        super().__init__(instrs)
+        self.counter = counter
+
+    def __getitem__(self, index):
+        self.counter[0] += 1
+        return super().__getitem__(index)
+
+
+def parse(source):
+    """Returns the semantically checked AST of the program."""
+    ast = ASTParser(Lexer(FileWrapper(io.StringIO(source)))).parse()
+    ast.accept(SemanticChecker())
+    return ast
+
+
+def build_stack(source):
+    """Returns a stack VM with the unoptimized program loaded."""
+    vm = VM()
+    parse(source).accept(CodeGenerator(vm, optimize=False))
+    return vm
+
+
+def build_stack_opt(source):
+    """Returns a stack VM with the optimized program loaded."""
+    vm = VM()
+    parse(source).accept(CodeGenerator(vm))
+    return vm
+
+
+def build_reg(source):
+    """Returns a register VM with the program loaded."""
+    vm = RegVM()
+    parse(source).accept(RegCodeGenerator(vm))
+    return vm
+
+
+def build_py(source):
+    """Returns the optimized program compiled to python functions."""
+    return CompiledProgram(build_stack_opt(source))
+
+
+def build_tiered(source):
+    """Returns a tiered stack VM with the optimized program loaded."""
+    vm = TieredVM()
+    parse(source).accept(CodeGenerator(vm))
+    return vm
+
+
+# configuration name -> VM builder (the first is the baseline)
+CONFIGS = {'stack': build_stack,
+           'stack-opt': build_stack_opt,
+           'reg': build_reg,
+           'py': build_py,
+           'tiered': build_tiered}
+
+
+def run(vm, stdin=''):
+    """Runs the VM, returning its output (or raising its error)."""
+    out = io.StringIO()
+    old_stdin = sys.stdin
+    sys.stdin = io.StringIO(stdin)
+    try:
+        with contextlib.redirect_stdout(out):
+            vm.run()
+    finally:
+        sys.stdin = old_stdin
+    return out.getvalue()
+
+
+def count_dispatches(source, builder):
+    """Returns the number of instructions dispatched by a run (None for
+    compiled programs, which do not dispatch instructions).
+
+    """
+    vm = builder(source)
+    if isinstance(vm, CompiledProgram):
+        return None
+    counter = [0]
+    for template in vm.frame_templates.values():
+        if isinstance(vm, VM):
+            # the stack VM fetches opcodes from the linked encoding
+            template.opcodes = CountingList(template.opcodes, counter)
+        else:
+            template.instructions = CountingList(template.instructions, counter)
+    run(vm)
+    return counter[0]
+
+
+def measure_calls(source, builder):
+    """Returns (calls, bytes allocated per call, peak bytes) of a run
+    traced by tracemalloc, where the bytes of a call are those allocated
+    (and still live) after its CALL or TAILCALL instruction. The first
+    two are None for VMs other than the stack VM.
+
+    """
+    vm = builder(source)
+    stats = [0, 0]
+    if isinstance(vm, VM):
+        for name in ['exec_call', 'exec_tailcall']:
+            handler = getattr(vm, name)
+            def traced(frame, stack, arg, handler=handler):
+                before = tracemalloc.get_traced_memory()[0]
+                next_frame = handler(frame, stack, arg)
+                stats[0] += 1
+                stats[1] += tracemalloc.get_traced_memory()[0] - before
+                return next_frame
+            # the dispatch table is built from the VM's attributes
+            setattr(vm, name, traced)
+    tracemalloc.start()
+    try:
+        run(vm)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    if not isinstance(vm, VM):
+        return None, None, peak
+    return stats[0], stats[1] / stats[0] if stats[0] else 0, peak
+
+
+def time_run(source, builder, repeat):
+    """Returns (output, best wall-clock seconds) over repeat runs."""
+    best = None
+    for _ in range(repeat):
+        vm = builder(source)
+        start = time.perf_counter()
+        output = run(vm)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best == None else min(best, elapsed)
+    return output, best
+
+
+def bench_program(path, configs, repeat):
+    """Returns a dict of config name -> (dispatches, seconds) for one
+    program, or an error string.
+
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        source = f.read()
+    results = {}
+    base_out = None
+    for name in configs:
+        builder = CONFIGS[name]
+        try:
+            output, seconds = time_run(source, builder, repeat)
+            count = count_dispatches(source, builder)
+        except BaseException as ex:
+            msg = str(ex).splitlines()[0] if str(ex) else type(ex).__name__
+            return f'error ({name}): {msg}'
+        if base_out == None:
+            base_out = output
+        elif output != base_out:
+            return f'error ({name}): output differs'
+        results[name] = (count, seconds)
+    return results
+
+
+# opcode microbenchmarks: name -> (setup, body); the body is repeated
+# and leaves the operand stack and variables as it found them (variable
+# 0 holds an int, 1 an array, and 2 a struct object)
+OPCODE_BENCHES = {
+    'PUSH/POP': ([], [PUSH(1), POP()]),
+    'LOAD/STORE': ([], [LOAD(0), STORE(0)]),
+    'DUP': ([], [LOAD(0), DUP(), POP(), POP()]),
+    'ADD': ([], [PUSH(1), PUSH(2), ADD(), POP()]),
+    'DIV': ([], [PUSH(7), PUSH(2), DIV(), POP()]),
+    'CMPLT': ([], [PUSH(1), PUSH(2), CMPLT(), POP()]),
+    'CMPEQ': ([], [PUSH(1), PUSH(2), CMPEQ(), POP()]),
+    'NOT': ([], [PUSH(True), NOT(), POP()]),
+    'GETF': ([], [LOAD(2), GETF(0), POP()]),
+    'SETF': ([], [LOAD(2), PUSH(1), SETF(0)]),
+    'GETI': ([], [LOAD(1), PUSH(0), GETI(), POP()]),
+    'SETI': ([], [LOAD(1), PUSH(0), PUSH(1), SETI()]),
+    'LEN': ([], [LOAD(1), LEN(), POP()]),
+    'TOSTR': ([], [LOAD(0), TOSTR(), POP()]),
+    'NOP': ([], [NOP(), NOP()]),
+}
+
+
+def build_opcode_bench(body, count):
+    """Returns a stack VM whose main function runs body count times."""
+    vm = VM()
+    vm.struct_layouts = {'T': ['x']}
+    setup = [PUSH(1), STORE(0), PUSH(4), ALLOCA(), STORE(1),
+             ALLOCS('T'), STORE(2)]
+    instrs = setup + body * count + [PUSH(None), RET()]
+    vm.add_frame_template(VMFrameTemplate('main', 0, instrs))
+    return vm
+
+
+def bench_opcodes(repeat, count=20000):
+    """Returns a dict of opcode benchmark name -> nanoseconds per
+    dispatched instruction (best of repeat runs).
+
+    """
+    results = {}
+    for name, (_, body) in OPCODE_BENCHES.items():
+        best = None
+        for _ in range(repeat):
+            vm = build_opcode_bench(body, count)
+            # time only execution (not linking and encoding)
+            vm.link()
+            start = time.perf_counter()
+            run(vm)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best == None else min(best, elapsed)
+        results[name] = 1e9 * best / (len(body) * count)
+    return results
+
+
+# large array benchmark: fills an array of each element type, then
+# reads it back (A is the element type and V the stored value)
+ARRAY_BENCH = (
+    'void main() {\n'
+    '  int n = N;\n'
+    '  array A xs = new A[n];\n'
+    '  for (int i = 0; i < n; i = i + 1) {\n'
+    '    A v = V;\n'
+    '    xs[i] = v;\n'
+    '  }\n'
+    '  A x = null;\n'
+    '  for (int i = 0; i < n; i = i + 1) {\n'
+    '    x = xs[i];\n'
+    '  }\n'
+    '}\n'
+)
+
+ARRAY_VALUES = {'int': 'i * 1000', 'double': 'itod(i)', 'bool': 'i < 100'}
+
+
+def build_array_bench(elem_type, length, typed):
+    """Returns a stack VM with the array benchmark loaded (using a boxed
+    array if typed is false).
+
+    """
+    source = ARRAY_BENCH.replace('N', str(length)).replace('A', elem_type)
+    vm = build_stack_opt(source.replace('V', ARRAY_VALUES[elem_type]))
+    if not typed:
+        template = vm.frame_templates['main']
+        for instr in template.instructions:
+            if instr.opcode == OpCode.ALLOCA:
+                instr.operand = None
+        # re-encode the (already linked) template
+        template.opcodes = None
+        vm.link()
+    return vm
+
+
+def bench_arrays(repeat, length=100000):
+    """Returns a dict of (element type, 'typed' or 'boxed') -> (peak
+    bytes per element, nanoseconds per element written and read).
+
+    """
+    results = {}
+    for elem_type in ARRAY_VALUES:
+        for typed in [True, False]:
+            vm = build_array_bench(elem_type, length, typed)
+            vm.link()
+            tracemalloc.start()
+            try:
+                run(vm)
+                peak = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+            best = None
+            for _ in range(repeat):
+                vm = build_array_bench(elem_type, length, typed)
+                vm.link()
+                start = time.perf_counter()
+                run(vm)
+                elapsed = time.perf_counter() - start
+                best = elapsed if best == None else min(best, elapsed)
+            storage = 'typed' if typed else 'boxed'
+            results[(elem_type, storage)] = (peak / length,
+                                             1e9 * best / (2 * length))
+    return results
+
+
+def main():
+    about = 'Benchmark the MyPL VM configurations.'
+    argparser = argparse.ArgumentParser(prog='mypl_bench', description=about)
+    argparser.add_argument('--repeat', type=int, default=3,
+                           help='number of timed runs per program')
+    argparser.add_argument('--configs', nargs='+', choices=list(CONFIGS),
+                           default=list(CONFIGS),
+                           help='configurations to compare (first is base)')
+    argparser.add_argument('--opcodes', action='store_true',
+                           help='time individual stack VM opcodes instead')
+    argparser.add_argument('--memory', action='store_true',
+                           help='report calls and allocations instead')
+    argparser.add_argument('--arrays', action='store_true',
+                           help='compare typed and boxed large arrays instead')
+    argparser.add_argument('files', nargs='*', help='mypl programs (optional)')
+    args = argparser.parse_args()
+    if args.opcodes:
+        print(f'{"opcodes":28} {"ns/instr":>8}')
+        for name, ns in bench_opcodes(args.repeat).items():
+            print(f'{name:28} {ns:>8.1f}')
+        return
+    if args.arrays:
+        print(f'{"array":10} {"storage":8} {"B/elem":>8} {"ns/elem":>8}')
+        for (elem_type, storage), (size, ns) in bench_arrays(args.repeat).items():
+            print(f'{elem_type:10} {storage:8} {size:>8.1f} {ns:>8.1f}')
+        return
+    paths = args.files
+    if not paths:
+        for directory in PROGRAM_DIRS:
+            paths += sorted(glob.glob(os.path.join(directory, '*.mypl')))
+    if args.memory:
+        print(f'{"program":28} {"config":10} {"calls":>8} {"B/call":>8}'
+              f' {"peak(KB)":>9}')
+        for path in paths:
+            with open(path, 'r', encoding='utf-8') as f:
+                source = f.read()
+            name = os.path.basename(path)
+            for config in args.configs:
+                try:
+                    calls, per_call, peak = measure_calls(source, CONFIGS[config])
+                except BaseException as ex:
+                    msg = str(ex).splitlines()[0] if str(ex) else type(ex).__name__
+                    print(f'{name:28} error ({config}): {msg}')
+                    break
+                if calls == None:
+                    calls, per_call = '-', '-'
+                else:
+                    per_call = f'{per_call:.1f}'
+                print(f'{name:28} {config:10} {calls:>8} {per_call:>8}'
+                      f' {peak / 1024:>9.1f}')
+                name = ''
+        return
+    print(f'{"program":28} {"config":10} {"dispatches":>11} {"vs base":>8}'
+          f' {"time(s)":>8} {"speedup":>8}')
+    for path in paths:
+        results = bench_program(path, args.configs, args.repeat)
+        name = os.path.basename(path)
+        if type(results) == str:
+            print(f'{name:28} {results}')
+            continue
+        base_count, base_time = results[args.configs[0]]
+        for config, (count, seconds) in results.items():
+            speedup = base_time / seconds if seconds else 0
+            if count == None or not base_count:
+                count, ratio = '-', '-'
+            else:
+                ratio = f'{100 * count / base_count:.1f}%'
+            print(f'{name:28} {config:10} {count:>11} {ratio:>8}'
+                  f' {seconds:>8.4f} {speedup:>7.2f}x')
+            name = ''
+
+
+if __name__ == '__main__':
+    main()
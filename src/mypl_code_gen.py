@@ -12,36 +12,168 @@ from src.mypl_var_table import *
 from src.mypl_frame import *
 from src.mypl_opcode import *
 from src.mypl_vm import *
+from src.mypl_optimizer import *
+from src.mypl_struct_layout import *
+
+
+# bulk array built-in function -> its instruction
+ARRAY_BUILT_IN_INSTRS = {'fill': FILL, 'copy': COPY, 'total': TOTAL,
+                         'min': MIN, 'max': MAX, 'scale': SCALE}
+
+# built-in functions whose calls leave no value on the operand stack
+VOID_BUILT_INS = ['print', 'append', 'fill', 'copy', 'scale']
+
+
+def first_token(expr):
+    """Returns the first token of an expression (for its position)."""
+    while isinstance(expr.first, ComplexTerm):
+        expr = expr.first.expr
+    rvalue = expr.first.rvalue
+    if isinstance(rvalue, SimpleRValue):
+        return rvalue.value
+    if isinstance(rvalue, VarRValue):
+        return rvalue.path[0].var_name
+    if isinstance(rvalue, CallExpr):
+        return rvalue.fun_name
+    return rvalue.type_name
 
 
 class CodeGenerator (Visitor):
 
-    def __init__(self, vm):
+    def __init__(self, vm, optimize=True):
         """Creates a new Code Generator given a VM. 
         
         Args:
             vm -- The target vm.
+            optimize -- If false, skips the optimization passes.
         """
         # the vm to add frames to
         self.vm = vm
+        # whether to hoist invariants, mark tail calls, fuse instructions
+        self.optimize = optimize
         # the current frame template being generated
         self.curr_template = None
         # for var -> index mappings wrt to environments
         self.var_table = VarTable()
         # struct name -> StructDef for struct field info
         self.struct_defs = {}
+        # id of struct field VarRef -> field slot index
+        self.field_offsets = {}
+        # id of hoisted loop-invariant expression -> temp var offset
+        self.hoisted = {}
+        # for naming hoisted temp vars
+        self.next_temp = 0
 
     
     def add_instr(self, instr):
         """Helper function to add an instruction to the current template."""
         self.curr_template.instructions.append(instr)
 
+
+    def emit_stmt(self, stmt):
+        """Helper function to generate a statement. The value of a call
+        used as a statement is popped (discarded)."""
+        stmt.accept(self)
+        if (isinstance(stmt, CallExpr) and
+                not stmt.fun_name.lexeme in VOID_BUILT_INS):
+            self.add_instr(POP())
+
+
+    def set_position(self, token):
+        """Helper function to record the source position of the
+        instructions added next (from the given token on)."""
+        self.curr_template.line_table.add(len(self.curr_template.instructions),
+                                          token.line, token.column)
+
+
+    def hoist_invariants(self, exprs, effects):
+        """Emits (as a loop preheader) code to compute the loop-invariant
+        subexpressions of the given expressions into new temp vars in the
+        current environment. Returns the hoisted expressions.
+
+        Args:
+            exprs -- The expressions to search for invariants.
+            effects -- The LoopEffects of the enclosing loop.
+        """
+        found = []
+        if not self.optimize:
+            return found
+        for expr in exprs:
+            find_invariants(expr, effects, found, self.hoisted)
+        for expr in found:
+            expr.accept(self)
+            temp_name = f'$t{self.next_temp}'
+            self.next_temp += 1
+            self.var_table.add(temp_name)
+            offset = self.var_table.get(temp_name)
+            self.add_instr(STORE(offset))
+            self.hoisted[id(expr)] = offset
+        return found
+
+
+    def emit_loop(self, condition, stmts, step=None):
+        """Helper function to generate a while or for loop. Invariant parts
+        of the condition are hoisted in front of the loop (the condition
+        always runs at least once). If invariants are also hoisted from
+        the body, the loop is rotated so that they are only computed once
+        the loop is entered.
+
+        Args:
+            condition -- The loop condition.
+            stmts -- The loop body statements.
+            step -- The for loop assignment statement (if any).
+        """
+        per_iteration = [condition] if step == None else [condition, step]
+        effects = loop_effects(per_iteration, stmts)
+        self.set_position(first_token(condition))
+        hoisted = self.hoist_invariants([condition], effects)
+        
+        start_jmp = len(self.curr_template.instructions)
+        condition.accept(self)
+        # creating a filler for JMPF until instructions inside loop are done
+        exit_jmps = [JMPF(-1)]
+        self.add_instr(exit_jmps[0])
+
+        body_hoisted = self.hoist_invariants(body_exprs(stmts), effects)
+        hoisted += body_hoisted
+        body_start = len(self.curr_template.instructions)
+        
+        # creating new environment
+        self.var_table.push_environment()
+        for stmt in stmts:
+            self.emit_stmt(stmt)
+        self.var_table.pop_environment()
+
+        if not step == None:
+            step.accept(self)
+
+        # the jump back (and rotated check) belong to the loop condition
+        self.set_position(first_token(condition))
+        if body_hoisted:
+            # rotated loop: re-check the condition at the bottom
+            condition.accept(self)
+            exit_jmps.append(JMPF(-1))
+            self.add_instr(exit_jmps[-1])
+            self.add_instr(JMP(body_start))
+        else:
+            self.add_instr(JMP(start_jmp))
+        self.add_instr(NOP())
+        for jmp_instr in exit_jmps:
+            jmp_instr.operand = len(self.curr_template.instructions) - 1
+
+        for expr in hoisted:
+            del self.hoisted[id(expr)]
+
         
     def visit_program(self, program):
+        self.field_offsets = field_offsets(program)
+        self.vm.struct_layouts = struct_layouts(program.struct_defs)
         for struct_def in program.struct_defs:
             struct_def.accept(self)
         for fun_def in program.fun_defs:
             fun_def.accept(self)
+        # resolve calls (and report undefined functions) before running
+        self.vm.link()
 
     
     def visit_struct_def(self, struct_def):
@@ -57,38 +189,46 @@ class CodeGenerator (Visitor):
         if fun_def.fun_name.lexeme == 'main':
             # empty program
             if fun_def.stmts == []:
-                self.add_instr(PUSH('null'))
+                self.add_instr(PUSH(None))
                 self.add_instr(RET())
             else:
                 for stmt in fun_def.stmts:
-                    stmt.accept(self)
+                    self.emit_stmt(stmt)
                     
                 if not self.curr_template.instructions[-1] == RET():
-                    self.add_instr(PUSH('null'))
+                    self.add_instr(PUSH(None))
                     self.add_instr(RET())
         # for any other function that is not main 
         else:
+            # the arguments are the first variable slots of the frame
             for param in fun_def.params:
                 self.var_table.add(param.var_name.lexeme)
-                offset = self.var_table.get(param.var_name.lexeme)
-                self.add_instr(STORE(offset))
             
             if fun_def.stmts == []:
-                self.add_instr(PUSH('null'))
+                self.add_instr(PUSH(None))
                 self.add_instr(RET())
             else:
                 for stmt in fun_def.stmts:
-                    stmt.accept(self)
+                    self.emit_stmt(stmt)
+
+                # implicit return (falling off the end ended the program)
+                if not self.curr_template.instructions[-1] == RET():
+                    self.add_instr(PUSH(None))
+                    self.add_instr(RET())
             
-        self.var_table.push_environment()    
+        self.var_table.pop_environment()
+        if self.optimize:
+            optimize_template(self.curr_template)
         self.vm.add_frame_template(self.curr_template)
 
     def visit_return_stmt(self, return_stmt):
+        self.set_position(first_token(return_stmt.expr))
         return_stmt.expr.accept(self)
         self.add_instr(RET())   
 
         
     def visit_var_decl(self, var_decl):
+        self.set_position(var_decl.var_def.data_type.type_name)
         # nothing to do here
         var_decl.var_def.accept(self)
         
@@ -101,11 +241,12 @@ class CodeGenerator (Visitor):
             self.add_instr(STORE(offset))
         # simple variable declaration with no expression
         else:
-            self.add_instr(PUSH('null'))
+            self.add_instr(PUSH(None))
             offset = self.var_table.get(var_decl.var_def.var_name.lexeme)
             self.add_instr(STORE(offset))
     
     def visit_assign_stmt(self, assign_stmt):
+        self.set_position(assign_stmt.lvalue[0].var_name)
         # single lvalue
         if len(assign_stmt.lvalue) == 1:
             # getting value from operand stack
@@ -122,140 +263,80 @@ class CodeGenerator (Visitor):
                 assign_stmt.expr.accept(self)
                 self.add_instr(STORE(offset))
                 
-        # multiple lvalue
+        # multiple lvalue: load the object holding the last field (each
+        # path element is a field access, possibly followed by an index)
         elif len(assign_stmt.lvalue) > 1:
-            if assign_stmt.lvalue[0].array_expr == None:
-                offset = self.var_table.get(assign_stmt.lvalue[0].var_name.lexeme)
-                self.add_instr(LOAD(offset))
-                curr_field = assign_stmt.lvalue[-1].var_name.lexeme
-                for i in range(1, len(assign_stmt.lvalue) - 1):
-                    field = assign_stmt.lvalue[i].var_name.lexeme
-                    self.add_instr(GETF(field))
+            path = assign_stmt.lvalue
+            offset = self.var_table.get(path[0].var_name.lexeme)
+            self.add_instr(LOAD(offset))
+            if path[0].array_expr != None:
+                path[0].array_expr.accept(self)
+                self.add_instr(GETI())
+            for var_ref in path[1:-1]:
+                self.add_instr(GETF(self.field_offsets[id(var_ref)]))
+                if var_ref.array_expr != None:
+                    var_ref.array_expr.accept(self)
+                    self.add_instr(GETI())
+            last_field = self.field_offsets[id(path[-1])]
+            if path[-1].array_expr != None:
+                # assigning an element of an array field
+                self.add_instr(GETF(last_field))
+                path[-1].array_expr.accept(self)
                 assign_stmt.expr.accept(self)
-                self.add_instr(SETF(curr_field))
+                self.add_instr(SETI())
             else:
-                offset = self.var_table.get(assign_stmt.lvalue[0].var_name.lexeme)
-                self.add_instr(LOAD(offset))
-                assign_stmt.lvalue[0].array_expr.accept(self)
-                self.add_instr(GETI())
-                curr_field = assign_stmt.lvalue[-1].var_name.lexeme
-                
-                for i in range(1, len(assign_stmt.lvalue) - 1):
-                    field = assign_stmt.lvalue[i].var_name.lexeme
-                    oid = self.var_table.get(field)
-                    self.add_instr(LOAD(oid))
-                    self.add_instr(GETF(field))
-                    
                 assign_stmt.expr.accept(self)
-                self.add_instr(SETF(curr_field))
+                self.add_instr(SETF(last_field))
             
             
     def visit_while_stmt(self, while_stmt):
-        start_jmp = len(self.curr_template.instructions)
-        while_stmt.condition.accept(self)
-        
-        # creating a filler for JMPF until instructions inside loop are done
-        jmp_instr = JMPF(-1)
-        self.add_instr(jmp_instr)
-        
-        # creating new environment
+        # new environment for hoisted loop-invariant temps
         self.var_table.push_environment()
-        for stmt in while_stmt.stmts:
-            stmt.accept(self)
+        self.emit_loop(while_stmt.condition, while_stmt.stmts)
         self.var_table.pop_environment()
         
-        self.add_instr(JMP(start_jmp))   
-        self.add_instr(NOP())
-        jmp_instr.operand = len(self.curr_template.instructions) - 1
-        
     def visit_for_stmt(self, for_stmt):
         # pushing new environment for the for statment
         self.var_table.push_environment()
         for_stmt.var_decl.accept(self)
         
-        # getting the starting index to jump back to
-        start_jmp = len(self.curr_template.instructions)
-        for_stmt.condition.accept(self)
-        
-        jmp_instr = JMPF(-1)
-        self.add_instr(jmp_instr)
-        
-        # creating a new environment for inside for loop
-        self.var_table.push_environment()
-        for stmt in for_stmt.stmts:
-            stmt.accept(self)
-            
-        self.var_table.pop_environment()
-        
-        for_stmt.assign_stmt.accept(self)
-        
-        self.add_instr(JMP(start_jmp))
-        self.add_instr(NOP())
-        jmp_instr.operand = len(self.curr_template.instructions) - 1
+        self.emit_loop(for_stmt.condition, for_stmt.stmts, for_stmt.assign_stmt)
         
         # popping the environment once for loop is done
         self.var_table.pop_environment()
 
     
     def visit_if_stmt(self, if_stmt):
-        if_stmt.if_part.condition.accept(self)
-        jmp_elseif = JMPF(-1)
-        self.add_instr(jmp_elseif)
-        
-        self.var_table.push_environment()
-        for stmt in if_stmt.if_part.stmts:
-            stmt.accept(self)
-        self.var_table.pop_environment()
-        
-        jmp_end = JMP(-1)
-        self.add_instr(jmp_end)
-        
-        jmp_end_else_if = JMP(-1)
-        
-        if not if_stmt.else_ifs == []:
-            else_if_index = len(self.curr_template.instructions)
-            jmp_elseif.operand = else_if_index
-            
-            for else_if in if_stmt.else_ifs:
-                else_if.condition.accept(self)
-                jmp_next_block = JMPF(-1)
-                self.add_instr(jmp_next_block)
-                
-                self.var_table.push_environment()
-                for stmt in else_if.stmts:
-                    stmt.accept(self)
-                self.var_table.pop_environment()
-                
-                self.add_instr(jmp_end_else_if)
-                next_else_if_index = len(self.curr_template.instructions)
-                jmp_next_block.operand = next_else_if_index
-        else:
-            if if_stmt.else_stmts == []:
-                # if there is only an if statement
-                self.add_instr(NOP())
-                jmp_elseif.operand = len(self.curr_template.instructions) - 1
-                jmp_end.operand = len(self.curr_template.instructions) - 1
-                jmp_end_else_if.operand = len(self.curr_template.instructions) -1
-            else:
-                # there are no else ifs
-                jmp_elseif.operand = len(self.curr_template.instructions)
-                jmp_end.operand = len(self.curr_template.instructions)
-                jmp_end_else_if.operand = len(self.curr_template.instructions)
-            
-        if not if_stmt.else_stmts == []:
-            else_index = len(self.curr_template.instructions)
-            jmp_next_block.operand = else_index
+        # jumps to the end of the if statement (after each block)
+        end_jmps = []
+        for basic_if in [if_stmt.if_part] + if_stmt.else_ifs:
+            self.set_position(first_token(basic_if.condition))
+            basic_if.condition.accept(self)
+            jmp_next_block = JMPF(-1)
+            self.add_instr(jmp_next_block)
             
             self.var_table.push_environment()
-            for stmt in if_stmt.else_stmts:
-                stmt.accept(self)
+            for stmt in basic_if.stmts:
+                self.emit_stmt(stmt)
             self.var_table.pop_environment()
             
-            jmp_end.operand = len(self.curr_template.instructions)
-            jmp_end_else_if = len(self.curr_template.instructions)
+            end_jmps.append(JMP(-1))
+            self.add_instr(end_jmps[-1])
+            # the next else if (or the else) starts here
+            jmp_next_block.operand = len(self.curr_template.instructions)
+            
+        self.var_table.push_environment()
+        for stmt in if_stmt.else_stmts:
+            self.emit_stmt(stmt)
+        self.var_table.pop_environment()
+        
+        self.add_instr(NOP())
+        for jmp_end in end_jmps:
+            jmp_end.operand = len(self.curr_template.instructions) - 1
                 
     
     def visit_call_expr(self, call_expr):
+        self.set_position(call_expr.fun_name)
         # simple printing
         if call_expr.fun_name.lexeme == 'print':
             call_expr.args[0].accept(self)
@@ -283,6 +364,21 @@ class CodeGenerator (Visitor):
             self.add_instr(GETC())
         elif call_expr.fun_name.lexeme == 'input':
             self.add_instr(READ())
+        elif call_expr.fun_name.lexeme == 'input_lines':
+            # all the remaining lines without a count
+            if call_expr.args:
+                call_expr.args[0].accept(self)
+            else:
+                self.add_instr(PUSH(-1))
+            self.add_instr(READLINES())
+        elif call_expr.fun_name.lexeme == 'builder':
+            self.add_instr(BUILDER())
+        elif call_expr.fun_name.lexeme == 'append':
+            append_assign(call_expr).accept(self)
+        elif call_expr.fun_name.lexeme in ARRAY_BUILT_IN_INSTRS:
+            for arg in call_expr.args:
+                arg.accept(self)
+            self.add_instr(ARRAY_BUILT_IN_INSTRS[call_expr.fun_name.lexeme]())
         else:
             function_name = call_expr.fun_name.lexeme
             for arg in call_expr.args:
@@ -291,6 +387,10 @@ class CodeGenerator (Visitor):
  
 
     def visit_expr(self, expr):
+        # loop-invariant expression already computed in a preheader
+        if id(expr) in self.hoisted:
+            self.add_instr(LOAD(self.hoisted[id(expr)]))
+            return
         if not expr.op == None and expr.op.lexeme in ['>', '>=']:
             expr.rest.accept(self)
             expr.first.accept(self)
@@ -366,26 +466,27 @@ class CodeGenerator (Visitor):
         elif val == 'false':
             self.add_instr(PUSH(False))
         elif val == 'null':
-            self.add_instr(PUSH('null'))
+            self.add_instr(PUSH(None))
 
     
     def visit_new_rvalue(self, new_rvalue):
         if new_rvalue.array_expr == None:
             struct_name = new_rvalue.type_name.lexeme
-            self.add_instr(ALLOCS())
+            self.add_instr(ALLOCS(struct_name))
             
-            # seting the field for the struct
+            # seting the field for the struct (field i is in slot i)
             for i in range(len(new_rvalue.struct_params)):
-                # getting param and struct name field
-                field = self.struct_defs[struct_name].fields[i].var_name.lexeme
-                
-                # adding struct instructions
-                self.add_instr(DUP())
-                new_rvalue.struct_params[i].accept(self)
-                self.add_instr(SETF(field))
+                # adding struct instructions (INITF fuses DUP ... SETF)
+                if self.optimize:
+                    new_rvalue.struct_params[i].accept(self)
+                    self.add_instr(INITF(i))
+                else:
+                    self.add_instr(DUP())
+                    new_rvalue.struct_params[i].accept(self)
+                    self.add_instr(SETF(i))
         else:
             new_rvalue.array_expr.accept(self)
-            self.add_instr(ALLOCA())
+            self.add_instr(ALLOCA(new_rvalue.type_name.lexeme))
             
     def visit_var_rvalue(self, var_rvalue):
         count = 0
@@ -401,12 +502,12 @@ class CodeGenerator (Visitor):
                 if not var_ref.array_expr == None:
                     
                     if self.var_table.get(struct_name) == None and not struct_name in self.struct_defs:
-                        self.add_instr(GETF(struct_name))
+                        self.add_instr(GETF(self.field_offsets[id(var_ref)]))
                     else:
                         index = self.var_table.get(struct_name)
                         self.add_instr(LOAD(index))
                     var_ref.array_expr.accept(self)
                     self.add_instr(GETI())
                 else:
-                    self.add_instr(GETF(struct_name))
+                    self.add_instr(GETF(self.field_offsets[id(var_ref)]))
             count = count + 1
\ No newline at end of file
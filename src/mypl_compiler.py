@@ -0,0 +1,570 @@
+"""Ahead-of-time compiler from MyPL VM frame templates to Python.
+
+Each (linked) frame template of a stack VM program is translated into
+the source of a Python function: operand stack slots become locals
+(s0, s1, ...), variables become locals (v0, v1, ...), basic blocks
+become if statements inside a while loop (for jumps), and calls become
+direct Python calls. The source is compiled with compile() and run in
+process, sharing the VM's object ids.
+
+NAME: Alicia Domingo
+DATE: Spring 2024
+CLASS: CPSC 326
+
+"""
+
+import sys
+
+from src.mypl_error import *
+from src.mypl_opcode import *
+from src.mypl_frame import *
+from src.mypl_heap import *
+from src.mypl_rope import *
+
+
+# python recursion limit used while running compiled code (the VM's call
+# stack is only bounded by memory). Compiled calls are python calls, so a
+# compiled program can only nest about this many calls (tail calls to the
+# same function excepted). The limit is set process-wide during a run.
+RECURSION_LIMIT = 100000
+
+# opcodes that pop two values (x, then y) and push the result of y op x
+BINARY_OPCODES = [OpCode.ADD, OpCode.SUB, OpCode.MUL, OpCode.DIV,
+                  OpCode.AND, OpCode.OR, OpCode.CMPLT, OpCode.CMPLE,
+                  OpCode.CMPEQ, OpCode.CMPNE]
+
+NUMBER_ERROR = 'VM Error: Stack must contain two valid ints or doubles'
+NONE_ERROR = 'VM Error: Cannot contain None type'
+DEPTH_ERROR = 'Call stack too deep for compiled code'
+
+
+class TemplateCompiler:
+    """Translates a single linked frame template into Python source."""
+
+    def __init__(self, vm, template, depth_limit=None):
+        self.vm = vm
+        self.template = template
+        # if set, the function counts its active calls in the global
+        # depth, and once depth_limit are active runs a call interpreted
+        # instead, through i<template id> (see mypl_tier)
+        self.depth_limit = depth_limit
+        # generated source lines (without the function header)
+        self.lines = []
+        # symbolic operand stack: python expressions where the entry at
+        # depth i is a constant, a variable, or a slot sj (for j <= i)
+        self.stack = []
+        # stack depth at the start of each basic block (jump target)
+        self.block_depths = {}
+        # block offsets a running activation can continue at (see
+        # compile_osr)
+        self.entries = set()
+
+
+    def error(self, msg):
+        name = self.template.function_name
+        raise MyPLError(f'Compile Error: {msg} (in {name})')
+
+
+    def emit(self, line, indent=3):
+        self.lines.append('    ' * indent + line)
+
+
+    #----------------------------------------------------------------------
+    # Operand stack
+    #----------------------------------------------------------------------
+
+    def push(self, expr):
+        """Pushes a (side-effect free) expression without evaluating it."""
+        self.stack.append(expr)
+
+    def pop(self):
+        if not self.stack:
+            self.error('operand stack underflow')
+        return self.stack.pop()
+
+    def result(self, expr):
+        """Evaluates the expression into the next stack slot."""
+        slot = f's{len(self.stack)}'
+        self.emit(f'{slot} = {expr}')
+        self.push(slot)
+
+    def is_last_result(self, slot):
+        """Returns true if the last line emitted evaluates the given
+        (popped) stack slot.
+
+        """
+        return (slot[0] == 's' and slot not in self.stack and self.lines and
+                self.lines[-1].lstrip().startswith(f'{slot} = '))
+
+    def check_none(self, exprs, msg):
+        """Emits a check that none of the values is None (null)."""
+        tests = [f'{expr} is None' for expr in exprs
+                 if expr[0] in 'sv' or expr == 'None']
+        if tests:
+            self.emit(f'if {" or ".join(tests)}:')
+            self.emit(f'    raise MyPLError({msg!r})')
+
+    def spill(self, only=None):
+        """Evaluates stack entries into their slots (all of them, or the
+        ones that read the given variable).
+
+        """
+        slots = []
+        exprs = []
+        for i in range(len(self.stack)):
+            expr = self.stack[i]
+            if expr != f's{i}' and (only == None or expr == only):
+                slots.append(f's{i}')
+                exprs.append(expr)
+                self.stack[i] = f's{i}'
+        if slots:
+            self.emit(f'{", ".join(slots)} = {", ".join(exprs)}')
+
+
+    #----------------------------------------------------------------------
+    # Control flow
+    #----------------------------------------------------------------------
+
+    def block_leaders(self):
+        """Returns the sorted offsets of the basic block starts."""
+        instrs = self.template.instructions
+        leaders = set([0])
+        for instr in instrs:
+            if instr.opcode in [OpCode.JMP, OpCode.JMPF, OpCode.CMPLT_JMPF]:
+                if not 0 <= instr.operand < len(instrs):
+                    self.error(f'jump out of range {instr}')
+                leaders.add(instr.operand)
+        return sorted(leaders)
+
+    def jump_to(self, target):
+        """Emits a jump (the stack must already be spilled)."""
+        depth = len(self.stack)
+        if self.block_depths.setdefault(target, depth) != depth:
+            self.error(f'inconsistent stack depth at {target}')
+        return f'blk = {target}; continue'
+
+    def compile(self):
+        """Returns the source of the python function for the template."""
+        template = self.template
+        instrs = template.instructions
+        leaders = self.block_leaders()
+        loop = len(leaders) > 1 or any(
+            instr.opcode == OpCode.TAILCALL and
+            instr.operand == template for instr in instrs)
+        self.block_depths[0] = 0
+        emitted = set()
+        reachable = True
+        for pc in range(len(instrs)):
+            if pc in leaders:
+                if reachable:
+                    self.spill()
+                    if pc > 0:
+                        self.emit(self.jump_to(pc).split(';')[0])
+                elif not pc in self.block_depths:
+                    # only reached by a later (backward) jump, if at all
+                    continue
+                depth = self.block_depths[pc]
+                self.stack = [f's{i}' for i in range(depth)]
+                self.emit(f'if blk == {pc}:', 2)
+                emitted.add(pc)
+                reachable = True
+            if not reachable:
+                continue
+            reachable = self.compile_instr(instrs[pc])
+        if reachable:
+            self.error('function does not end in a return')
+        if not set(self.block_depths) <= emitted:
+            self.error('unsupported jump (backward into skipped code)')
+        self.entries = emitted if loop else set()
+        # the arguments are the first variables
+        num_vars = self.num_vars()
+        params = ', '.join(f'v{i}' for i in range(template.arg_count))
+        header = [f'def f{template.template_id}({params}):']
+        if num_vars > template.arg_count:
+            names = ' = '.join(f'v{i}' for i in range(template.arg_count, num_vars))
+            header.append(f'    {names} = None')
+        if loop:
+            body = ['    blk = 0', '    while True:'] + self.lines
+        else:
+            # single block: no dispatch loop needed
+            body = [line[8:] for line in self.lines
+                    if line.strip() != 'if blk == 0:']
+        if self.depth_limit != None:
+            header += ['    global depth',
+                       f'    if depth >= {self.depth_limit}:',
+                       f'        return i{template.template_id}({params})',
+                       '    depth += 1',
+                       '    try:']
+            body = ['    ' + line for line in body]
+            body += ['    finally:', '        depth -= 1']
+        return '\n'.join(header + body) + '\n'
+
+    def compile_osr(self):
+        """Returns the source of a python function (named f<id>_osr) that
+        continues a running activation of the template at the start of a
+        block, or None if the template has a single block. It takes the
+        block offset, the frame's variables, and its operand stack (whose
+        depth must be that of the block). Call after compile(); the
+        offsets it can enter at are in self.entries.
+
+        """
+        if not self.entries:
+            return None
+        header = [f'def f{self.template.template_id}_osr(blk, v, s):']
+        num_vars = self.num_vars()
+        if num_vars:
+            names = ''.join(f'v{i}, ' for i in range(num_vars))
+            header.append(f'    {names}= (v + [None] * {num_vars})[:{num_vars}]')
+        for pc in sorted(self.entries):
+            depth = self.block_depths[pc]
+            if depth:
+                slots = ''.join(f's{i}, ' for i in range(depth))
+                header.append(f'    if blk == {pc}:')
+                header.append(f'        {slots}= s')
+        header.append('    while True:')
+        return '\n'.join(header + self.lines) + '\n'
+
+    def num_vars(self):
+        """Returns the number of variable slots the template uses."""
+        return self.template.local_count
+
+
+    #----------------------------------------------------------------------
+    # Instructions
+    #----------------------------------------------------------------------
+
+    def compile_instr(self, instr):
+        """Emits the code for the instruction. Returns false if the next
+        instruction cannot be reached by falling through.
+
+        """
+        opcode = instr.opcode
+        operand = instr.operand
+
+        # literals and variables
+        if opcode == OpCode.PUSH:
+            self.push(repr(operand))
+        elif opcode == OpCode.POP:
+            self.pop()
+        elif opcode == OpCode.STORE:
+            x = self.pop()
+            self.spill(f'v{operand}')
+            if x != f'v{operand}' and self.is_last_result(x):
+                # assign the variable directly (v0 = v0 + s1 then appends
+                # to a string in place, instead of copying it)
+                self.lines[-1] = self.lines[-1].replace(f'{x} =', f'v{operand} =', 1)
+            elif x != f'v{operand}':
+                self.emit(f'v{operand} = {x}')
+        elif opcode == OpCode.LOAD:
+            self.push(f'v{operand}')
+
+        # operations
+        elif opcode in BINARY_OPCODES:
+            if len(self.stack) < 2:
+                # the VM ignores these when there is only one value
+                if opcode in [OpCode.ADD, OpCode.SUB, OpCode.MUL,
+                              OpCode.DIV, OpCode.CMPLE]:
+                    return True
+            x = self.pop()
+            y = self.pop()
+            self.compile_binary(opcode, x, y)
+        elif opcode == OpCode.NOT:
+            x = self.pop()
+            self.check_none([x], NONE_ERROR)
+            self.result(f'not {x}')
+
+        # branching
+        elif opcode == OpCode.JMP:
+            self.spill()
+            self.emit(self.jump_to(operand))
+            return False
+        elif opcode == OpCode.JMPF:
+            x = self.pop()
+            self.spill()
+            self.emit(f'if not {x}: {self.jump_to(operand)}')
+        elif opcode == OpCode.CMPLT_JMPF:
+            x = self.pop()
+            y = self.pop()
+            self.check_none([x, y], NONE_ERROR)
+            self.spill()
+            self.emit(f'if not {y} < {x}: {self.jump_to(operand)}')
+
+        # functions
+        elif opcode == OpCode.RET:
+            x = self.pop()
+            self.emit(f'return {x}')
+            return False
+        elif opcode == OpCode.CALL:
+            args = [self.pop() for _ in range(operand.arg_count)][::-1]
+            self.result(f'f{operand.template_id}({", ".join(args)})')
+        elif opcode == OpCode.TAILCALL:
+            args = [self.pop() for _ in range(operand.arg_count)][::-1]
+            if operand == self.template:
+                # self tail call: rebind the parameters and restart
+                self.stack = []
+                if args:
+                    params = ', '.join(f'v{i}' for i in range(len(args)))
+                    self.emit(f'{params} = {", ".join(args)}')
+                self.emit(self.jump_to(0))
+            else:
+                self.emit(f'return f{operand.template_id}({", ".join(args)})')
+            return False
+
+        # built-in functions
+        elif opcode == OpCode.WRITE:
+            if self.stack:
+                x = self.pop()
+                self.emit(f'write({x})')
+        elif opcode == OpCode.READ:
+            self.result('read()')
+        elif opcode == OpCode.READLINES:
+            self.result(f'read_lines({self.pop()})')
+        elif opcode == OpCode.BUILDER:
+            self.result('Rope()')
+        elif opcode == OpCode.LEN:
+            x = self.pop()
+            self.check_none([x], 'VM Error: Cannot get length of None type')
+            self.result(f'len({x})')
+        elif opcode == OpCode.GETC:
+            x = self.pop()
+            y = self.pop()
+            self.check_none([x], 'VM Error: Cannot be None type')
+            self.check_none([y], 'VM Error: Cannot be None type')
+            self.emit(f'if {y} > len({x}) - 1 or {y} < 0:')
+            self.emit("    raise MyPLError('VM Error: Index too large for string')")
+            self.result(f'{x}[{y}]')
+        elif opcode == OpCode.TOINT:
+            x = self.pop()
+            self.check_none([x], 'VM Error: Cannot be a None type')
+            self.result(f'toint({x})')
+        elif opcode == OpCode.TODBL:
+            x = self.pop()
+            self.check_none([x], 'VM Error: Cannot be a None type')
+            self.result(f'todbl({x})')
+        elif opcode == OpCode.TOSTR:
+            x = self.pop()
+            self.check_none([x], 'VM Error: Cannot be a None type')
+            self.result(f'str({x})')
+
+        # heap
+        elif opcode == OpCode.ALLOCS:
+            size = len(self.vm.struct_layouts[operand])
+            self.result(f'allocs({size})')
+        elif opcode == OpCode.SETF:
+            x = self.pop()
+            y = self.pop()
+            self.check_none([y], 'VM Error: oid is None. You cannot have any None types')
+            self.emit(f'{y}[{operand}] = {x}')
+        elif opcode == OpCode.GETF:
+            x = self.pop()
+            self.check_none([x], 'VM Error: oid cannot be None type')
+            self.result(f'{x}[{operand}]')
+        elif opcode == OpCode.ALLOCA:
+            x = self.pop()
+            self.result(f'alloca({x}, {operand!r})')
+        elif opcode == OpCode.SETI:
+            x = self.pop()
+            y = self.pop()
+            z = self.pop()
+            self.check_none([y, z], 'VM Error: Index cannot be None Type')
+            self.emit(f'if len({z}) <= {y} or {y} < 0:')
+            self.emit("    raise MyPLError('VM Error: Index is too large for allocated array')")
+            self.emit(f'{z}[{y}] = {x}')
+        elif opcode == OpCode.GETI:
+            x = self.pop()
+            y = self.pop()
+            self.check_none([x, y], 'VM Error: Index or oid cannot be None')
+            self.emit(f'if len({y}) <= {x} or {x} < 0:')
+            self.emit("    raise MyPLError('VM Error: Index too large for allocated array')")
+            self.result(f'{y}[{x}]')
+
+        # bulk array built ins
+        elif opcode == OpCode.FILL:
+            x = self.pop()
+            y = self.pop()
+            self.emit(f'array_fill({y}, {x})')
+        elif opcode == OpCode.COPY:
+            x = self.pop()
+            y = self.pop()
+            self.emit(f'array_copy({y}, {x})')
+        elif opcode == OpCode.TOTAL:
+            self.result(f'array_total({self.pop()})')
+        elif opcode == OpCode.MIN:
+            self.result(f'array_min({self.pop()})')
+        elif opcode == OpCode.MAX:
+            self.result(f'array_max({self.pop()})')
+        elif opcode == OpCode.SCALE:
+            x = self.pop()
+            y = self.pop()
+            self.emit(f'array_scale({y}, {x})')
+
+        # special
+        elif opcode == OpCode.DUP:
+            x = self.pop()
+            self.push(x)
+            self.push(x)
+        elif opcode == OpCode.NOP:
+            pass
+
+        # superinstructions
+        elif opcode == OpCode.LOADLOAD_ADD:
+            y = f'v{operand[0]}'
+            x = f'v{operand[1]}'
+            self.check_none([x, y], NUMBER_ERROR)
+            self.result(f'{y} + {x}')
+        elif opcode == OpCode.LOAD_GETF:
+            x = f'v{operand[0]}'
+            self.check_none([x], 'VM Error: oid cannot be None type')
+            self.result(f'{x}[{operand[1]}]')
+        elif opcode == OpCode.INCLOCAL:
+            x = f'v{operand[0]}'
+            self.spill(x)
+            self.check_none([x], NUMBER_ERROR)
+            self.emit(f'{x} = {x} + {operand[1]!r}')
+        elif opcode == OpCode.INITF:
+            x = self.pop()
+            obj = self.stack[-1]
+            self.emit(f'{obj}[{operand}] = {x}')
+        else:
+            self.error(f'unsupported operation {instr}')
+        return True
+
+    def compile_binary(self, opcode, x, y):
+        """Emits the code for a binary operation (y op x)."""
+        if opcode in [OpCode.ADD, OpCode.SUB, OpCode.MUL]:
+            self.check_none([x, y], NUMBER_ERROR)
+            op = {OpCode.ADD: '+', OpCode.SUB: '-', OpCode.MUL: '*'}[opcode]
+            self.result(f'{y} {op} {x}')
+        elif opcode == OpCode.DIV:
+            self.check_none([x, y], NUMBER_ERROR)
+            self.emit(f'if {x} == 0:')
+            self.emit("    raise MyPLError('VM Error: Division by 0 error')")
+            self.result(f'int({y} / {x}) if type({x}) == int and type({y}) == int'
+                        f' else {y} / {x}')
+        elif opcode in [OpCode.AND, OpCode.OR]:
+            self.check_none([x, y], NONE_ERROR)
+            op = 'and' if opcode == OpCode.AND else 'or'
+            self.result(f'{y} {op} {x}')
+        elif opcode == OpCode.CMPLT:
+            self.check_none([x, y], NONE_ERROR)
+            self.result(f'{y} < {x}')
+        elif opcode == OpCode.CMPLE:
+            self.check_none([x, y], NONE_ERROR)
+            self.result(f'{y} <= {x}')
+        elif opcode == OpCode.CMPEQ:
+            self.result(f'{y} == {x}')
+        elif opcode == OpCode.CMPNE:
+            self.result(f'{y} != {x}')
+
+
+def runtime(vm):
+    """Returns the global namespace for compiled functions that share the
+    given VM's object ids.
+
+    """
+    output = vm.output
+
+    def read():
+        output.flush()
+        return vm.input.read_line()
+
+    def read_lines(count):
+        oid = vm.next_obj_id
+        vm.next_obj_id += 1
+        if oid >= vm.next_collection:
+            vm.collect()
+        if count == None:
+            raise MyPLError('VM Error: Cannot be None type')
+        output.flush()
+        return ArrayObject(oid, vm.input.read_lines(count))
+
+    def toint(x):
+        x = flat(x)
+        if type(x) == float or (type(x) == str and x.isdigit()):
+            return int(x)
+        raise MyPLError('VM Error: TOINT opcode requires a string, int, or double')
+
+    def todbl(x):
+        x = flat(x)
+        if type(x) == str and not vm.is_int_or_float(x):
+            raise MyPLError('VM Error: String must just contain a int or double')
+        return float(x)
+
+    def allocs(size):
+        oid = vm.next_obj_id
+        vm.next_obj_id += 1
+        if oid >= vm.next_collection:
+            vm.collect()
+        return StructObject(oid, (None,) * size)
+
+    def alloca(length, elem_type):
+        oid = vm.next_obj_id
+        vm.next_obj_id += 1
+        if oid >= vm.next_collection:
+            vm.collect()
+        if length == None or length < 0:
+            raise MyPLError('VM Error: Array length cannot be None type or less than 0')
+        return new_array(oid, length, elem_type)
+
+    return {'MyPLError': MyPLError, 'write': output.write_value, 'read': read,
+            'read_lines': read_lines,
+            'toint': toint, 'todbl': todbl, 'allocs': allocs,
+            'alloca': alloca, 'array_fill': array_fill,
+            'array_copy': array_copy, 'array_total': array_total,
+            'array_min': array_min, 'array_max': array_max,
+            'array_scale': array_scale, 'Rope': Rope}
+
+
+class CompiledProgram:
+    """A stack VM program compiled to Python functions."""
+
+    def __init__(self, vm):
+        """Compiles the frame templates of the given stack VM program.
+
+        Args:
+            vm -- The VM with the program loaded (it provides the heap).
+        """
+        self.vm = vm
+        vm.link()
+        # template id -> python source of the function
+        self.sources = [TemplateCompiler(vm, template).compile()
+                        for template in vm.templates]
+        self.namespace = self.runtime()
+        code = compile(''.join(self.sources), '<mypl>', 'exec')
+        exec(code, self.namespace)
+
+    def __repr__(self):
+        """Returns the generated python source."""
+        s = ''
+        for template in self.vm.templates:
+            s += f'\n# {template.function_name}\n'
+            s += self.sources[template.template_id]
+        return s
+
+    def runtime(self):
+        """Returns the global namespace for the compiled functions."""
+        return runtime(self.vm)
+
+    def run(self):
+        """Runs the compiled program (from its main function). Raises
+        the python recursion limit (process-wide) to RECURSION_LIMIT
+        during the run, and reports a VM error if the program nests
+        calls deeper than that.
+
+        """
+        if not 'main' in self.vm.frame_templates:
+            raise VMError('No "main" function')
+        main = self.namespace[f'f{self.vm.frame_templates["main"].template_id}']
+        limit = sys.getrecursionlimit()
+        sys.setrecursionlimit(max(limit, RECURSION_LIMIT))
+        collector = self.vm.collector
+        collector.start()
+        self.vm.next_collection = self.vm.next_obj_id + collector.threshold
+        try:
+            main()
+        except RecursionError:
+            raise VMError(DEPTH_ERROR) from None
+        finally:
+            collector.stop()
+            self.vm.output.flush()
+            sys.setrecursionlimit(limit)
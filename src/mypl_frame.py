@@ -1,24 +1,113 @@
 
+from array import array
+from bisect import bisect_right
 from dataclasses import dataclass, field
 from typing import Any
 from src.mypl_opcode import OpCode
 
 
+class LineTable:
+    """The source positions of a frame template's instructions, stored
+    as runs: the instructions from offset starts[i] up to starts[i+1]
+    were generated from the statement at lines[i] and columns[i]. Only
+    looked up when an error, trace, or profile reports a location.
+
+    """
+
+    def __init__(self):
+        self.starts = array('i')
+        self.lines = array('i')
+        self.columns = array('i')
+
+    def add(self, pc, line, column):
+        """Starts a run of instructions at offset pc (replacing a run
+        starting at the same offset, which has no instructions).
+
+        """
+        if self.starts and self.starts[-1] == pc:
+            self.starts.pop()
+            self.lines.pop()
+            self.columns.pop()
+        if self.lines and (self.lines[-1], self.columns[-1]) == (line, column):
+            return
+        self.starts.append(pc)
+        self.lines.append(line)
+        self.columns.append(column)
+
+    def position(self, pc):
+        """Returns the (line, column) of the instruction at offset pc, or
+        None if it has no position.
+
+        """
+        i = bisect_right(self.starts, pc) - 1
+        if i < 0:
+            return None
+        return self.lines[i], self.columns[i]
+
+    def line(self, pc):
+        """Returns the line of the instruction at offset pc, or None."""
+        position = self.position(pc)
+        return None if position is None else position[0]
+
+    def remap(self, new_offsets):
+        """Moves the runs to the new offsets of their first instructions
+        (after instructions are fused). Where several runs now start at
+        the same offset, the first is kept.
+
+        """
+        table = LineTable()
+        for pc, line, column in zip(self.starts, self.lines, self.columns):
+            new_pc = new_offsets[pc]
+            if not table.starts or table.starts[-1] != new_pc:
+                table.add(new_pc, line, column)
+        self.starts, self.lines, self.columns = (table.starts, table.lines,
+                                                 table.columns)
+
+
 @dataclass
 class VMFrameTemplate:
     """A VM function-call frame template (type)."""
     function_name: str
     arg_count: int
     instructions: list['VMInstr'] = field(default_factory=list) 
+    # dense index of the template (assigned by VM.link)
+    template_id: int = -1
+    # compact encoding executed by the VM (assigned by VM.link): opcode
+    # values and int operands (or constant pool indexes) as int arrays
+    opcodes: Any = None
+    operands: Any = None
+    # execution counters (maintained by the tiered VM): number of calls
+    # and of backward jumps (loop iterations) taken while interpreted
+    calls: int = 0
+    back_edges: int = 0
+    # the template's promoted (compiled python) function, if any
+    compiled: Any = None
+    # number of variable slots, including the parameters (assigned by
+    # VM.link), and the initial values of the slots after the parameters
+    local_count: int = 0
+    blank_locals: tuple = ()
+    # released frames of the template, reused by later calls
+    free_frames: list['VMFrame'] = field(default_factory=list, compare=False)
+    # source positions of the instructions (recorded by the code generator)
+    line_table: LineTable = field(default_factory=LineTable, compare=False)
+
+    def __repr__(self):
+        # shown as the operand of linked CALL instructions
+        return self.function_name
 
     
 @dataclass
 class VMFrame:
-    """A VM function-call frame."""
+    """A VM function-call frame. The frame's variable slots (starting
+    with its arguments) and then its operands are stored in the VM's
+    value stack, from index base on.
+
+    """
     template: VMFrameTemplate
     pc: int = 0
-    variables: list[Any] = field(default_factory=list) 
-    operand_stack: list[Any] = field(default_factory=list) 
+    base: int = 0
+    # index of the frame's first operand (after its variable slots)
+    operand_base: int = 0
 
 
 @dataclass
@@ -30,7 +119,10 @@ class VMInstr:
 
     def __repr__(self):
         s = f'{self.opcode}('
-        s += f'{str(self.operand)}' if self.operand != None else ''
+        if self.operand != None:
+            s += f'{str(self.operand)}'
+        elif self.opcode == OpCode.PUSH:
+            s += 'null'
         s += ')'
         s += f'  // {self.comment}' if self.comment else ''
         return s
@@ -94,12 +186,18 @@ def CALL(fun_name):
 def RET():
     return VMInstr(OpCode.RET)    
 
+def TAILCALL(fun_name):
+    return VMInstr(OpCode.TAILCALL, fun_name)
+
 def WRITE():
     return VMInstr(OpCode.WRITE)
 
 def READ():
     return VMInstr(OpCode.READ)
 
+def READLINES():
+    return VMInstr(OpCode.READLINES)
+
 def LEN():
     return VMInstr(OpCode.LEN)
 
@@ -115,17 +213,20 @@ def TODBL():
 def TOSTR():
     return VMInstr(OpCode.TOSTR)
 
-def ALLOCS():
-    return VMInstr(OpCode.ALLOCS)
+def BUILDER():
+    return VMInstr(OpCode.BUILDER)
+
+def ALLOCS(struct_name):
+    return VMInstr(OpCode.ALLOCS, struct_name)
 
-def SETF(field_name):
-    return VMInstr(OpCode.SETF, field_name)
+def SETF(field_offset):
+    return VMInstr(OpCode.SETF, field_offset)
 
-def GETF(field_name):
-    return VMInstr(OpCode.GETF, field_name)
+def GETF(field_offset):
+    return VMInstr(OpCode.GETF, field_offset)
 
-def ALLOCA():
-    return VMInstr(OpCode.ALLOCA)
+def ALLOCA(elem_type=None):
+    return VMInstr(OpCode.ALLOCA, elem_type)
 
 def SETI():
     return VMInstr(OpCode.SETI)
@@ -133,12 +234,41 @@ def SETI():
 def GETI():
     return VMInstr(OpCode.GETI)
 
+def FILL():
+    return VMInstr(OpCode.FILL)
+
+def COPY():
+    return VMInstr(OpCode.COPY)
+
+def TOTAL():
+    return VMInstr(OpCode.TOTAL)
+
+def MIN():
+    return VMInstr(OpCode.MIN)
+
+def MAX():
+    return VMInstr(OpCode.MAX)
+
+def SCALE():
+    return VMInstr(OpCode.SCALE)
+
 def DUP():
     return VMInstr(OpCode.DUP)
 
 def NOP():
     return VMInstr(OpCode.NOP)
 
+def LOADLOAD_ADD(mem_addr1, mem_addr2):
+    return VMInstr(OpCode.LOADLOAD_ADD, (mem_addr1, mem_addr2))
+
+def LOAD_GETF(mem_addr, field_offset):
+    return VMInstr(OpCode.LOAD_GETF, (mem_addr, field_offset))
+
+def INCLOCAL(mem_addr, value):
+    return VMInstr(OpCode.INCLOCAL, (mem_addr, value))
 
+def CMPLT_JMPF(offset):
+    return VMInstr(OpCode.CMPLT_JMPF, offset)
 
-    
\ No newline at end of file
+def INITF(field_offset):
+    return VMInstr(OpCode.INITF, field_offset)
@@ -0,0 +1,416 @@
+"""Heap objects of the MyPL VMs, and their collector.
+
+Struct objects and arrays are python lists (of field values by slot, and
+of elements) that the VMs reference directly. Each also carries the
+object id it was allocated with, which is only used to print it. Objects
+compare (and hash) by identity, not by their contents. Arrays of ints,
+doubles, and bools are instead stored unboxed (see TypedArray), but
+are indexed the same way.
+
+Since objects are referenced directly, an object is freed as soon as the
+last reference to it is dropped. Objects that reference each other (a
+struct pointing to itself, or a list of structs linked both ways) are
+only reclaimed by python's cycle collector, which finds the containers
+nothing outside the cycle references. The HeapCollector runs python's
+collector on a schedule set by the program's own allocations (instead of
+python's, which counts every container allocated), and counts the cyclic
+heap objects it finds.
+
+NAME: Alicia Domingo
+DATE: Spring 2024
+CLASS: CPSC 326
+
+"""
+
+import gc
+import time
+from array import array
+from dataclasses import dataclass, field
+
+from src.mypl_error import *
+
+
+# number of heap objects allocated between collections
+GC_THRESHOLD = 10000
+
+# number of (incremental) collections per full collection
+FULL_COLLECTION_INTERVAL = 10
+
+
+class HeapObject(list):
+    """A struct object or array (a list with an object id)."""
+    __slots__ = ('oid',)
+
+    def __init__(self, oid, values):
+        super().__init__(values)
+        self.oid = oid
+
+    __eq__ = object.__eq__
+    __ne__ = object.__ne__
+    __hash__ = object.__hash__
+
+    def __str__(self):
+        # how the object prints (as its object id)
+        return str(self.oid)
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self.oid}, {list(self)})'
+
+
+class StructObject(HeapObject):
+    """A struct object: its field values, by slot."""
+    __slots__ = ()
+
+
+class ArrayObject(HeapObject):
+    """An array: its elements."""
+    __slots__ = ()
+
+
+class TypedArray:
+    """An array of a primitive type, stored unboxed.
+
+    The elements are machine values in a python array, next to a mask of
+    the elements that are null (a new array is all null, as for boxed
+    arrays). Indexing reads and writes null (None) through the mask, so
+    the VMs and compiled code index typed and boxed arrays alike. A value
+    the python array cannot hold as is (an int beyond 64 bits, or an int
+    stored in a double array) moves the elements to a list.
+
+    """
+    __slots__ = ('oid', 'values', 'nulls')
+    typecode = None              # python array type code
+    element = None               # python type of the elements
+
+    def __init__(self, oid, length):
+        self.oid = oid
+        self.values = array(self.typecode, [0]) * length
+        self.nulls = bytearray(b'\x01') * length    # 1 for a null element
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, index):
+        if self.nulls[index]:
+            return None
+        return self.values[index]
+
+    def __setitem__(self, index, value):
+        if value is None:
+            self.nulls[index] = 1
+            return
+        if type(value) is self.element:
+            try:
+                self.values[index] = value
+                self.nulls[index] = 0
+                return
+            except OverflowError:
+                pass
+        self.box()
+        self[index] = value
+
+    def box(self):
+        """Moves the elements to a list (of python values)."""
+        self.values = [self[i] for i in range(len(self))]
+        self.__class__ = BoxedArray
+
+    def __str__(self):
+        # how the object prints (as its object id)
+        return str(self.oid)
+
+    def __repr__(self):
+        values = [self[i] for i in range(len(self))]
+        return f'{type(self).__name__}({self.oid}, {values})'
+
+
+class IntArray(TypedArray):
+    """An array of (64-bit) ints."""
+    __slots__ = ()
+    typecode = 'q'
+    element = int
+
+
+class DoubleArray(TypedArray):
+    """An array of doubles."""
+    __slots__ = ()
+    typecode = 'd'
+    element = float
+
+
+class BoolArray(TypedArray):
+    """An array of bools (one byte each)."""
+    __slots__ = ()
+    typecode = 'b'
+    element = bool
+
+    def __getitem__(self, index):
+        if self.nulls[index]:
+            return None
+        return self.values[index] == 1
+
+
+class BoxedArray(TypedArray):
+    """A typed array whose elements were moved to a list."""
+    __slots__ = ()
+
+    def __setitem__(self, index, value):
+        if value is None:
+            self.nulls[index] = 1
+            return
+        self.values[index] = value
+        self.nulls[index] = 0
+
+
+# element type name -> unboxed array class
+TYPED_ARRAYS = {'int': IntArray, 'double': DoubleArray, 'bool': BoolArray}
+
+
+def new_array(oid, length, elem_type=None):
+    """Returns a new array of length null elements of the given type
+    (unboxed for primitive types other than string).
+
+    """
+    typed_array = TYPED_ARRAYS.get(elem_type)
+    if typed_array is None:
+        return ArrayObject(oid, (None,) * length)
+    return typed_array(oid, length)
+
+
+#----------------------------------------------------------------------
+# Bulk array built-ins (each works on a whole array at once, in C
+# loops over the unboxed values of typed arrays)
+#----------------------------------------------------------------------
+
+def check_array(xs, name):
+    """Raises an error if the built-in's array argument is null."""
+    if xs is None:
+        raise MyPLError(f'VM Error: {name}() array cannot be None type')
+
+
+def array_values(xs, name):
+    """Returns the values of an array without null elements."""
+    check_array(xs, name)
+    if isinstance(xs, TypedArray):
+        if 1 in xs.nulls:
+            raise MyPLError(f'VM Error: {name}() array cannot contain None type')
+        return xs.values
+    if None in xs:
+        raise MyPLError(f'VM Error: {name}() array cannot contain None type')
+    return xs
+
+
+def array_numbers(xs, name):
+    """Returns the values of an int or double array without null
+    elements.
+
+    """
+    values = array_values(xs, name)
+    if type(values) == array:
+        if values.typecode != 'b':
+            return values
+    elif all(type(x) == int or type(x) == float for x in values):
+        return values
+    raise MyPLError(f'VM Error: {name}() requires an int or double array')
+
+
+def array_fill(xs, value):
+    """Sets every element of the array to the value."""
+    check_array(xs, 'fill')
+    length = len(xs)
+    if type(xs) == ArrayObject:
+        xs[:] = (value,) * length
+    elif value is None:
+        xs.nulls = bytearray(b'\x01') * length
+    elif type(value) is xs.element:
+        try:
+            xs.values = array(xs.typecode, [value]) * length
+        except OverflowError:
+            xs.box()
+            array_fill(xs, value)
+            return
+        xs.nulls = bytearray(length)
+    elif type(xs) == BoxedArray:
+        xs.values = [value] * length
+        xs.nulls = bytearray(length)
+    else:
+        xs.box()
+        array_fill(xs, value)
+
+
+def array_copy(dst, src):
+    """Copies the elements of src into the first elements of dst."""
+    check_array(dst, 'copy')
+    check_array(src, 'copy')
+    length = len(src)
+    if len(dst) < length:
+        raise MyPLError('VM Error: copy() destination array is shorter than the source')
+    if type(dst) != type(src):
+        for i in range(length):
+            dst[i] = src[i]
+    elif type(dst) == ArrayObject:
+        dst[:length] = src
+    else:
+        dst.values[:length] = src.values
+        dst.nulls[:length] = src.nulls
+
+
+def array_total(xs):
+    """Returns the sum of the elements of an int or double array."""
+    values = array_numbers(xs, 'total')
+    return sum(values, 0.0 if type(xs) == DoubleArray else 0)
+
+
+def array_min(xs):
+    """Returns the smallest element of the array (null if empty)."""
+    return array_extreme(xs, 'min', min)
+
+
+def array_max(xs):
+    """Returns the largest element of the array (null if empty)."""
+    return array_extreme(xs, 'max', max)
+
+
+def array_extreme(xs, name, pick):
+    values = array_values(xs, name)
+    if not len(values):
+        return None
+    try:
+        result = pick(values)
+    except TypeError:
+        raise MyPLError(f'VM Error: {name}() requires comparable elements')
+    if type(xs) == BoolArray:
+        return result == 1
+    return result
+
+
+def array_scale(xs, factor):
+    """Multiplies every element of an int or double array by the
+    factor.
+
+    """
+    values = array_numbers(xs, 'scale')
+    if type(factor) != int and type(factor) != float:
+        raise MyPLError('VM Error: scale() factor must be an int or double')
+    scaled = [x * factor for x in values]
+    if type(xs) == ArrayObject:
+        xs[:] = scaled
+        return
+    if type(xs) == DoubleArray or (type(xs) == IntArray and type(factor) == int):
+        try:
+            xs.values = array(xs.typecode, scaled)
+            return
+        except OverflowError:
+            pass
+    # the elements no longer fit the typed storage
+    xs.values = scaled
+    xs.__class__ = BoxedArray
+
+
+# classes of the heap objects a collection counts
+HEAP_CLASSES = (HeapObject, TypedArray)
+
+
+@dataclass
+class CollectionStats:
+    """Counters of a heap collector."""
+    collections: int = 0        # all collections
+    full_collections: int = 0   # collections that traced the whole heap
+    cyclic: int = 0             # cyclic heap objects collected
+    pauses: list = field(default_factory=list)   # seconds, per collection
+
+
+class HeapCollector:
+    """Runs python's cycle collector on the VM's schedule during a run.
+
+    While a program runs, python's automatic collection (which counts
+    every container allocated) is switched off, and the VM calls collect()
+    after every threshold heap objects it allocates. A full collection is
+    gc.collect(). In incremental mode, a collection is gc.collect(0): it
+    only traces python's youngest generation (every container allocated
+    since the previous collection, not only heap objects), so its pause
+    is not bounded by the size of the MyPL heap. Every full_interval-th
+    collection is a full one (to reclaim older unreachable objects).
+
+    Acyclic objects are freed by reference counting as soon as they are
+    dropped, between collections, and are not counted.
+
+    """
+
+    def __init__(self, threshold=GC_THRESHOLD, incremental=False,
+                 full_interval=FULL_COLLECTION_INTERVAL):
+        """Creates a collector.
+
+        Args:
+            threshold -- Heap objects allocated between collections.
+            incremental -- If true, collect the youngest objects only,
+                           except for every full_interval-th collection.
+            full_interval -- Collections per full collection (in
+                             incremental mode).
+
+        """
+        self.threshold = threshold
+        self.incremental = incremental
+        self.full_interval = full_interval
+        self.stats = CollectionStats()
+        self.was_enabled = None      # python's collector state before start
+
+    def start(self):
+        """Switches off python's automatic collection (for a run)."""
+        if self.was_enabled == None:
+            self.was_enabled = gc.isenabled()
+            gc.disable()
+
+    def stop(self):
+        """Switches python's automatic collection back on (if it was)."""
+        if self.was_enabled == None:
+            return
+        if self.was_enabled:
+            gc.enable()
+        self.was_enabled = None
+
+    def collect(self):
+        """Runs a collection, recording its pause and the number of cyclic
+        heap objects it collected. The heap object classes only have a
+        finalizer (which counts the objects collected) during the
+        collection, so that freeing objects costs nothing extra between
+        collections.
+
+        """
+        stats = self.stats
+        full = (not self.incremental or
+                (stats.collections + 1) % self.full_interval == 0)
+        cyclic = 0
+        def count_cyclic(obj):
+            nonlocal cyclic
+            cyclic += 1
+        start = time.perf_counter()
+        for cls in HEAP_CLASSES:
+            cls.__del__ = count_cyclic
+        try:
+            if full:
+                gc.collect()
+            else:
+                gc.collect(0)
+        finally:
+            for cls in HEAP_CLASSES:
+                del cls.__del__
+        stats.pauses.append(time.perf_counter() - start)
+        stats.collections += 1
+        if full:
+            stats.full_collections += 1
+        stats.cyclic += cyclic
+
+    def gc_stats(self):
+        """Returns a report of the collections run."""
+        stats = self.stats
+        mode = 'incremental' if self.incremental else 'full'
+        s = f'GC stats (threshold {self.threshold}, {mode})\n'
+        s += f'  collections........: {stats.collections}'
+        s += f' ({stats.full_collections} full)\n'
+        s += f'  cyclic collected...: {stats.cyclic}\n'
+        if stats.pauses:
+            total = sum(stats.pauses) * 1000
+            s += f'  total pause........: {total:.2f}ms\n'
+            s += f'  mean pause.........: {total / len(stats.pauses):.3f}ms\n'
+            s += f'  max pause..........: {max(stats.pauses) * 1000:.3f}ms\n'
+        return s
@@ -0,0 +1,171 @@
+"""Program input and output of the MyPL VMs.
+
+The values a program writes are collected in an OutputBuffer and
+written to its sink (standard output by default) in large chunks: when
+the buffer is full, when a flush interval has passed (checked on each
+write), before the program reads input (so prompts are shown), and when
+the program ends, normally or with an error.
+
+The lines a program reads come from an InputBuffer, which reads its
+source (standard input by default) in large chunks and splits each
+chunk into lines as the program reaches it. A binary source is read
+with read1, which returns the data available (up to a chunk) instead of
+waiting for a whole chunk, so a program can answer each line written to
+a pipe as it arrives. A terminal is still read a line at a time.
+
+NAME: Alicia Domingo
+DATE: Spring 2024
+CLASS: CPSC 326
+
+"""
+
+import codecs
+import io
+import sys
+import time
+
+
+# number of characters buffered before they are written to the sink
+OUTPUT_BUFFER_SIZE = 1 << 16
+
+# number of characters (or bytes) read from the input source at a time
+INPUT_CHUNK_SIZE = 1 << 16
+
+
+class OutputBuffer:
+    """Buffered writer of a program's output."""
+
+    def __init__(self, sink=None, size=OUTPUT_BUFFER_SIZE, interval=None):
+        """Creates an output buffer.
+
+        Args:
+            sink -- The text or binary stream written to (standard output,
+                    as it is when flushed, if None).
+            size -- Number of characters buffered before a flush.
+            interval -- Seconds after which buffered output is flushed
+                        (on the next write), or None.
+
+        """
+        self.sink = sink
+        self.size = size
+        self.interval = interval
+        self.parts = []
+        self.length = 0
+        self.deadline = None if interval is None else time.monotonic() + interval
+
+    def write(self, text):
+        """Buffers the given text."""
+        self.parts.append(text)
+        self.length += len(text)
+        if self.length >= self.size or (self.deadline is not None and
+                                         time.monotonic() >= self.deadline):
+            self.flush()
+
+    def write_value(self, x):
+        """Buffers the given MyPL value as the program prints it."""
+        if x is None:
+            self.write('null')
+        elif x is True:
+            self.write('true')
+        elif x is False:
+            self.write('false')
+        else:
+            self.write(str(x))
+
+    def flush(self):
+        """Writes the buffered text to the sink."""
+        sink = sys.stdout if self.sink is None else self.sink
+        if self.parts:
+            text = ''.join(self.parts)
+            self.parts.clear()
+            self.length = 0
+            if isinstance(sink, (io.RawIOBase, io.BufferedIOBase)):
+                sink.write(text.encode('utf-8'))
+            else:
+                sink.write(text)
+        sink.flush()
+        if self.interval is not None:
+            self.deadline = time.monotonic() + self.interval
+
+
+class InputBuffer:
+    """Buffered reader of a program's input lines."""
+
+    def __init__(self, source=None, size=INPUT_CHUNK_SIZE):
+        """Creates an input buffer.
+
+        Args:
+            source -- The text or binary stream read from (the binary
+                      buffer of standard input, as it is when first
+                      read, if None).
+            size -- Number of characters (or bytes) read at a time.
+
+        """
+        self.source = source
+        self.size = size
+        self.lines = []         # lines of the last chunk read
+        self.next = 0           # index in lines of the next line to read
+        self.partial = ''       # text of the last chunk after its last newline
+        self.decoder = None     # utf-8 decoder (for binary sources)
+        self.done = False       # true once the source is exhausted
+
+    def read_line(self):
+        """Returns the next line (without its newline), or None at the
+        end of the input.
+
+        """
+        while self.next == len(self.lines):
+            if not self.fill():
+                return None
+        line = self.lines[self.next]
+        self.next += 1
+        return line
+
+    def read_lines(self, count=-1):
+        """Returns a list of the next count lines (all the remaining lines
+        if count is negative), fewer at the end of the input.
+
+        """
+        lines = []
+        while count < 0 or len(lines) < count:
+            if self.next == len(self.lines) and not self.fill():
+                break
+            end = len(self.lines)
+            if count >= 0:
+                end = min(end, self.next + count - len(lines))
+            lines += self.lines[self.next:end]
+            self.next = end
+        return lines
+
+    def fill(self):
+        """Splits the next chunk of the source into lines. Returns False
+        if the source has no more lines.
+
+        """
+        if self.done:
+            return False
+        if self.source is None:
+            self.source = getattr(sys.stdin, 'buffer', sys.stdin)
+        if self.source.isatty():
+            data = self.source.readline()
+        elif hasattr(self.source, 'read1'):
+            # whatever is available (a pipe may be written a line at a
+            # time), rather than waiting for a full chunk
+            data = self.source.read1(self.size)
+        else:
+            data = self.source.read(self.size)
+        chunk = data
+        if isinstance(data, bytes):
+            if self.decoder is None:
+                self.decoder = codecs.getincrementaldecoder('utf-8')()
+            chunk = self.decoder.decode(data, final=not data)
+        if not data:
+            self.done = True
+            self.lines = [self.partial] if self.partial else []
+            self.next = 0
+            self.partial = ''
+            return bool(self.lines)
+        self.lines = (self.partial + chunk).split('\n')
+        self.partial = self.lines.pop()
+        self.next = 0
+        return True
@@ -36,27 +36,106 @@ OpCode = Enum('OpCode', [
     'JMPF',    # pop x, if x is False jump to instruction offset A
 
     # functions
-    'CALL',    # call function A (pop and push arguments)
+    'CALL',    # call function A (arguments stay in place; A linked to template)
     'RET',     # return from current function
+    'TAILCALL',  # call function A reusing the current frame (CALL A; RET)
 
     # built ins
     'WRITE',   # pop x, print x to standard output
-    'READ',    # read standard input, push result onto stack
+    'READ',    # read standard input, push result onto stack (null at end of input)
+    'READLINES',  # pop int x, push oid of new string array of the next x input lines (all if x < 0)
     'LEN',     # pop string x, push len(x) if str, else push len(obj(x))
     'GETC',    # pop string x, pop int y, push x[y]
     'TOINT',   # pop x, push int(x)
     'TODBL',   # pop x, push double(x)
     'TOSTR',   # pop x, push str(x)
+    'BUILDER', # push a new (empty) string builder
 
     # heap
-    'ALLOCS',  # allocate struct object, push oid x
-    'SETF',    # pop value x, pop oid y, set obj(y)[A] = x
+    'ALLOCS',  # allocate struct object of type A, push oid x
+    'SETF',    # pop value x, pop oid y, set obj(y)[A] = x (A = field slot)
     'GETF',    # pop oid x, push obj(x)[A] onto stack
-    'ALLOCA',  # pop int x, allocate array object with x None values, push oid
+    'ALLOCA',  # pop int x, allocate array object (of element type A) with x None values, push oid
     'SETI',    # pop value x, pop index y, pop oid z, set array obj(z)[y] = x
     'GETI',    # pop index x, pop oid y, push obj(y)[x] onto stack
 
+    # bulk array built ins
+    'FILL',    # pop x, pop oid y, set every element of array obj(y) to x
+    'COPY',    # pop oid x, pop oid y, copy the elements of array obj(x) into obj(y)
+    'TOTAL',   # pop oid x, push the sum of the elements of array obj(x)
+    'MIN',     # pop oid x, push the smallest element of array obj(x)
+    'MAX',     # pop oid x, push the largest element of array obj(x)
+    'SCALE',   # pop x, pop oid y, multiply every element of array obj(y) by x
+
     # special
     'DUP',     # pop x, push x, push x
+    'NOP',     # do nothing
+
+    # superinstructions (fused instruction sequences)
+    'LOADLOAD_ADD',  # push (value at A[0] + value at A[1])
+    'LOAD_GETF',     # push obj(value at A[0])[A[1]]
+    'INCLOCAL',      # set value at A[0] to (value at A[0] + A[1])
+    'CMPLT_JMPF',    # pop x, pop y, if not (y < x) jump to offset A
+    'INITF',         # pop value x, set obj(y)[A] = x for oid y on top
+])
+
+
+# register-based VM instruction opcodes where d is the destination
+# register, r, s, and t are source registers, and f is a function or
+# field name (see mypl_reg_vm.py)
+RegOpCode = Enum('RegOpCode', [
+
+    # moves
+    'MOV',     # d = r
+
+    # arithmetic, relational, and logical operators
+    'ADD',     # d = r + s
+    'SUB',     # d = r - s
+    'MUL',     # d = r * s
+    'DIV',     # d = r // s or r / s
+    'CMPLT',   # d = r < s
+    'CMPLE',   # d = r <= s
+    'CMPEQ',   # d = r == s
+    'CMPNE',   # d = r != s
+    'AND',     # d = r and s
+    'OR',      # d = r or s
+    'NOT',     # d = not r
+
+    # jump and branch
+    'JMP',     # jump to instruction offset d
+    'JMPF',    # if r is False jump to instruction offset s (JMPF r s)
+
+    # functions
+    'CALL',    # d = f(registers in tuple t) (CALL d f t; f linked to template)
+    'RET',     # return r from current function
+
+    # built ins
+    'WRITE',   # print r to standard output
+    'READ',    # d = read standard input (null at end of input)
+    'READLINES',  # d = oid of new string array of the next r input lines (all if r < 0)
+    'LEN',     # d = len(r) if str, else len(obj(r))
+    'GETC',    # d = s[r] for int r and string s
+    'TOINT',   # d = int(r)
+    'TODBL',   # d = double(r)
+    'TOSTR',   # d = str(r)
+    'BUILDER', # d = new (empty) string builder
+
+    # heap
+    'ALLOCS',  # d = oid of new struct object of type s (ALLOCS d s)
+    'SETF',    # obj(r)[f] = s (SETF r f s)
+    'GETF',    # d = obj(r)[f] (GETF d r f)
+    'ALLOCA',  # d = oid of new array object (of element type t) with r null values
+    'SETI',    # array obj(r)[s] = t (SETI r s t)
+    'GETI',    # d = array obj(r)[s]
+
+    # bulk array built ins
+    'FILL',    # set every element of array obj(r) to s (FILL r s)
+    'COPY',    # copy the elements of array obj(s) into obj(r) (COPY r s)
+    'TOTAL',   # d = sum of the elements of array obj(r)
+    'MIN',     # d = smallest element of array obj(r)
+    'MAX',     # d = largest element of array obj(r)
+    'SCALE',   # multiply every element of array obj(r) by s (SCALE r s)
+
+    # special
     'NOP'      # do nothing
 ])
@@ -0,0 +1,364 @@
+"""Optimization passes used during MyPL code generation.
+
+NAME: Alicia Domingo
+DATE: Spring 2024
+CLASS: CPSC 326
+
+"""
+
+from src.mypl_token import *
+from src.mypl_ast import *
+from src.mypl_frame import *
+from src.mypl_opcode import *
+from src.mypl_semantic_checker import BUILT_INS
+
+
+# built-in functions without side effects (safe to evaluate once)
+PURE_BUILT_INS = ['itos', 'itod', 'dtos', 'dtoi', 'stoi', 'stod',
+                  'length', 'get']
+
+# built-in functions that write to the elements of their array argument
+HEAP_WRITING_BUILT_INS = ['fill', 'copy', 'scale']
+
+# built-in functions that write output or read input
+IO_BUILT_INS = ['print', 'input', 'input_lines']
+
+
+#----------------------------------------------------------------------
+# Built-in statements
+#----------------------------------------------------------------------
+
+def append_assign(call_expr):
+    """Returns the assignment s = s + x that a call append(s, x) to add
+    to a string builder (or string) variable s stands for.
+
+    """
+    target = call_expr.args[0].first
+    plus = Token(TokenType.PLUS, '+', call_expr.fun_name.line,
+                 call_expr.fun_name.column)
+    return AssignStmt(target.rvalue.path,
+                      Expr(False, target, plus, call_expr.args[1]))
+
+
+#----------------------------------------------------------------------
+# Loop-invariant code motion
+#----------------------------------------------------------------------
+
+class LoopEffects(Visitor):
+    """Visitor that collects the side effects of a loop: the variables
+    it writes (or declares), whether it writes to the heap (SETF, SETI,
+    or a bulk array built-in), whether it calls user-defined functions
+    (which may write to the heap), and whether it writes output or reads
+    input.
+
+    """
+
+    def __init__(self):
+        self.written = set()
+        self.heap_writes = False
+        self.calls = False
+        self.io = False
+
+    def visit_stmts(self, stmts):
+        for stmt in stmts:
+            stmt.accept(self)
+
+    def visit_return_stmt(self, return_stmt):
+        return_stmt.expr.accept(self)
+
+    def visit_var_decl(self, var_decl):
+        self.written.add(var_decl.var_def.var_name.lexeme)
+        if var_decl.expr != None:
+            var_decl.expr.accept(self)
+
+    def visit_assign_stmt(self, assign_stmt):
+        lvalue = assign_stmt.lvalue
+        if len(lvalue) == 1 and lvalue[0].array_expr == None:
+            self.written.add(lvalue[0].var_name.lexeme)
+        else:
+            self.heap_writes = True
+        for var_ref in lvalue:
+            if var_ref.array_expr != None:
+                var_ref.array_expr.accept(self)
+        assign_stmt.expr.accept(self)
+
+    def visit_while_stmt(self, while_stmt):
+        while_stmt.condition.accept(self)
+        self.visit_stmts(while_stmt.stmts)
+
+    def visit_for_stmt(self, for_stmt):
+        for_stmt.var_decl.accept(self)
+        for_stmt.condition.accept(self)
+        for_stmt.assign_stmt.accept(self)
+        self.visit_stmts(for_stmt.stmts)
+
+    def visit_if_stmt(self, if_stmt):
+        for basic_if in [if_stmt.if_part] + if_stmt.else_ifs:
+            basic_if.condition.accept(self)
+            self.visit_stmts(basic_if.stmts)
+        self.visit_stmts(if_stmt.else_stmts)
+
+    def visit_call_expr(self, call_expr):
+        if call_expr.fun_name.lexeme == 'append':
+            self.visit_assign_stmt(append_assign(call_expr))
+            return
+        if call_expr.fun_name.lexeme not in BUILT_INS:
+            self.calls = True
+        elif call_expr.fun_name.lexeme in HEAP_WRITING_BUILT_INS:
+            self.heap_writes = True
+        elif call_expr.fun_name.lexeme in IO_BUILT_INS:
+            self.io = True
+        for arg in call_expr.args:
+            arg.accept(self)
+
+    def visit_expr(self, expr):
+        expr.first.accept(self)
+        if expr.rest != None:
+            expr.rest.accept(self)
+
+    def visit_simple_term(self, simple_term):
+        simple_term.rvalue.accept(self)
+
+    def visit_complex_term(self, complex_term):
+        complex_term.expr.accept(self)
+
+    def visit_new_rvalue(self, new_rvalue):
+        if new_rvalue.array_expr != None:
+            new_rvalue.array_expr.accept(self)
+        for param in new_rvalue.struct_params or []:
+            param.accept(self)
+
+    def visit_var_rvalue(self, var_rvalue):
+        for var_ref in var_rvalue.path:
+            if var_ref.array_expr != None:
+                var_ref.array_expr.accept(self)
+
+
+def loop_effects(exprs, stmts):
+    """Returns the LoopEffects of a loop given its per-iteration
+    expressions (condition, step) and its body statements.
+
+    """
+    effects = LoopEffects()
+    for node in exprs:
+        node.accept(effects)
+    effects.visit_stmts(stmts)
+    return effects
+
+
+def is_invariant(node, effects):
+    """True if the expression (or term, or rvalue) node is pure and
+    computes the same value on every iteration of a loop with the given
+    effects.
+
+    """
+    if isinstance(node, Expr):
+        return (is_invariant(node.first, effects) and
+                (node.rest == None or is_invariant(node.rest, effects)))
+    if isinstance(node, ComplexTerm):
+        return is_invariant(node.expr, effects)
+    if isinstance(node, SimpleTerm):
+        return is_invariant(node.rvalue, effects)
+    if isinstance(node, SimpleRValue):
+        return True
+    if isinstance(node, CallExpr):
+        return (node.fun_name.lexeme in PURE_BUILT_INS and
+                all(is_invariant(arg, effects) for arg in node.args))
+    if isinstance(node, VarRValue):
+        if node.path[0].var_name.lexeme in effects.written:
+            return False
+        if reads_heap(node) and (effects.heap_writes or effects.calls):
+            return False
+        return all(is_invariant(var_ref.array_expr, effects)
+                   for var_ref in node.path if var_ref.array_expr != None)
+    # new structs and arrays must be allocated on each evaluation
+    return False
+
+
+def reads_heap(var_rvalue):
+    """True if the rvalue path loads a struct field or array element."""
+    if len(var_rvalue.path) > 1:
+        return True
+    return var_rvalue.path[0].array_expr != None
+
+
+def worth_hoisting(node):
+    """True if the expression does more work than a single PUSH or LOAD."""
+    if isinstance(node, Expr):
+        return node.op != None or node.not_op == True or worth_hoisting(node.first)
+    if isinstance(node, ComplexTerm):
+        return worth_hoisting(node.expr)
+    if isinstance(node, SimpleTerm):
+        rvalue = node.rvalue
+        return (isinstance(rvalue, CallExpr) or
+                (isinstance(rvalue, VarRValue) and reads_heap(rvalue)))
+    return False
+
+
+def find_invariants(expr, effects, found, hoisted):
+    """Adds to found the maximal loop-invariant subexpressions of expr
+    that are worth hoisting. Expressions already in the hoisted mapping
+    (by id) are left alone.
+
+    """
+    if id(expr) in hoisted:
+        return
+    if is_invariant(expr, effects) and worth_hoisting(expr):
+        found.append(expr)
+        return
+    term = expr.first
+    if isinstance(term, ComplexTerm):
+        find_invariants(term.expr, effects, found, hoisted)
+    elif isinstance(term.rvalue, CallExpr):
+        for arg in term.rvalue.args:
+            find_invariants(arg, effects, found, hoisted)
+    elif isinstance(term.rvalue, VarRValue):
+        for var_ref in term.rvalue.path:
+            if var_ref.array_expr != None:
+                find_invariants(var_ref.array_expr, effects, found, hoisted)
+    elif isinstance(term.rvalue, NewRValue):
+        new_rvalue = term.rvalue
+        if new_rvalue.array_expr != None:
+            find_invariants(new_rvalue.array_expr, effects, found, hoisted)
+        for param in new_rvalue.struct_params or []:
+            find_invariants(param, effects, found, hoisted)
+    if expr.rest != None:
+        find_invariants(expr.rest, effects, found, hoisted)
+
+
+def body_exprs(stmts):
+    """Returns the expressions of a loop body that are evaluated on every
+    iteration, i.e., those in top-level statements (and the conditions
+    of top-level if statements and loops) up to the first statement that
+    may return or has side effects (output, input, calls of user-defined
+    functions, or heap writes). A hoisted expression that raises an error
+    then cannot do so before an effect the loop would have had first.
+
+    """
+    exprs = []
+    for stmt in stmts:
+        if contains_return(stmt):
+            break
+        stmt_exprs = []
+        if isinstance(stmt, VarDecl):
+            if stmt.expr != None:
+                stmt_exprs.append(stmt.expr)
+        elif isinstance(stmt, AssignStmt):
+            stmt_exprs += [var_ref.array_expr for var_ref in stmt.lvalue
+                           if var_ref.array_expr != None]
+            stmt_exprs.append(stmt.expr)
+        elif isinstance(stmt, CallExpr):
+            stmt_exprs += stmt.args
+        elif isinstance(stmt, Expr):
+            stmt_exprs.append(stmt)
+        elif isinstance(stmt, (WhileStmt, ForStmt)):
+            stmt_exprs.append(stmt.condition)
+        elif isinstance(stmt, IfStmt):
+            stmt_exprs.append(stmt.if_part.condition)
+        # the statement's expressions run before its own effects
+        if has_side_effects(loop_effects(stmt_exprs, [])):
+            break
+        exprs += stmt_exprs
+        if has_side_effects(loop_effects([], [stmt])):
+            break
+    return exprs
+
+
+def has_side_effects(effects):
+    """True if the LoopEffects include effects other than writing local
+    variables.
+
+    """
+    return effects.heap_writes or effects.calls or effects.io
+
+
+def contains_return(stmt):
+    """True if the statement is or contains a return statement."""
+    if isinstance(stmt, ReturnStmt):
+        return True
+    if isinstance(stmt, (WhileStmt, ForStmt)):
+        return any(contains_return(s) for s in stmt.stmts)
+    if isinstance(stmt, IfStmt):
+        blocks = [if_stmt.stmts for if_stmt in [stmt.if_part] + stmt.else_ifs]
+        blocks.append(stmt.else_stmts)
+        return any(contains_return(s) for block in blocks for s in block)
+    return False
+
+
+#----------------------------------------------------------------------
+# Tail calls
+#----------------------------------------------------------------------
+
+def mark_tail_calls(template):
+    """Replaces each CALL immediately followed by a RET in the frame
+    template with a TAILCALL. The RET is kept so that jumps targeting it
+    (and instruction offsets) stay valid.
+
+    """
+    instrs = template.instructions
+    for i in range(len(instrs) - 1):
+        if instrs[i].opcode == OpCode.CALL and instrs[i+1].opcode == OpCode.RET:
+            instrs[i] = TAILCALL(instrs[i].operand)
+
+
+#----------------------------------------------------------------------
+# Superinstructions
+#----------------------------------------------------------------------
+
+# opcodes whose operand is an instruction offset
+JUMP_OPCODES = [OpCode.JMP, OpCode.JMPF, OpCode.CMPLT_JMPF]
+
+
+def match_superinstruction(instrs, i):
+    """Returns a (superinstruction, length) pair for the fusable sequence
+    starting at offset i, or (None, 1) if there is none.
+
+    """
+    ops = [instr.opcode for instr in instrs[i:i+4]]
+    args = [instr.operand for instr in instrs[i:i+4]]
+    if (ops == [OpCode.LOAD, OpCode.PUSH, OpCode.ADD, OpCode.STORE] and
+            args[0] == args[3] and type(args[1]) in [int, float]):
+        return INCLOCAL(args[0], args[1]), 4
+    if ops[:3] == [OpCode.LOAD, OpCode.LOAD, OpCode.ADD]:
+        return LOADLOAD_ADD(args[0], args[1]), 3
+    if ops[:2] == [OpCode.LOAD, OpCode.GETF]:
+        return LOAD_GETF(args[0], args[1]), 2
+    if ops[:2] == [OpCode.CMPLT, OpCode.JMPF]:
+        return CMPLT_JMPF(args[1]), 2
+    return None, 1
+
+
+def fuse_superinstructions(template):
+    """Replaces common instruction sequences in the frame template with
+    single superinstructions, and remaps jump offsets (and the line
+    table) accordingly. A sequence is only fused if no jump targets the
+    middle of it.
+
+    """
+    instrs = template.instructions
+    targets = set(instr.operand for instr in instrs
+                  if instr.opcode in JUMP_OPCODES)
+    fused = []
+    new_offsets = {}
+    i = 0
+    while i < len(instrs):
+        instr, length = match_superinstruction(instrs, i)
+        if instr == None or any(j in targets for j in range(i+1, i+length)):
+            instr, length = instrs[i], 1
+        # each fused instruction maps to its superinstruction
+        for j in range(i, i+length):
+            new_offsets[j] = len(fused)
+        fused.append(instr)
+        i += length
+    new_offsets[len(instrs)] = len(fused)
+    for instr in fused:
+        if instr.opcode in JUMP_OPCODES:
+            instr.operand = new_offsets.get(instr.operand, instr.operand)
+    template.instructions = fused
+    template.line_table.remap(new_offsets)
+
+
+def optimize_template(template):
+    """Runs the instruction-level optimizations on a frame template."""
+    mark_tail_calls(template)
+    fuse_superinstructions(template)
@@ -0,0 +1,165 @@
+"""Per-phase timing of running a MyPL program (--time-phases).
+
+A PhaseTimer times each phase of a run (lexing, parsing, checking,
+code generation, and execution) as the phases happen: its wall-clock
+and CPU time, the peak memory traced by tracemalloc while it ran, and
+the number of items it produced or ran (tokens, AST nodes, VM
+instructions, and executed instructions).
+
+The parser normally reads tokens from the lexer as it goes. To time the
+two apart, a timed run lexes the whole program first (into a
+TokenList). Executed instructions are counted by a tracer (on the stack
+and tiered VMs only), so a timed run interprets with the VM's traced
+loop, and tracemalloc slows down allocations: compare the phases of a
+timed run with each other rather than with untimed runs.
+
+NAME: Alicia Domingo
+DATE: Spring 2024
+CLASS: CPSC 326
+
+"""
+
+import json
+import time
+import tracemalloc
+from dataclasses import dataclass, fields, is_dataclass
+
+from src.mypl_token import *
+from src.mypl_trace import *
+
+
+@dataclass
+class PhaseStats:
+    """Timing of one phase."""
+    name: str
+    unit: str = ''               # what the phase's items are
+    count: int = None            # items produced or run (if known)
+    wall: float = 0.0            # seconds
+    cpu: float = 0.0             # seconds of CPU time (of the process)
+    peak_memory: int = 0         # bytes traced at the phase's peak
+
+
+class PhaseTimer:
+    """Times the phases of a run, one after the other."""
+
+    def __init__(self, enabled=True):
+        """Creates a phase timer. A disabled timer ignores its calls."""
+        self.enabled = enabled
+        self.phases = []             # list of PhaseStats (in order)
+        self.current = None          # (stats, wall start, cpu start)
+        self.tracing = False         # true if the timer started tracemalloc
+
+    def begin(self, name, unit=''):
+        """Starts timing the named phase (after the previous one ends)."""
+        if not self.enabled:
+            return
+        if self.current != None:
+            self.end()
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.tracing = True
+        tracemalloc.reset_peak()
+        stats = PhaseStats(name, unit)
+        self.phases.append(stats)
+        self.current = (stats, time.perf_counter(), time.process_time())
+
+    def end(self, count=None):
+        """Ends the current phase. The count of its items is given as a
+        function, only called (outside the phase's time) if the timer is
+        enabled.
+
+        """
+        if not self.enabled or self.current == None:
+            return
+        stats, wall, cpu = self.current
+        stats.wall = time.perf_counter() - wall
+        stats.cpu = time.process_time() - cpu
+        stats.peak_memory = tracemalloc.get_traced_memory()[1]
+        self.current = None
+        if count != None:
+            stats.count = count()
+
+    def stop(self):
+        """Ends the current phase (if a phase failed) and stops tracing
+        memory.
+
+        """
+        if not self.enabled:
+            return
+        self.end()
+        if self.tracing:
+            tracemalloc.stop()
+            self.tracing = False
+
+    def report(self):
+        """Returns the text report of the phases."""
+        s = (f'{"phase":10} {"wall(ms)":>10} {"cpu(ms)":>10}'
+             f' {"peak(KB)":>10} {"count":>12}\n')
+        for p in self.phases + [self.total()]:
+            count = '' if p.count == None else f'{p.count:>12} {p.unit}'
+            s += (f'{p.name:10} {p.wall * 1000:>10.2f} {p.cpu * 1000:>10.2f}'
+                  f' {p.peak_memory / 1024:>10.1f} {count}'.rstrip() + '\n')
+        return s
+
+    def total(self):
+        """Returns the stats of all the phases together."""
+        return PhaseStats('total', wall=sum(p.wall for p in self.phases),
+                          cpu=sum(p.cpu for p in self.phases),
+                          peak_memory=max([p.peak_memory for p in self.phases],
+                                          default=0))
+
+    def to_json(self):
+        """Returns the phases as a JSON document."""
+        return json.dumps({
+            'phases': [vars(p) for p in self.phases],
+            'total': vars(self.total()),
+        }, indent=2)
+
+
+class TokenList:
+    """A lexer's tokens, read in advance and handed out again (in the
+    lexer's place) to the parser.
+
+    """
+
+    def __init__(self, lexer):
+        """Reads all the tokens of the lexer (up to its EOS token)."""
+        self.tokens = [lexer.next_token()]
+        while self.tokens[-1].token_type != TokenType.EOS:
+            self.tokens.append(lexer.next_token())
+        self.next = 0
+
+    def next_token(self):
+        """Return the next token (the EOS token once they run out)."""
+        token = self.tokens[self.next]
+        if self.next < len(self.tokens) - 1:
+            self.next += 1
+        return token
+
+
+class InstructionCounter(Tracer):
+    """Tracer that counts the instructions the VM runs."""
+
+    def __init__(self):
+        self.count = 0
+
+    def on_instruction(self, vm, frame, pc, instr):
+        self.count += 1
+
+
+def count_nodes(node):
+    """Returns the number of AST nodes in the tree rooted at node."""
+    if isinstance(node, list):
+        return sum(count_nodes(child) for child in node)
+    if not is_dataclass(node) or isinstance(node, Token):
+        return 0
+    return 1 + sum(count_nodes(getattr(node, f.name)) for f in fields(node))
+
+
+def instruction_count(vm):
+    """Returns the number of instructions generated for a VM (or for the
+    stack VM a program was compiled from).
+
+    """
+    vm = getattr(vm, 'vm', vm)
+    return sum(len(t.instructions) for t in vm.frame_templates.values())
@@ -0,0 +1,239 @@
+"""Profilers of the MyPL stack VM.
+
+The Profiler is a tracer (see mypl_trace.py) that counts how many
+times each instruction of each function runs. Per-function (exclusive)
+and per-opcode counts are summed from these counts once the program
+ends. Calls and returns are timed: a function's inclusive count and
+wall time cover each outermost call of it (so recursive calls are not
+counted twice), including the functions it calls.
+
+The SamplingProfiler instead leaves the VM's loop alone: a timer signal
+interrupts the program at a fixed interval (of CPU time), and the
+signal handler records the functions on the VM's call stack. Its
+samples are written as collapsed stacks (one "main;f;g count" line per
+distinct stack, each function labeled with the file:line it was at),
+the input format of flame graph tools.
+
+NAME: Alicia Domingo
+DATE: Spring 2024
+CLASS: CPSC 326
+
+"""
+
+import json
+import signal
+import time
+from dataclasses import dataclass
+
+from src.mypl_error import *
+from src.mypl_trace import *
+
+
+# number of instructions listed in the report's hottest instructions
+HOTTEST_COUNT = 10
+
+# seconds (of CPU time) between the sampling profiler's samples
+SAMPLE_INTERVAL = 0.001
+
+
+@dataclass
+class FunctionProfile:
+    """Profile of one function."""
+    function_name: str
+    calls: int = 0
+    exclusive: int = 0           # instructions run in the function itself
+    inclusive: int = 0           # ... and in the functions it calls
+    time: float = 0.0            # wall time of its (outermost) calls
+
+
+class Profiler(Tracer):
+    """Tracer that counts instructions, calls, and time per function."""
+
+    def __init__(self):
+        self.counts = []             # template id -> runs of each pc
+        self.total = 0               # instructions run so far
+        self.activations = []        # (template, frame, total, start time)
+        self.depths = []             # template id -> active calls
+        self.functions = {}          # function name -> FunctionProfile
+        self.templates = []
+        self.start_time = None
+        self.elapsed = 0.0
+        self.vm = None
+
+    def start(self, vm):
+        """Starts profiling the program loaded in the VM (from its main
+        function, which the VM is about to run).
+
+        """
+        vm.link()
+        self.templates = vm.templates
+        self.vm = vm
+        self.counts = [[0] * len(t.instructions) for t in self.templates]
+        self.depths = [0] * len(self.templates)
+        self.functions = {t.function_name: FunctionProfile(t.function_name)
+                          for t in self.templates}
+        self.start_time = time.perf_counter()
+        self.begin(vm.frame_templates['main'], None)
+
+    def stop(self):
+        """Stops profiling (ending the calls that have not returned)."""
+        while self.activations:
+            self.end(self.activations.pop())
+        self.elapsed = time.perf_counter() - self.start_time
+        for template in self.templates:
+            profile = self.functions[template.function_name]
+            profile.exclusive = sum(self.counts[template.template_id])
+
+    def begin(self, template, frame):
+        self.functions[template.function_name].calls += 1
+        self.depths[template.template_id] += 1
+        self.activations.append((template, frame, self.total,
+                                 time.perf_counter()))
+
+    def end(self, activation):
+        template, frame, total, start = activation
+        self.depths[template.template_id] -= 1
+        if self.depths[template.template_id] == 0:
+            profile = self.functions[template.function_name]
+            profile.inclusive += self.total - total
+            profile.time += time.perf_counter() - start
+
+    #----------------------------------------------------------------------
+    # Hooks
+    #----------------------------------------------------------------------
+
+    def on_instruction(self, vm, frame, pc, instr):
+        self.counts[frame.template.template_id][pc] += 1
+        self.total += 1
+
+    def on_call(self, vm, frame):
+        # a tail call ends the call of the frame it reuses
+        if self.activations and self.activations[-1][1] is frame:
+            self.end(self.activations.pop())
+        self.begin(frame.template, frame)
+
+    def on_return(self, vm, frame, value):
+        self.end(self.activations.pop())
+
+    #----------------------------------------------------------------------
+    # Reports
+    #----------------------------------------------------------------------
+
+    def opcode_counts(self):
+        """Returns a dictionary of opcode name -> instructions run (most
+        run first).
+
+        """
+        counts = {}
+        for template in self.templates:
+            runs = self.counts[template.template_id]
+            for pc, instr in enumerate(template.instructions):
+                if runs[pc]:
+                    name = instr.opcode.name
+                    counts[name] = counts.get(name, 0) + runs[pc]
+        return dict(sorted(counts.items(), key=lambda item: -item[1]))
+
+    def hottest(self, count=HOTTEST_COUNT):
+        """Returns the most run instructions, as (runs, function name, pc,
+        instruction) tuples.
+
+        """
+        instrs = []
+        for template in self.templates:
+            runs = self.counts[template.template_id]
+            for pc, instr in enumerate(template.instructions):
+                if runs[pc]:
+                    instrs.append((runs[pc], template.function_name, pc, instr))
+        instrs.sort(key=lambda item: -item[0])
+        return instrs[:count]
+
+    def location(self, function_name, pc):
+        """Returns the source location (file:line) of an instruction."""
+        return self.vm.location(self.vm.frame_templates[function_name], pc)
+
+    def profile(self):
+        """Returns the function profiles (most inclusive instructions
+        first).
+
+        """
+        return sorted(self.functions.values(),
+                      key=lambda p: (-p.inclusive, -p.exclusive))
+
+    def report(self):
+        """Returns the text report of the profile."""
+        total = max(self.total, 1)
+        s = (f'Profile ({self.total} instructions,'
+             f' {self.elapsed * 1000:.2f}ms)\n')
+        s += (f'{"function":20} {"calls":>8} {"exclusive":>12} {"%":>6}'
+              f' {"inclusive":>12} {"%":>6} {"time(ms)":>10}\n')
+        for p in self.profile():
+            s += (f'{p.function_name:20} {p.calls:>8} {p.exclusive:>12}'
+                  f' {p.exclusive * 100 / total:>6.1f} {p.inclusive:>12}'
+                  f' {p.inclusive * 100 / total:>6.1f}'
+                  f' {p.time * 1000:>10.2f}\n')
+        s += 'Opcodes\n'
+        for name, count in self.opcode_counts().items():
+            s += f'  {name:18} {count:>12} {count * 100 / total:>6.1f}\n'
+        s += 'Hottest instructions\n'
+        for runs, function_name, pc, instr in self.hottest():
+            s += (f'  {function_name:18} {pc:>5}  {str(instr):28} {runs:>12}'
+                  f'  {self.location(function_name, pc)}\n')
+        return s
+
+    def to_json(self):
+        """Returns the profile as a JSON document."""
+        return json.dumps({
+            'instructions': self.total,
+            'time': self.elapsed,
+            'functions': [vars(p) for p in self.profile()],
+            'opcodes': self.opcode_counts(),
+            'hottest': [{'function': function_name, 'pc': pc,
+                         'instruction': str(instr), 'count': runs,
+                         'location': self.location(function_name, pc)}
+                        for runs, function_name, pc, instr in self.hottest()],
+        }, indent=2)
+
+
+class SamplingProfiler:
+    """Profiler that samples the VM's call stack on a timer signal."""
+
+    def __init__(self, vm, interval=SAMPLE_INTERVAL):
+        """Creates a sampling profiler of the program run by the VM.
+
+        Args:
+            vm -- The stack VM the program runs on.
+            interval -- Seconds of CPU time between samples.
+
+        """
+        self.vm = vm
+        self.interval = interval
+        self.stacks = {}             # function names (tuple) -> samples
+        self.samples = 0
+        self.previous_handler = None
+
+    def start(self):
+        """Starts sampling (until stop is called)."""
+        if not hasattr(signal, 'setitimer'):
+            raise MyPLError('Sampling requires interval timer signals')
+        self.previous_handler = signal.signal(signal.SIGPROF, self.sample)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+
+    def stop(self):
+        """Stops sampling."""
+        signal.setitimer(signal.ITIMER_PROF, 0)
+        signal.signal(signal.SIGPROF, self.previous_handler)
+
+    def sample(self, signum=None, python_frame=None):
+        """Records the VM's current call stack (the signal handler)."""
+        vm = self.vm
+        stack = tuple(f'{frame.template.function_name}'
+                      f' ({vm.location(frame.template, frame.pc - 1)})'
+                      for frame in vm.call_stack)
+        if stack:
+            self.stacks[stack] = self.stacks.get(stack, 0) + 1
+            self.samples += 1
+
+    def collapsed(self):
+        """Returns the samples as collapsed stacks."""
+        return ''.join(f'{";".join(stack)} {count}\n'
+                       for stack, count in sorted(self.stacks.items()))
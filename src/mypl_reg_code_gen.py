@@ -0,0 +1,402 @@
+"""IR code generator for converting MyPL to register VM instructions.
+
+NAME: Alicia Domingo
+DATE: Spring 2024
+CLASS: CPSC 326
+
+"""
+
+from src.mypl_token import *
+from src.mypl_ast import *
+from src.mypl_var_table import *
+from src.mypl_opcode import *
+from src.mypl_reg_vm import *
+from src.mypl_optimizer import append_assign
+from src.mypl_struct_layout import *
+
+
+class Reg:
+    """Placeholder for a constant or temp register whose index is only
+    known once the whole function has been generated."""
+
+    def __init__(self, value=None):
+        self.index = None
+        self.value = value
+
+    def __repr__(self):
+        return f'r{self.index}'
+
+
+class RegCodeGenerator (Visitor):
+
+    def __init__(self, vm):
+        """Creates a new register code generator given a register VM.
+
+        Args:
+            vm -- The target register vm.
+        """
+        # the vm to add frames to
+        self.vm = vm
+        # the current frame template being generated
+        self.curr_template = None
+        # for var -> register mappings wrt to environments
+        self.var_table = VarTable()
+        # struct name -> StructDef for struct field info
+        self.struct_defs = {}
+        # id of struct field VarRef -> field slot index
+        self.field_offsets = {}
+        # per function: number of local registers, constants, and temps
+        self.num_locals = 0
+        self.constants = {}
+        self.temps = []
+        self.next_temp = 0
+        # register holding the value of the last visited expression
+        self.result = None
+
+
+    # Helper Functions
+
+    def add_instr(self, opcode, a=None, b=None, c=None):
+        """Adds an instruction to the current template and returns it."""
+        instr = RegInstr(opcode, a, b, c)
+        self.curr_template.instructions.append(instr)
+        return instr
+
+    def next_offset(self):
+        """Returns the offset of the next instruction to be added."""
+        return len(self.curr_template.instructions)
+
+    def constant(self, value):
+        """Returns the register holding the given constant value."""
+        key = (type(value), value)
+        if key not in self.constants:
+            self.constants[key] = Reg(value)
+        return self.constants[key]
+
+    def new_temp(self):
+        """Returns an unused temp register for the current statement."""
+        if self.next_temp == len(self.temps):
+            self.temps.append(Reg())
+        reg = self.temps[self.next_temp]
+        self.next_temp += 1
+        return reg
+
+    def add_var(self, var_name):
+        """Adds a local variable, returning its register."""
+        self.var_table.add(var_name)
+        self.num_locals = max(self.num_locals, self.var_table.total_vars)
+        return self.var_table.get(var_name)
+
+    def visit_stmts(self, stmts):
+        """Visits a block of statements (in a new environment). Temps are
+        only live within a single statement, so they are reused."""
+        self.var_table.push_environment()
+        for stmt in stmts:
+            self.next_temp = 0
+            stmt.accept(self)
+        self.var_table.pop_environment()
+
+    def store(self, dst, src):
+        """Moves src into dst, retargeting the previous instruction if it
+        just computed src into a temp."""
+        instrs = self.curr_template.instructions
+        if (isinstance(src, Reg) and src.value == None and instrs and
+                instrs[-1].opcode in DST_OPCODES and instrs[-1].a is src):
+            instrs[-1].a = dst
+        else:
+            self.add_instr(RegOpCode.MOV, dst, src)
+
+    def finish_template(self):
+        """Assigns register indexes (locals, then constants, then temps)
+        and builds the template's initial register file."""
+        registers = [None] * self.num_locals
+        for reg in self.constants.values():
+            reg.index = len(registers)
+            registers.append(reg.value)
+        for reg in self.temps:
+            reg.index = len(registers)
+            registers.append(None)
+        for instr in self.curr_template.instructions:
+            instr.a = self.resolve(instr.a)
+            instr.b = self.resolve(instr.b)
+            instr.c = self.resolve(instr.c)
+        self.curr_template.registers = registers
+
+    def resolve(self, operand):
+        """Replaces Reg placeholders in an operand by their indexes."""
+        if isinstance(operand, Reg):
+            return operand.index
+        if isinstance(operand, tuple):
+            return tuple(self.resolve(x) for x in operand)
+        return operand
+
+
+    # Visitor Functions
+
+    def visit_program(self, program):
+        self.field_offsets = field_offsets(program)
+        self.vm.struct_layouts = struct_layouts(program.struct_defs)
+        for struct_def in program.struct_defs:
+            struct_def.accept(self)
+        for fun_def in program.fun_defs:
+            fun_def.accept(self)
+        # resolve calls (and report undefined functions) before running
+        self.vm.link()
+
+    def visit_struct_def(self, struct_def):
+        # remember the struct def for later
+        self.struct_defs[struct_def.struct_name.lexeme] = struct_def
+
+    def visit_fun_def(self, fun_def):
+        name = fun_def.fun_name.lexeme
+        self.curr_template = RegFrameTemplate(name, len(fun_def.params))
+        self.var_table = VarTable()
+        self.num_locals = 0
+        self.constants = {}
+        self.temps = []
+        self.var_table.push_environment()
+        # params are the first locals (set by CALL)
+        for param in fun_def.params:
+            self.add_var(param.var_name.lexeme)
+        self.visit_stmts(fun_def.stmts)
+        self.var_table.pop_environment()
+        # implicit return at the end of every function
+        self.add_instr(RegOpCode.RET, self.constant(None))
+        self.finish_template()
+        self.vm.add_frame_template(self.curr_template)
+
+    def visit_return_stmt(self, return_stmt):
+        return_stmt.expr.accept(self)
+        self.add_instr(RegOpCode.RET, self.result)
+
+    def visit_var_decl(self, var_decl):
+        dst = self.add_var(var_decl.var_def.var_name.lexeme)
+        if var_decl.expr == None:
+            self.add_instr(RegOpCode.MOV, dst, self.constant(None))
+        else:
+            var_decl.expr.accept(self)
+            self.store(dst, self.result)
+
+    def visit_assign_stmt(self, assign_stmt):
+        lvalue = assign_stmt.lvalue
+        # simple variable assignment
+        if len(lvalue) == 1 and lvalue[0].array_expr == None:
+            assign_stmt.expr.accept(self)
+            self.store(self.var_table.get(lvalue[0].var_name.lexeme), self.result)
+            return
+        # find the object (struct or array) being assigned into
+        obj = self.var_table.get(lvalue[0].var_name.lexeme)
+        for i in range(len(lvalue)):
+            var_ref = lvalue[i]
+            if i > 0 and (i < len(lvalue) - 1 or var_ref.array_expr != None):
+                dst = self.new_temp()
+                self.add_instr(RegOpCode.GETF, dst, obj, self.field_offsets[id(var_ref)])
+                obj = dst
+            if var_ref.array_expr != None and i < len(lvalue) - 1:
+                var_ref.array_expr.accept(self)
+                dst = self.new_temp()
+                self.add_instr(RegOpCode.GETI, dst, obj, self.result)
+                obj = dst
+        last = lvalue[-1]
+        if last.array_expr != None:
+            last.array_expr.accept(self)
+            index = self.result
+            assign_stmt.expr.accept(self)
+            self.add_instr(RegOpCode.SETI, obj, index, self.result)
+        else:
+            assign_stmt.expr.accept(self)
+            self.add_instr(RegOpCode.SETF, obj, self.field_offsets[id(last)], self.result)
+
+    def visit_while_stmt(self, while_stmt):
+        start = self.next_offset()
+        while_stmt.condition.accept(self)
+        jmp_end = self.add_instr(RegOpCode.JMPF, self.result, -1)
+        self.visit_stmts(while_stmt.stmts)
+        self.add_instr(RegOpCode.JMP, start)
+        jmp_end.b = self.next_offset()
+
+    def visit_for_stmt(self, for_stmt):
+        self.var_table.push_environment()
+        for_stmt.var_decl.accept(self)
+        start = self.next_offset()
+        self.next_temp = 0
+        for_stmt.condition.accept(self)
+        jmp_end = self.add_instr(RegOpCode.JMPF, self.result, -1)
+        self.visit_stmts(for_stmt.stmts)
+        self.next_temp = 0
+        for_stmt.assign_stmt.accept(self)
+        self.add_instr(RegOpCode.JMP, start)
+        jmp_end.b = self.next_offset()
+        self.var_table.pop_environment()
+
+    def visit_if_stmt(self, if_stmt):
+        jmp_ends = []
+        for basic_if in [if_stmt.if_part] + if_stmt.else_ifs:
+            self.next_temp = 0
+            basic_if.condition.accept(self)
+            jmp_next = self.add_instr(RegOpCode.JMPF, self.result, -1)
+            self.visit_stmts(basic_if.stmts)
+            jmp_ends.append(self.add_instr(RegOpCode.JMP, -1))
+            jmp_next.b = self.next_offset()
+        self.visit_stmts(if_stmt.else_stmts)
+        for jmp_end in jmp_ends:
+            jmp_end.a = self.next_offset()
+
+    def visit_call_expr(self, call_expr):
+        fun_name = call_expr.fun_name.lexeme
+        conversions = {'stoi': RegOpCode.TOINT, 'dtoi': RegOpCode.TOINT,
+                       'itos': RegOpCode.TOSTR, 'dtos': RegOpCode.TOSTR,
+                       'stod': RegOpCode.TODBL, 'itod': RegOpCode.TODBL}
+        if fun_name == 'print':
+            call_expr.args[0].accept(self)
+            self.add_instr(RegOpCode.WRITE, self.result)
+        elif fun_name in conversions:
+            call_expr.args[0].accept(self)
+            dst = self.new_temp()
+            self.add_instr(conversions[fun_name], dst, self.result)
+            self.result = dst
+        elif fun_name == 'length':
+            call_expr.args[0].accept(self)
+            # the empty string literal is pushed as " " (see CodeGenerator)
+            if self.result is self.constants.get((str, ' ')):
+                self.result = self.constant('')
+            dst = self.new_temp()
+            self.add_instr(RegOpCode.LEN, dst, self.result)
+            self.result = dst
+        elif fun_name == 'get':
+            call_expr.args[0].accept(self)
+            index = self.result
+            call_expr.args[1].accept(self)
+            dst = self.new_temp()
+            self.add_instr(RegOpCode.GETC, dst, index, self.result)
+            self.result = dst
+        elif fun_name == 'input':
+            dst = self.new_temp()
+            self.add_instr(RegOpCode.READ, dst)
+            self.result = dst
+        elif fun_name == 'input_lines':
+            if call_expr.args:
+                call_expr.args[0].accept(self)
+                count = self.result
+            else:
+                count = self.constant(-1)
+            dst = self.new_temp()
+            self.add_instr(RegOpCode.READLINES, dst, count)
+            self.result = dst
+        elif fun_name == 'builder':
+            dst = self.new_temp()
+            self.add_instr(RegOpCode.BUILDER, dst)
+            self.result = dst
+        elif fun_name == 'append':
+            append_assign(call_expr).accept(self)
+        elif fun_name in ['fill', 'copy', 'scale']:
+            call_expr.args[0].accept(self)
+            array = self.result
+            call_expr.args[1].accept(self)
+            self.add_instr(RegOpCode[fun_name.upper()], array, self.result)
+        elif fun_name in ['total', 'min', 'max']:
+            call_expr.args[0].accept(self)
+            dst = self.new_temp()
+            self.add_instr(RegOpCode[fun_name.upper()], dst, self.result)
+            self.result = dst
+        else:
+            args = []
+            for arg in call_expr.args:
+                arg.accept(self)
+                args.append(self.result)
+            dst = self.new_temp()
+            self.add_instr(RegOpCode.CALL, dst, fun_name, tuple(args))
+            self.result = dst
+
+    def visit_expr(self, expr):
+        ops = {'+': RegOpCode.ADD, '-': RegOpCode.SUB, '*': RegOpCode.MUL,
+               '/': RegOpCode.DIV, 'and': RegOpCode.AND, 'or': RegOpCode.OR,
+               '<': RegOpCode.CMPLT, '>': RegOpCode.CMPLT,
+               '<=': RegOpCode.CMPLE, '>=': RegOpCode.CMPLE,
+               '==': RegOpCode.CMPEQ, '!=': RegOpCode.CMPNE}
+        # same evaluation order (and operand swap for > and >=) as the
+        # stack code generator
+        if expr.op != None and expr.op.lexeme in ['>', '>=']:
+            expr.rest.accept(self)
+            left = self.result
+            expr.first.accept(self)
+            right = self.result
+        else:
+            expr.first.accept(self)
+            left = self.result
+            if expr.not_op == True:
+                dst = self.new_temp()
+                self.add_instr(RegOpCode.NOT, dst, left)
+                left = dst
+            if expr.rest == None:
+                self.result = left
+                return
+            expr.rest.accept(self)
+            right = self.result
+        dst = self.new_temp()
+        self.add_instr(ops[expr.op.lexeme], dst, left, right)
+        self.result = dst
+
+    def visit_data_type(self, data_type):
+        # nothing to do here
+        pass
+
+    def visit_var_def(self, var_def):
+        # nothing to do here
+        pass
+
+    def visit_simple_term(self, simple_term):
+        simple_term.rvalue.accept(self)
+
+    def visit_complex_term(self, complex_term):
+        complex_term.expr.accept(self)
+
+    def visit_simple_rvalue(self, simple_rvalue):
+        val = simple_rvalue.value.lexeme
+        token_type = simple_rvalue.value.token_type
+        if token_type == TokenType.INT_VAL:
+            self.result = self.constant(int(val))
+        elif token_type == TokenType.DOUBLE_VAL:
+            self.result = self.constant(float(val))
+        elif token_type == TokenType.STRING_VAL:
+            if len(val) == 0:
+                val = ' '
+            val = val.replace('\\n', '\n').replace('\\t', '\t')
+            self.result = self.constant(val)
+        elif val == 'true':
+            self.result = self.constant(True)
+        elif val == 'false':
+            self.result = self.constant(False)
+        else:
+            self.result = self.constant(None)
+
+    def visit_new_rvalue(self, new_rvalue):
+        if new_rvalue.array_expr == None:
+            obj = self.new_temp()
+            self.add_instr(RegOpCode.ALLOCS, obj, new_rvalue.type_name.lexeme)
+            # field i is in slot i
+            for i in range(len(new_rvalue.struct_params)):
+                new_rvalue.struct_params[i].accept(self)
+                self.add_instr(RegOpCode.SETF, obj, i, self.result)
+            self.result = obj
+        else:
+            new_rvalue.array_expr.accept(self)
+            dst = self.new_temp()
+            self.add_instr(RegOpCode.ALLOCA, dst, self.result,
+                           new_rvalue.type_name.lexeme)
+            self.result = dst
+
+    def visit_var_rvalue(self, var_rvalue):
+        obj = self.var_table.get(var_rvalue.path[0].var_name.lexeme)
+        for i in range(len(var_rvalue.path)):
+            var_ref = var_rvalue.path[i]
+            if i > 0:
+                dst = self.new_temp()
+                self.add_instr(RegOpCode.GETF, dst, obj, self.field_offsets[id(var_ref)])
+                obj = dst
+            if var_ref.array_expr != None:
+                var_ref.array_expr.accept(self)
+                dst = self.new_temp()
+                self.add_instr(RegOpCode.GETI, dst, obj, self.result)
+                obj = dst
+        self.result = obj
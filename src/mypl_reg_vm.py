@@ -0,0 +1,434 @@
+"""Register-based MyPL Virtual Machine.
+
+An alternative to the stack VM (mypl_vm.py). Each frame has a register
+file holding its local variables, the constants used by the function,
+and the temporaries used for intermediate results. Instructions name
+registers by index instead of pushing and popping an operand stack.
+
+NAME: Alicia Domingo
+DATE: Spring 2024
+CLASS: CPSC 326
+
+"""
+
+from dataclasses import dataclass, field
+from typing import Any
+from src.mypl_error import *
+from src.mypl_opcode import *
+from src.mypl_heap import *
+from src.mypl_rope import *
+from src.mypl_io import *
+
+
+@dataclass
+class RegFrameTemplate:
+    """A register VM function-call frame template (type)."""
+    function_name: str
+    arg_count: int
+    instructions: list['RegInstr'] = field(default_factory=list)
+    # initial register file: locals and temps are None, constants set
+    registers: list[Any] = field(default_factory=list)
+    # dense index of the template (assigned by RegVM.link)
+    template_id: int = -1
+
+    def __repr__(self):
+        # shown as the operand of linked CALL instructions
+        return self.function_name
+
+
+@dataclass
+class RegInstr:
+    """A register VM instruction (see RegOpCode for operand meanings)."""
+    opcode: RegOpCode
+    a: Any = None
+    b: Any = None
+    c: Any = None
+    comment: str = ''
+
+    def __repr__(self):
+        operands = [x for x in [self.a, self.b, self.c] if x != None]
+        s = f'{self.opcode}(' + ', '.join(str(x) for x in operands) + ')'
+        s += f'  // {self.comment}' if self.comment else ''
+        return s
+
+
+# opcodes whose first operand is the destination register
+DST_OPCODES = [RegOpCode.MOV, RegOpCode.ADD, RegOpCode.SUB, RegOpCode.MUL,
+               RegOpCode.DIV, RegOpCode.CMPLT, RegOpCode.CMPLE,
+               RegOpCode.CMPEQ, RegOpCode.CMPNE, RegOpCode.AND, RegOpCode.OR,
+               RegOpCode.NOT, RegOpCode.CALL, RegOpCode.READ,
+               RegOpCode.READLINES, RegOpCode.LEN,
+               RegOpCode.GETC, RegOpCode.TOINT, RegOpCode.TODBL,
+               RegOpCode.TOSTR, RegOpCode.BUILDER, RegOpCode.ALLOCS, RegOpCode.GETF,
+               RegOpCode.ALLOCA, RegOpCode.GETI, RegOpCode.TOTAL,
+               RegOpCode.MIN, RegOpCode.MAX]
+
+
+class RegVM:
+
+    def __init__(self, output=None, input=None):
+        """Creates a register VM.
+
+        Args:
+            output -- The text or binary stream the program writes to
+                      (standard output if None).
+            input -- The text or binary stream the program reads from
+                     (standard input if None).
+
+        """
+        self.next_obj_id = 2024      # next available object id (int)
+        self.output = OutputBuffer(output)
+        self.input = InputBuffer(input)
+        self.struct_layouts = {}     # struct name -> field names (by slot)
+        self.frame_templates = {}    # function name -> RegFrameTemplate
+        self.templates = []          # template id -> RegFrameTemplate
+        self.call_stack = []         # (template, registers, pc, dst) list
+
+    def __repr__(self):
+        """Returns a string representation of struct layouts and frame
+        templates."""
+        s = ''
+        for name, fields in self.struct_layouts.items():
+            s += f'\nStruct {name} ({", ".join(fields)})\n'
+        for name, template in self.frame_templates.items():
+            s += f'\nFrame {name} ({len(template.registers)} registers)\n'
+            for i in range(len(template.instructions)):
+                s += f'  {i}: {template.instructions[i]}\n'
+        return s
+
+    def add_frame_template(self, template):
+        """Add the new frame info to the VM.
+
+        Args:
+            template -- The frame info to add.
+
+        """
+        self.frame_templates[template.function_name] = template
+
+    def link(self):
+        """Gives each frame template a dense integer id and resolves the
+        function names of CALL instructions to their frame templates.
+        Linking an already linked program has no effect.
+
+        """
+        self.templates = list(self.frame_templates.values())
+        for i in range(len(self.templates)):
+            self.templates[i].template_id = i
+        for template in self.templates:
+            instrs = template.instructions
+            for pc in range(len(instrs)):
+                instr = instrs[pc]
+                if instr.opcode != RegOpCode.CALL or type(instr.b) != str:
+                    continue
+                if not instr.b in self.frame_templates:
+                    name = template.function_name
+                    self.error(f'Undefined function "{instr.b}"'
+                               f' (in {name} at {pc}: {instr})')
+                instr.b = self.frame_templates[instr.b]
+
+    def error(self, msg, template=None, pc=None):
+        """Report a VM error."""
+        if not template:
+            raise VMError(msg)
+        instr = template.instructions[pc - 1]
+        name = template.function_name
+        msg += f' (in {name} at {pc - 1}: {instr})'
+        raise VMError(msg)
+
+    def is_int_or_float(self, s):
+        """True if the string contains only digits and at most one '.'"""
+        if not s:
+            return False
+        if all(char.isdigit() or char == '.' for char in s):
+            return s.count('.') <= 1
+        return False
+
+    #----------------------------------------------------------------------
+    # RUN FUNCTION
+    #----------------------------------------------------------------------
+
+    def run(self):
+        """Run the virtual machine."""
+        if not 'main' in self.frame_templates:
+            self.error('No "main" function')
+        self.link()
+        try:
+            self.execute()
+        finally:
+            self.output.flush()
+
+    def execute(self):
+        """Runs the instructions of the main function (and of the
+        functions it calls) until it returns.
+
+        """
+        template = self.frame_templates['main']
+        instrs = template.instructions
+        regs = list(template.registers)
+        pc = 0
+
+        # run loop (continue until main returns)
+        while True:
+            instr = instrs[pc]
+            pc += 1
+            opcode = instr.opcode
+
+            #------------------------------------------------------------
+            # Moves and Operations
+            #------------------------------------------------------------
+
+            if opcode == RegOpCode.MOV:
+                regs[instr.a] = regs[instr.b]
+
+            elif opcode == RegOpCode.ADD:
+                y = regs[instr.b]
+                x = regs[instr.c]
+                if x == None or y == None:
+                    raise MyPLError('VM Error: Stack must contain two valid ints or doubles')
+                regs[instr.a] = concat(y, x) if type(y) is str else y + x
+
+            elif opcode == RegOpCode.SUB:
+                y = regs[instr.b]
+                x = regs[instr.c]
+                if x == None or y == None:
+                    raise MyPLError('VM Error: Stack must contain two valid ints or doubles')
+                regs[instr.a] = y - x
+
+            elif opcode == RegOpCode.MUL:
+                y = regs[instr.b]
+                x = regs[instr.c]
+                if x == None or y == None:
+                    raise MyPLError('VM Error: Stack must contain two valid ints or doubles')
+                regs[instr.a] = y * x
+
+            elif opcode == RegOpCode.DIV:
+                y = regs[instr.b]
+                x = regs[instr.c]
+                if x == None or y == None:
+                    raise MyPLError('VM Error: Stack must contain two valid ints or doubles')
+                elif x == 0:
+                    raise MyPLError('VM Error: Division by 0 error')
+                if type(x) == int and type(y) == int:
+                    regs[instr.a] = int(y / x)
+                else:
+                    regs[instr.a] = y / x
+
+            elif opcode == RegOpCode.CMPLT:
+                y = regs[instr.b]
+                x = regs[instr.c]
+                if x == None or y == None:
+                    raise MyPLError('VM Error: Cannot contain None type')
+                regs[instr.a] = y < x
+
+            elif opcode == RegOpCode.CMPLE:
+                y = regs[instr.b]
+                x = regs[instr.c]
+                if x == None or y == None:
+                    raise MyPLError('VM Error: Cannot contain None type')
+                regs[instr.a] = y <= x
+
+            elif opcode == RegOpCode.CMPEQ:
+                regs[instr.a] = regs[instr.b] == regs[instr.c]
+
+            elif opcode == RegOpCode.CMPNE:
+                regs[instr.a] = regs[instr.b] != regs[instr.c]
+
+            elif opcode == RegOpCode.AND:
+                y = regs[instr.b]
+                x = regs[instr.c]
+                if x == None or y == None:
+                    raise MyPLError('VM Error: Cannot contain None type')
+                regs[instr.a] = y and x
+
+            elif opcode == RegOpCode.OR:
+                y = regs[instr.b]
+                x = regs[instr.c]
+                if x == None or y == None:
+                    raise MyPLError('VM Error: Cannot contain None type')
+                regs[instr.a] = y or x
+
+            elif opcode == RegOpCode.NOT:
+                x = regs[instr.b]
+                if x == None:
+                    raise MyPLError('VM Error: Cannot contain None type')
+                regs[instr.a] = not x
+
+            #------------------------------------------------------------
+            # Branching
+            #------------------------------------------------------------
+
+            elif opcode == RegOpCode.JMP:
+                pc = instr.a
+
+            elif opcode == RegOpCode.JMPF:
+                x = regs[instr.a]
+                if not x:
+                    pc = instr.b
+
+            #------------------------------------------------------------
+            # Functions
+            #------------------------------------------------------------
+
+            elif opcode == RegOpCode.CALL:
+                # operand linked to the callee's frame template
+                callee = instr.b
+                new_regs = list(callee.registers)
+                i = 0
+                for arg in instr.c:
+                    new_regs[i] = regs[arg]
+                    i += 1
+                self.call_stack.append((template, regs, pc, instr.a))
+                template = callee
+                instrs = callee.instructions
+                regs = new_regs
+                pc = 0
+
+            elif opcode == RegOpCode.RET:
+                return_val = regs[instr.a]
+                if not self.call_stack:
+                    return
+                template, regs, pc, dst = self.call_stack.pop()
+                instrs = template.instructions
+                regs[dst] = return_val
+
+            #------------------------------------------------------------
+            # Built-In Functions
+            #------------------------------------------------------------
+
+            elif opcode == RegOpCode.WRITE:
+                self.output.write_value(regs[instr.a])
+
+            elif opcode == RegOpCode.READ:
+                self.output.flush()
+                regs[instr.a] = self.input.read_line()
+
+            elif opcode == RegOpCode.READLINES:
+                count = regs[instr.b]
+                if count == None:
+                    raise MyPLError('VM Error: Cannot be None type')
+                oid = self.next_obj_id
+                self.next_obj_id += 1
+                self.output.flush()
+                regs[instr.a] = ArrayObject(oid, self.input.read_lines(count))
+
+            elif opcode == RegOpCode.LEN:
+                x = regs[instr.b]
+                if x is None:
+                    raise MyPLError('VM Error: Cannot get length of None type')
+                # a string or an array
+                regs[instr.a] = len(x)
+
+            elif opcode == RegOpCode.GETC:
+                y = regs[instr.b]
+                x = regs[instr.c]
+                if x == None or y == None:
+                    raise MyPLError('VM Error: Cannot be None type')
+                if y > len(x) - 1 or y < 0:
+                    raise MyPLError('VM Error: Index too large for string')
+                regs[instr.a] = x[y]
+
+            elif opcode == RegOpCode.TOINT:
+                x = flat(regs[instr.b])
+                if x == None:
+                    raise MyPLError('VM Error: Cannot be a None type')
+                if type(x) == float or (type(x) == str and x.isdigit()):
+                    regs[instr.a] = int(x)
+                else:
+                    raise MyPLError('VM Error: TOINT opcode requires a string, int, or double')
+
+            elif opcode == RegOpCode.TODBL:
+                x = flat(regs[instr.b])
+                if x == None:
+                    raise MyPLError('VM Error: Cannot be a None type')
+                if type(x) == str and not self.is_int_or_float(x):
+                    raise MyPLError('VM Error: String must just contain a int or double')
+                regs[instr.a] = float(x)
+
+            elif opcode == RegOpCode.TOSTR:
+                x = regs[instr.b]
+                if x == None:
+                    raise MyPLError('VM Error: Cannot be a None type')
+                regs[instr.a] = str(x)
+
+            elif opcode == RegOpCode.BUILDER:
+                regs[instr.a] = Rope()
+
+            #------------------------------------------------------------
+            # Heap
+            #------------------------------------------------------------
+
+            elif opcode == RegOpCode.ALLOCS:
+                oid = self.next_obj_id
+                self.next_obj_id += 1
+                fields = self.struct_layouts[instr.b]
+                regs[instr.a] = StructObject(oid, (None,) * len(fields))
+
+            elif opcode == RegOpCode.SETF:
+                obj = regs[instr.a]
+                if obj is None:
+                    raise MyPLError('VM Error: oid is None. You cannot have any None types')
+                obj[instr.b] = regs[instr.c]
+
+            elif opcode == RegOpCode.GETF:
+                obj = regs[instr.b]
+                if obj is None:
+                    raise MyPLError('VM Error: oid cannot be None type')
+                regs[instr.a] = obj[instr.c]
+
+            elif opcode == RegOpCode.ALLOCA:
+                array_length = regs[instr.b]
+                if array_length == None or array_length < 0:
+                    raise MyPLError('VM Error: Array length cannot be None type or less than 0')
+                oid = self.next_obj_id
+                self.next_obj_id += 1
+                regs[instr.a] = new_array(oid, array_length, instr.c)
+
+            elif opcode == RegOpCode.SETI:
+                array = regs[instr.a]
+                index = regs[instr.b]
+                if index is None or array is None:
+                    raise MyPLError('VM Error: Index cannot be None Type')
+                if len(array) <= index or index < 0:
+                    raise MyPLError('VM Error: Index is too large for allocated array')
+                array[index] = regs[instr.c]
+
+            elif opcode == RegOpCode.GETI:
+                array = regs[instr.b]
+                index = regs[instr.c]
+                if index is None or array is None:
+                    raise MyPLError('VM Error: Index or oid cannot be None')
+                if len(array) <= index or index < 0:
+                    raise MyPLError('VM Error: Index too large for allocated array')
+                regs[instr.a] = array[index]
+
+            #------------------------------------------------------------
+            # Bulk array built ins
+            #------------------------------------------------------------
+
+            elif opcode == RegOpCode.FILL:
+                array_fill(regs[instr.a], regs[instr.b])
+
+            elif opcode == RegOpCode.COPY:
+                array_copy(regs[instr.a], regs[instr.b])
+
+            elif opcode == RegOpCode.TOTAL:
+                regs[instr.a] = array_total(regs[instr.b])
+
+            elif opcode == RegOpCode.MIN:
+                regs[instr.a] = array_min(regs[instr.b])
+
+            elif opcode == RegOpCode.MAX:
+                regs[instr.a] = array_max(regs[instr.b])
+
+            elif opcode == RegOpCode.SCALE:
+                array_scale(regs[instr.a], regs[instr.b])
+
+            #------------------------------------------------------------
+            # Special
+            #------------------------------------------------------------
+
+            elif opcode == RegOpCode.NOP:
+                pass
+
+            else:
+                self.error(f'unsupported operation {instr}', template, pc)
@@ -0,0 +1,121 @@
+"""Ropes: MyPL strings built up by concatenation.
+
+Adding to a python string copies the whole string, so a MyPL program
+that builds its output with s = s + x in a loop takes quadratic time in
+the length of the string. Once a string is long enough, the VMs instead
+concatenate onto a Rope, which only records the parts added to it (in a
+list shared by the ropes built from each other), and joins them into a
+single string the first time its contents are needed (to write it, to
+get one of its characters, or to compare it).
+
+Only the newest rope built from a parts list appends to it. Adding to an
+older rope (s = t + x after t = s + y) copies the parts it covers first,
+so every rope still reads the same string it was built as.
+
+NAME: Alicia Domingo
+DATE: Spring 2024
+CLASS: CPSC 326
+
+"""
+
+
+# string length from which concatenating onto a string builds a rope
+ROPE_THRESHOLD = 1024
+
+
+class Rope:
+    """A string kept as the list of its parts until it is read."""
+
+    __slots__ = ('parts', 'count', 'length')
+
+    def __init__(self, parts=None, count=0, length=0):
+        """Creates a rope of the first count strings in parts."""
+        self.parts = [] if parts is None else parts
+        self.count = count
+        self.length = length
+
+    def flatten(self):
+        """Returns the rope's string, joining its parts (once)."""
+        if self.count == 1:
+            return self.parts[0]
+        flat = ''.join(self.parts[:self.count])
+        # later ropes built from this one start from the joined string
+        self.parts = [flat]
+        self.count = 1
+        return flat
+
+    def __add__(self, other):
+        if type(other) is Rope:
+            other = other.flatten()
+        elif type(other) is not str:
+            return NotImplemented
+        parts = self.parts
+        if len(parts) != self.count:
+            parts = parts[:self.count]
+        parts.append(other)
+        return Rope(parts, self.count + 1, self.length + len(other))
+
+    def __radd__(self, other):
+        if type(other) is not str:
+            return NotImplemented
+        return Rope([other], 1, len(other)) + self
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, index):
+        return self.flatten()[index]
+
+    def __str__(self):
+        return self.flatten()
+
+    def __repr__(self):
+        return repr(self.flatten())
+
+    def __hash__(self):
+        return hash(self.flatten())
+
+    def __eq__(self, other):
+        other = text(other)
+        return NotImplemented if other is None else self.flatten() == other
+
+    def __ne__(self, other):
+        other = text(other)
+        return NotImplemented if other is None else self.flatten() != other
+
+    def __lt__(self, other):
+        other = text(other)
+        return NotImplemented if other is None else self.flatten() < other
+
+    def __le__(self, other):
+        other = text(other)
+        return NotImplemented if other is None else self.flatten() <= other
+
+    def __gt__(self, other):
+        other = text(other)
+        return NotImplemented if other is None else self.flatten() > other
+
+    def __ge__(self, other):
+        other = text(other)
+        return NotImplemented if other is None else self.flatten() >= other
+
+
+def text(value):
+    """Returns the string of a string or rope value, and otherwise None."""
+    if type(value) is str:
+        return value
+    if type(value) is Rope:
+        return value.flatten()
+    return None
+
+
+def concat(y, x):
+    """Returns y + x, as a rope if y is a string long enough for one."""
+    if type(y) is str and len(y) >= ROPE_THRESHOLD:
+        return Rope([y], 1, len(y)) + x
+    return y + x
+
+
+def flat(value):
+    """Returns a rope value as its string, and any other value as is."""
+    return value.flatten() if type(value) is Rope else value
@@ -30,7 +30,11 @@ from src.mypl_symbol_table import SymbolTable
 
 BASE_TYPES = ['int', 'double', 'bool', 'string']
 BUILT_INS = ['print', 'input', 'itos', 'itod', 'dtos', 'dtoi', 'stoi', 'stod',
-             'length', 'get']
+             'length', 'get', 'fill', 'copy', 'total', 'min', 'max', 'scale',
+             'builder', 'append', 'input_lines']
+
+# built-in functions on whole arrays
+ARRAY_BUILT_INS = ['fill', 'copy', 'total', 'min', 'max', 'scale']
 
 TYPE_DIC = {TokenType.INT_TYPE: TokenType.INT_VAL,
                     TokenType.DOUBLE_TYPE: TokenType.DOUBLE_VAL,
@@ -45,6 +49,8 @@ class SemanticChecker(Visitor):
         self.functions = {}
         self.symbol_table = SymbolTable()
         self.curr_type = None
+        # variable name -> DataType (of the current function's variables)
+        self.var_types = {}
 
 
     # Helper Functions
@@ -73,6 +79,65 @@ class SemanticChecker(Visitor):
         return None
 
 
+    def arg_type(self, expr):
+        """Returns the DataType of a built-in function argument, or None if
+        it is not known (an operator expression or null).
+        """
+        if expr.op != None or expr.not_op:
+            return None
+        if type(expr.first) == ComplexTerm:
+            return self.arg_type(expr.first.expr)
+        rvalue = expr.first.rvalue
+        if type(rvalue) == SimpleRValue:
+            if rvalue.value.token_type == TokenType.NULL_VAL:
+                return None
+            rvalue.accept(self)
+            return self.curr_type
+        if type(rvalue) == NewRValue:
+            return DataType(rvalue.array_expr != None, rvalue.type_name)
+        if type(rvalue) == CallExpr:
+            fun = self.functions.get(rvalue.fun_name.lexeme)
+            return None if fun == None else fun.return_type
+        # variable path: each field is looked up in the previous struct
+        data_type = self.var_types.get(rvalue.path[0].var_name.lexeme)
+        for i, var_ref in enumerate(rvalue.path):
+            if i > 0:
+                struct_def = self.structs.get(data_type.type_name.lexeme)
+                if struct_def == None:
+                    return None
+                field_name = var_ref.var_name.lexeme
+                data_type = self.get_field_type(struct_def, field_name)
+            if data_type == None:
+                return None
+            if var_ref.array_expr != None:
+                data_type = DataType(False, data_type.type_name)
+        return data_type
+
+    def check_array_built_in(self, call_expr):
+        """Checks the argument types of a bulk array built-in function
+        (where they are known).
+        """
+        name = call_expr.fun_name.lexeme
+        array_type = self.arg_type(call_expr.args[0])
+        if array_type == None:
+            return
+        if not array_type.is_array:
+            raise MyPLError(f'Static Error: {name}() first argument requires an array')
+        elem = array_type.type_name.lexeme
+        if name == 'scale' and not elem in ['int', 'double']:
+            raise MyPLError('Static Error: scale() requires an int or double array')
+        if not name in ['fill', 'scale', 'copy']:
+            return
+        arg = self.arg_type(call_expr.args[1])
+        if arg == None:
+            return
+        if name == 'copy':
+            if not (arg.is_array and arg.type_name.lexeme == elem):
+                raise MyPLError('Static Error: copy() requires arrays of the same type')
+        elif arg.is_array or arg.type_name.lexeme != elem:
+            raise MyPLError(f'Static Error: {name}() value requires the array type {elem}')
+
+
     # Visitor Functions
 
     def visit_program(self, program):
@@ -118,6 +183,7 @@ class SemanticChecker(Visitor):
             
         
     def visit_fun_def(self, fun_def):
+        self.var_types = {}
         self.symbol_table.push_environment()
         # getting type for function
         fun_def.return_type.accept(self)
@@ -153,6 +219,9 @@ class SemanticChecker(Visitor):
                 elif fun_name in ['dtoi', 'length']:
                     if not var_return == 'int':
                         raise MyPLError(f'Static Error: {fun_name}() requires a int return')
+                elif fun_name == 'input_lines':
+                    if not (var_return == 'string' and var_decl.var_def.data_type.is_array):
+                        raise MyPLError(f'Static Error: {fun_name}() requires an array string return')
             # checking if var declaration assing are the right type
             elif type(var_decl.expr.first.rvalue) == SimpleRValue:
                 if not var_decl.expr.first.rvalue.value.token_type == TokenType.NULL_VAL:
@@ -203,23 +272,35 @@ class SemanticChecker(Visitor):
     
     def visit_call_expr(self, call_expr):
         # built in functions checking amount of arguments
-        if call_expr.fun_name.lexeme in ['itos', 'dtos', 'itod', 'dtoi', 'print', 'length']:
+        if call_expr.fun_name.lexeme in ['itos', 'dtos', 'itod', 'dtoi', 'print', 'length',
+                                         'total', 'min', 'max']:
             if not len(call_expr.args) == 1:
                 raise MyPLError(f"Static Error: {call_expr.fun_name.lexeme}() requires one argument")
-        elif call_expr.fun_name.lexeme == 'get':
+        elif call_expr.fun_name.lexeme in ['get', 'fill', 'copy', 'scale', 'append']:
             if not len(call_expr.args) == 2:
                 raise MyPLError(f"Static Error: {call_expr.fun_name.lexeme}() requires two arguments")
-        elif call_expr.fun_name.lexeme == 'input':
+        elif call_expr.fun_name.lexeme in ['input', 'builder']:
             if not len(call_expr.args) == 0:
                 raise MyPLError(f"Static Error: {call_expr.fun_name.lexeme}() requires 0 arguments")
+        elif call_expr.fun_name.lexeme == 'input_lines':
+            if len(call_expr.args) > 1:
+                raise MyPLError(f"Static Error: {call_expr.fun_name.lexeme}() requires at most one argument")
             
+        if call_expr.fun_name.lexeme in ARRAY_BUILT_INS:
+            self.check_array_built_in(call_expr)
 
         # checking valid argument
         if len(call_expr.args) > 0:
+            # append() adds to the string in a variable (or field)
+            if call_expr.fun_name.lexeme == 'append':
+                first = call_expr.args[0]
+                if not (type(first.first) == SimpleTerm and type(first.first.rvalue) == VarRValue
+                        and first.op == None and not first.not_op):
+                    raise MyPLError('Static Error: append() first argument requires a string variable')
             if type(call_expr.args[0].first.rvalue) == SimpleRValue:
                 # for single argument built in functions
                 token = call_expr.args[0].first.rvalue.value.token_type
-                if call_expr.fun_name.lexeme in ['itos', 'itod']:
+                if call_expr.fun_name.lexeme in ['itos', 'itod', 'input_lines']:
                     if not token == TokenType.INT_VAL:
                         raise MyPLError(f'Static Error: {call_expr.fun_name.lexeme}() argument requires a int type')
                 elif call_expr.fun_name.lexeme in ['dtos', 'dtoi']:
@@ -270,6 +351,7 @@ class SemanticChecker(Visitor):
         # checking function with two params with same name
         if not self.symbol_table.exists_in_curr_env(name_param):
             self.symbol_table.add(name_param, type_data)
+            self.var_types[name_param] = var_def.data_type
         else:
             raise MyPLError(f'Static Error: {name_param} is already currently defined in file')
             
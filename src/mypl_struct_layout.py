@@ -0,0 +1,188 @@
+"""Struct layout resolution for MyPL code generation.
+
+Each struct's fields are assigned fixed slot indices (in declaration
+order), so that struct objects can be stored as fixed-length lists and
+field accesses compiled to indexed loads and stores.
+
+NAME: Alicia Domingo
+DATE: Spring 2024
+CLASS: CPSC 326
+
+"""
+
+from src.mypl_ast import *
+from src.mypl_error import *
+from src.mypl_symbol_table import *
+
+
+def struct_layouts(struct_defs):
+    """Returns the layout table (struct name -> list of field names) of
+    the given struct definitions.
+
+    """
+    layouts = {}
+    for struct_def in struct_defs:
+        fields = [field.var_name.lexeme for field in struct_def.fields]
+        layouts[struct_def.struct_name.lexeme] = fields
+    return layouts
+
+
+class FieldResolver(Visitor):
+    """Visitor that computes, for each struct field reference (a VarRef
+    after the first in a path), the slot index of the field within the
+    struct type it is accessed on. The static type of each path prefix is
+    found from the declared types of variables and struct fields.
+
+    """
+
+    def __init__(self):
+        # id of VarRef -> field slot index
+        self.offsets = {}
+        # struct name -> (field name -> (slot index, VarDef))
+        self.fields = {}
+        # field name -> set of slot indexes (over all structs)
+        self.field_slots = {}
+        # var name -> (type name, is array) wrt environments
+        self.symbol_table = SymbolTable()
+
+
+    def declare(self, var_def):
+        """Adds a variable (and its declared type) to the environment."""
+        data_type = var_def.data_type
+        type_info = (data_type.type_name.lexeme, data_type.is_array)
+        self.symbol_table.add(var_def.var_name.lexeme, type_info)
+
+
+    def field_offset(self, type_info, field_name):
+        """Returns the slot index of the field accessed on a value of the
+        given (possibly unknown) type. If the type is unknown, the field
+        must have the same slot in every struct that declares it.
+
+        """
+        if type_info != None and not type_info[1]:
+            fields = self.fields.get(type_info[0], {})
+            if field_name in fields:
+                return fields[field_name][0]
+        slots = self.field_slots.get(field_name, set())
+        if len(slots) != 1:
+            raise StaticError(f'cannot resolve struct field "{field_name}"')
+        return next(iter(slots))
+
+
+    def field_type(self, type_info, field_name):
+        """Returns the (type name, is array) of a field, or None."""
+        if type_info == None or type_info[1]:
+            return None
+        fields = self.fields.get(type_info[0], {})
+        if not field_name in fields:
+            return None
+        data_type = fields[field_name][1].data_type
+        return (data_type.type_name.lexeme, data_type.is_array)
+
+
+    def resolve_path(self, path):
+        """Records the field offsets of a variable path."""
+        type_info = self.symbol_table.get(path[0].var_name.lexeme)
+        for i in range(len(path)):
+            var_ref = path[i]
+            if i > 0:
+                field_name = var_ref.var_name.lexeme
+                self.offsets[id(var_ref)] = self.field_offset(type_info, field_name)
+                type_info = self.field_type(type_info, field_name)
+            if var_ref.array_expr != None:
+                var_ref.array_expr.accept(self)
+                if type_info != None:
+                    # array element type
+                    type_info = (type_info[0], False)
+
+
+    def visit_stmts(self, stmts):
+        self.symbol_table.push_environment()
+        for stmt in stmts:
+            stmt.accept(self)
+        self.symbol_table.pop_environment()
+
+    def visit_program(self, program):
+        for struct_def in program.struct_defs:
+            struct_def.accept(self)
+        for fun_def in program.fun_defs:
+            fun_def.accept(self)
+
+    def visit_struct_def(self, struct_def):
+        fields = {}
+        for i in range(len(struct_def.fields)):
+            field = struct_def.fields[i]
+            fields[field.var_name.lexeme] = (i, field)
+            self.field_slots.setdefault(field.var_name.lexeme, set()).add(i)
+        self.fields[struct_def.struct_name.lexeme] = fields
+
+    def visit_fun_def(self, fun_def):
+        self.symbol_table.push_environment()
+        for param in fun_def.params:
+            self.declare(param)
+        self.visit_stmts(fun_def.stmts)
+        self.symbol_table.pop_environment()
+
+    def visit_return_stmt(self, return_stmt):
+        return_stmt.expr.accept(self)
+
+    def visit_var_decl(self, var_decl):
+        if var_decl.expr != None:
+            var_decl.expr.accept(self)
+        self.declare(var_decl.var_def)
+
+    def visit_assign_stmt(self, assign_stmt):
+        self.resolve_path(assign_stmt.lvalue)
+        assign_stmt.expr.accept(self)
+
+    def visit_while_stmt(self, while_stmt):
+        while_stmt.condition.accept(self)
+        self.visit_stmts(while_stmt.stmts)
+
+    def visit_for_stmt(self, for_stmt):
+        self.symbol_table.push_environment()
+        for_stmt.var_decl.accept(self)
+        for_stmt.condition.accept(self)
+        for_stmt.assign_stmt.accept(self)
+        self.visit_stmts(for_stmt.stmts)
+        self.symbol_table.pop_environment()
+
+    def visit_if_stmt(self, if_stmt):
+        for basic_if in [if_stmt.if_part] + if_stmt.else_ifs:
+            basic_if.condition.accept(self)
+            self.visit_stmts(basic_if.stmts)
+        self.visit_stmts(if_stmt.else_stmts)
+
+    def visit_call_expr(self, call_expr):
+        for arg in call_expr.args:
+            arg.accept(self)
+
+    def visit_expr(self, expr):
+        expr.first.accept(self)
+        if expr.rest != None:
+            expr.rest.accept(self)
+
+    def visit_simple_term(self, simple_term):
+        simple_term.rvalue.accept(self)
+
+    def visit_complex_term(self, complex_term):
+        complex_term.expr.accept(self)
+
+    def visit_new_rvalue(self, new_rvalue):
+        if new_rvalue.array_expr != None:
+            new_rvalue.array_expr.accept(self)
+        for param in new_rvalue.struct_params or []:
+            param.accept(self)
+
+    def visit_var_rvalue(self, var_rvalue):
+        self.resolve_path(var_rvalue.path)
+
+
+def field_offsets(program):
+    """Returns the mapping from id of each struct field VarRef in the
+    program to the field's slot index.
+
+    """
+    resolver = FieldResolver()
+    program.accept(resolver)
+    return resolver.offsets
@@ -0,0 +1,322 @@
+"""Tiered execution for the MyPL stack VM.
+
+Programs start out interpreted. The VM counts the calls of each frame
+template and the backward jumps (loop iterations) taken in it, and once
+either count crosses its threshold the template is promoted: compiled to
+a python function (see mypl_compiler). A promoted template is run as
+python from its next call on, and a hot loop also switches to python
+on-stack, at its loop header. Compiled and interpreted functions call
+each other freely, so only the hot templates are ever compiled.
+
+Compiled calls (and interpreted calls made from compiled code) nest on
+python's stack, unlike interpreted calls. Recursive templates are
+compiled to count their active calls, and once DEPTH_LIMIT of them are
+active, deeper calls are interpreted, so deep recursion behaves as it
+does in the stack VM.
+
+NAME: Alicia Domingo
+DATE: Spring 2024
+CLASS: CPSC 326
+
+"""
+
+import sys
+import time
+from dataclasses import dataclass
+
+from src.mypl_error import *
+from src.mypl_opcode import *
+from src.mypl_frame import *
+from src.mypl_vm import VM
+from src.mypl_compiler import TemplateCompiler, runtime, RECURSION_LIMIT
+
+
+# number of calls of a template before it is promoted
+CALL_THRESHOLD = 100
+
+# number of backward jumps taken in a template before it is promoted
+LOOP_THRESHOLD = 1000
+
+# number of compiled and interpreted-from-python calls that can be active
+# (nested on python's stack) before further calls are interpreted: each
+# takes at most a few python frames, so this stays within RECURSION_LIMIT
+DEPTH_LIMIT = RECURSION_LIMIT // 5
+
+
+@dataclass
+class Promotion:
+    """A record of a template promotion (or of a failed attempt)."""
+    function_name: str
+    reason: str          # 'calls' or 'loops'
+    calls: int           # counters at the time of promotion
+    back_edges: int
+    time: float          # seconds since the start of the run
+    compile_time: float  # seconds spent compiling
+    error: str = None    # why the template could not be compiled
+
+
+class TieredVM(VM):
+    """A stack VM that promotes hot frame templates to python."""
+
+    def __init__(self, call_threshold=CALL_THRESHOLD,
+                 loop_threshold=LOOP_THRESHOLD, output=None, input=None):
+        """Creates a tiered VM.
+
+        Args:
+            call_threshold -- Calls of a template before it is promoted.
+            loop_threshold -- Loop iterations in a template before it is
+                              promoted.
+            output -- The text or binary stream the program writes to
+                      (standard output if None).
+            input -- The text or binary stream the program reads from
+                     (standard input if None).
+
+        While it runs, the VM raises python's recursion limit (for the
+        whole process) to at least RECURSION_LIMIT, restoring it after.
+
+        """
+        super().__init__(output, input)
+        self.call_threshold = call_threshold
+        self.loop_threshold = loop_threshold
+        self.promotions = []         # list of Promotion (in order)
+        self.namespace = None        # globals of the compiled functions
+        self.osr = {}                # template id -> (osr function, entries)
+        self.failed = set()          # ids of templates that cannot compile
+        self.recursive = set()       # ids of templates that can call themselves
+        self.start_time = None
+
+    def run(self, debug=False):
+        """Run the virtual machine."""
+        self.start_time = time.perf_counter()
+        limit = sys.getrecursionlimit()
+        sys.setrecursionlimit(max(limit, RECURSION_LIMIT))
+        try:
+            super().run(debug)
+        finally:
+            sys.setrecursionlimit(limit)
+
+    def link(self):
+        """Links the program, and binds each template's function name in
+        the compiled code's namespace to a stub that interprets it.
+
+        """
+        super().link()
+        if self.namespace != None:
+            return
+        self.namespace = runtime(self)
+        # active compiled calls (see DEPTH_LIMIT)
+        self.namespace['depth'] = 0
+        for template in self.templates:
+            stub = self.stub(template)
+            self.namespace[f'f{template.template_id}'] = stub
+            self.namespace[f'i{template.template_id}'] = stub
+            if template.template_id in self.reachable(template):
+                self.recursive.add(template.template_id)
+
+    def reachable(self, template):
+        """Returns the ids of the templates the template can (directly or
+        indirectly) call, leaving out its self tail calls (which compile
+        to loops).
+
+        """
+        calls = (OpCode.CALL, OpCode.TAILCALL)
+        found = set()
+        pending = [template]
+        while pending:
+            caller = pending.pop()
+            for instr in caller.instructions:
+                callee = instr.operand
+                if (not instr.opcode in calls or callee.template_id in found or
+                        (callee is caller and instr.opcode == OpCode.TAILCALL)):
+                    continue
+                found.add(callee.template_id)
+                pending.append(callee)
+        return found
+
+    def stub(self, template):
+        """Returns a python function that interprets the template."""
+        def interpret(*args):
+            return self.interpret(template, args)
+        return interpret
+
+    def interpret(self, template, args):
+        """Runs a call of the template (from compiled code) in the VM,
+        returning its result. The call counts toward promotion.
+
+        """
+        compiled = self.callee(template)
+        if compiled != None and not self.too_deep():
+            return compiled(*args)
+        namespace = self.namespace
+        self.stack.extend(args)
+        frame = self.new_frame(template)
+        base = self.call_base
+        self.call_base = len(self.call_stack)
+        self.call_stack.append(frame)
+        namespace['depth'] += 1
+        try:
+            return self.execute(frame)
+        finally:
+            namespace['depth'] -= 1
+            self.call_base = base
+
+    def too_deep(self):
+        """Returns true if calls must be interpreted (see DEPTH_LIMIT)."""
+        return self.namespace['depth'] >= DEPTH_LIMIT
+
+    def handlers(self):
+        """Returns the dispatch table, with the call and jump handlers
+        replaced by the counting ones.
+
+        """
+        table = super().handlers()
+        table[OpCode.CALL.value] = self.exec_counted_call
+        table[OpCode.TAILCALL.value] = self.exec_counted_tailcall
+        table[OpCode.JMP.value] = self.exec_counted_jmp
+        table[OpCode.JMPF.value] = self.exec_counted_jmpf
+        table[OpCode.CMPLT_JMPF.value] = self.exec_counted_cmplt_jmpf
+        return table
+
+    #------------------------------------------------------------
+    # Promotion
+    #------------------------------------------------------------
+
+    def promote(self, template, reason):
+        """Compiles the template to python, replacing its stub."""
+        start = time.perf_counter()
+        error = None
+        try:
+            depth_limit = None
+            if template.template_id in self.recursive:
+                depth_limit = DEPTH_LIMIT
+            compiler = TemplateCompiler(self, template, depth_limit)
+            source = compiler.compile()
+            osr_source = compiler.compile_osr()
+            if osr_source != None:
+                source += osr_source
+            exec(compile(source, f'<{template.function_name}>', 'exec'),
+                 self.namespace)
+        except MyPLError as ex:
+            error = str(ex)
+            self.failed.add(template.template_id)
+        else:
+            name = f'f{template.template_id}'
+            template.compiled = self.namespace[name]
+            if osr_source != None:
+                self.osr[template.template_id] = (self.namespace[name + '_osr'],
+                                                  compiler.entries)
+        end = time.perf_counter()
+        self.promotions.append(Promotion(template.function_name, reason,
+                                         template.calls, template.back_edges,
+                                         start - self.start_time, end - start,
+                                         error))
+
+    def back_edge(self, frame, stack):
+        """Counts a backward jump (to frame.pc), promoting the template if
+        it is hot, and continuing the running frame as python if it is
+        compiled. Returns the new current frame if the frame returned.
+
+        """
+        template = frame.template
+        template.back_edges += 1
+        tid = template.template_id
+        if template.compiled == None:
+            if template.back_edges < self.loop_threshold or tid in self.failed:
+                return None
+            self.promote(template, 'loops')
+        if (not tid in self.osr or not frame.pc in self.osr[tid][1] or
+                self.too_deep()):
+            return None
+        # on-stack replacement: run the rest of the call as python
+        variables = stack[frame.base:frame.operand_base]
+        operands = stack[frame.operand_base:]
+        stack.append(self.osr[tid][0](frame.pc, variables, operands))
+        return self.exec_ret(frame, stack, None)
+
+    #------------------------------------------------------------
+    # Counting calls and jumps
+    #------------------------------------------------------------
+
+    def callee(self, template):
+        """Counts a call of the template, promoting it if it is hot.
+        Returns the template's compiled function (or None).
+
+        """
+        template.calls += 1
+        if (template.compiled == None and
+                template.calls >= self.call_threshold and
+                not template.template_id in self.failed):
+            self.promote(template, 'calls')
+        return template.compiled
+
+    def pop_args(self, stack, arg_count):
+        """Pops and returns the (in order) arguments of a call."""
+        start = len(stack) - arg_count
+        args = stack[start:]
+        del stack[start:]
+        return args
+
+    def exec_counted_call(self, frame, stack, arg):
+        compiled = self.callee(self.templates[arg])
+        if compiled == None or self.too_deep():
+            return self.exec_call(frame, stack, arg)
+        args = self.pop_args(stack, self.templates[arg].arg_count)
+        stack.append(compiled(*args))
+
+    def exec_counted_tailcall(self, frame, stack, arg):
+        compiled = self.callee(self.templates[arg])
+        if compiled == None or self.too_deep():
+            return self.exec_tailcall(frame, stack, arg)
+        # the caller gets the compiled function's result
+        args = self.pop_args(stack, self.templates[arg].arg_count)
+        stack.append(compiled(*args))
+        return self.exec_ret(frame, stack, None)
+
+    def exec_counted_jmp(self, frame, stack, arg):
+        backward = arg < frame.pc
+        frame.pc = arg
+        if backward:
+            return self.back_edge(frame, stack)
+
+    def exec_counted_jmpf(self, frame, stack, arg):
+        x = stack.pop()
+        if not x:
+            backward = arg < frame.pc
+            frame.pc = arg
+            if backward:
+                return self.back_edge(frame, stack)
+
+    def exec_counted_cmplt_jmpf(self, frame, stack, arg):
+        x = stack.pop()
+        y = stack.pop()
+        if x == None or y == None:
+            raise MyPLError('VM Error: Cannot contain None type')
+        if not y < x:
+            backward = arg < frame.pc
+            frame.pc = arg
+            if backward:
+                return self.back_edge(frame, stack)
+
+    #------------------------------------------------------------
+    # Report
+    #------------------------------------------------------------
+
+    def tier_stats(self):
+        """Returns a report of the templates' counters and promotions."""
+        s = (f'Tier stats (call threshold {self.call_threshold},'
+             f' loop threshold {self.loop_threshold})\n')
+        s += f'{"function":20} {"calls":>8} {"back-edges":>10}  tier\n'
+        for template in self.templates:
+            tier = 'py' if template.compiled != None else 'vm'
+            s += (f'{template.function_name:20} {template.calls:>8}'
+                  f' {template.back_edges:>10}  {tier}\n')
+        s += 'Promotions\n'
+        if not self.promotions:
+            s += '  (none)\n'
+        for p in self.promotions:
+            s += (f'  {p.time * 1000:8.2f}ms  {p.function_name} on {p.reason}'
+                  f' (calls {p.calls}, back-edges {p.back_edges}),'
+                  f' compiled in {p.compile_time * 1000:.2f}ms\n')
+            if p.error != None:
+                s += f'    not compiled: {p.error}\n'
+        return s
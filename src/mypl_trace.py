@@ -0,0 +1,71 @@
+"""Tracing hooks of the MyPL stack VM.
+
+A tracer is notified of the instructions the VM runs, the calls and
+returns of functions, and the heap objects allocated. The VM only runs
+its traced loop (which calls the hooks) while at least one tracer is
+installed, so untraced programs run without any tracing checks.
+Functions the tiered VM has compiled to python are not traced.
+
+NAME: Alicia Domingo
+DATE: Spring 2024
+CLASS: CPSC 326
+
+"""
+
+from src.mypl_opcode import *
+
+
+# opcode values the traced loop reports as calls (with the new frame)
+CALL_OPCODES = {OpCode.CALL.value, OpCode.TAILCALL.value}
+
+# opcode values the traced loop reports as allocations (with the object)
+ALLOC_OPCODES = {OpCode.ALLOCS.value, OpCode.ALLOCA.value,
+                 OpCode.READLINES.value}
+
+
+class Tracer:
+    """Base class of VM tracers: each hook does nothing unless it is
+    overridden.
+
+    """
+
+    def on_instruction(self, vm, frame, pc, instr):
+        """Called before the instruction at pc of the frame runs."""
+        pass
+
+    def on_call(self, vm, frame):
+        """Called once the frame of a called function is current."""
+        pass
+
+    def on_return(self, vm, frame, value):
+        """Called before the frame returns the given value."""
+        pass
+
+    def on_alloc(self, vm, obj):
+        """Called after a struct object or array is allocated."""
+        pass
+
+    def on_breakpoint(self, vm, frame, pc):
+        """Called before a breakpoint's instruction (before
+        on_instruction).
+
+        """
+        pass
+
+
+class DebugTracer(Tracer):
+    """Tracer that prints the VM state before each instruction."""
+
+    def on_instruction(self, vm, frame, pc, instr):
+        vm.output.flush()
+        print('\n')
+        print('\t FRAME.........:', frame.template.function_name)
+        print('\t PC............:', pc + 1)
+        print('\t LOCATION......:', vm.location(frame.template, pc))
+        print('\t INSTRUCTION...:', instr)
+        stack = vm.stack
+        val = None if len(stack) <= frame.operand_base else stack[-1]
+        print('\t NEXT OPERAND..:', val)
+        cs = vm.call_stack
+        fun = cs[-1].template.function_name if cs else None
+        print('\t NEXT FUNCTION..:', fun)
@@ -6,23 +6,63 @@ CLASS: CPSC 326
 
 """
 
+from array import array
 from src.mypl_error import *
 from src.mypl_opcode import *
 from src.mypl_frame import *
+from src.mypl_heap import *
+from src.mypl_rope import *
+from src.mypl_io import *
+from src.mypl_trace import *
+
+# maximum number of released frames kept for reuse (per template)
+FRAME_POOL_SIZE = 256
+
+# opcodes whose operands are encoded as constant pool indexes
+POOL_OPCODES = [OpCode.PUSH, OpCode.ALLOCS, OpCode.ALLOCA, OpCode.LOADLOAD_ADD,
+                OpCode.LOAD_GETF, OpCode.INCLOCAL]
+
 
 class VM:
 
-    def __init__(self):
-        """Creates a VM."""
-        self.struct_heap = {}        # id -> dict
-        self.array_heap = {}         # id -> list
+    def __init__(self, output=None, input=None):
+        """Creates a VM.
+
+        Args:
+            output -- The text or binary stream the program writes to
+                      (standard output if None).
+            input -- The text or binary stream the program reads from
+                     (standard input if None).
+
+        """
         self.next_obj_id = 2024      # next available object id (int)
+        self.collector = HeapCollector()
+        self.output = OutputBuffer(output)
+        self.input = InputBuffer(input)
+        self.next_collection = 0     # object id that triggers a collection
+        self.struct_layouts = {}     # struct name -> field names (by slot)
+        self.blank_structs = {}      # struct name -> initial field values
         self.frame_templates = {}    # function name -> VMFrameTemplate
+        self.templates = []          # template id -> VMFrameTemplate
+        self.constants = []          # constant pool (index -> value)
+        self.constant_ids = {}       # (type, repr) of constant -> index
         self.call_stack = []         # function call stack
+        self.stack = []              # value stack (variables and operands)
+        self.call_base = 0           # call stack depth execute() returns at
+        self.return_value = None     # value returned at the call base
+        self.dispatch = []           # opcode value -> handler (see run)
+        self.tracers = []            # installed Tracers (see mypl_trace.py)
+        self.breakpoints = set()     # (function name, pc) of breakpoints
+        self.source_name = '<mypl>'  # program file (shown in locations)
 
     def __repr__(self):
-        """Returns a string representation of frame templates."""
+        """Returns a string representation of struct layouts and frame
+        templates."""
         s = ''
+        for name, fields in self.struct_layouts.items():
+            s += f'\nStruct {name} ({", ".join(fields)})\n'
+        if self.constants:
+            s += f'\nConstants {self.constants}\n'
         for name, template in self.frame_templates.items():
             s += f'\nFrame {name}\n'
             for i in range(len(template.instructions)):
@@ -38,6 +78,101 @@ class VM:
         """
         self.frame_templates[template.function_name] = template
 
+    def link(self):
+        """Gives each frame template a dense integer id, resolves the
+        function names of CALL and TAILCALL instructions to their frame
+        templates, and encodes each template for execution. Linking an
+        already linked program has no effect.
+
+        """
+        for name, fields in self.struct_layouts.items():
+            self.blank_structs[name] = (None,) * len(fields)
+        self.templates = list(self.frame_templates.values())
+        for i in range(len(self.templates)):
+            self.templates[i].template_id = i
+        for template in self.templates:
+            if template.opcodes != None:
+                # already linked and encoded
+                continue
+            instrs = template.instructions
+            for pc in range(len(instrs)):
+                instr = instrs[pc]
+                if not instr.opcode in [OpCode.CALL, OpCode.TAILCALL]:
+                    continue
+                if type(instr.operand) != str:
+                    continue
+                if not instr.operand in self.frame_templates:
+                    name = template.function_name
+                    self.error(f'Undefined function "{instr.operand}"'
+                               f' (in {name} at {pc}: {instr})')
+                instr.operand = self.frame_templates[instr.operand]
+        for template in self.templates:
+            if template.opcodes == None:
+                self.encode(template)
+
+    def constant(self, value):
+        """Returns the constant pool index of the value (interning it)."""
+        key = (type(value), repr(value))
+        if not key in self.constant_ids:
+            self.constant_ids[key] = len(self.constants)
+            self.constants.append(value)
+        return self.constant_ids[key]
+
+    def encode(self, template):
+        """Sets the compact encoding of a (linked) frame template: the
+        opcode values and operands in parallel int arrays. Operands are
+        ints (offsets, addresses, and field slots), template ids (for
+        calls), or constant pool indexes (for other values).
+
+        """
+        template.opcodes = array('i')
+        template.operands = array('i')
+        instrs = template.instructions
+        local_count = 0
+        for pc in range(len(instrs)):
+            instr = instrs[pc]
+            operand = instr.operand
+            if instr.opcode in [OpCode.LOAD, OpCode.STORE]:
+                local_count = max(local_count, operand + 1)
+            elif instr.opcode in [OpCode.LOADLOAD_ADD, OpCode.LOAD_GETF,
+                                  OpCode.INCLOCAL]:
+                local_count = max(local_count, operand[0] + 1)
+                if instr.opcode == OpCode.LOADLOAD_ADD:
+                    local_count = max(local_count, operand[1] + 1)
+            if instr.opcode in POOL_OPCODES:
+                operand = self.constant(operand)
+            elif instr.opcode in [OpCode.CALL, OpCode.TAILCALL]:
+                operand = operand.template_id
+            elif operand == None:
+                operand = 0
+            elif type(operand) != int:
+                name = template.function_name
+                self.error(f'Invalid operand (in {name} at {pc}: {instr})')
+            template.opcodes.append(instr.opcode.value)
+            template.operands.append(operand)
+        local_count = max(local_count, template.arg_count)
+        template.local_count = local_count
+        template.blank_locals = (None,) * (local_count - template.arg_count)
+
+    def new_frame(self, template):
+        """Returns a frame for a call of the template, whose arguments are
+        on top of the value stack (and become its first variable slots).
+        The rest of its variable slots are pushed. The frame is a released
+        frame of the template (reset for reuse) if there is one.
+
+        """
+        stack = self.stack
+        base = len(stack) - template.arg_count
+        stack.extend(template.blank_locals)
+        free_frames = template.free_frames
+        if free_frames:
+            frame = free_frames.pop()
+            frame.pc = 0
+            frame.base = base
+            frame.operand_base = len(stack)
+            return frame
+        return VMFrame(template, 0, base, len(stack))
+
     def error(self, msg, frame=None):
         """Report a VM error."""
         if not frame:
@@ -65,362 +200,501 @@ class VM:
     #----------------------------------------------------------------------
     
     def run(self, debug=False):
-        """Run the virtual machine."""
+        """Run the virtual machine (printing each instruction, with a
+        DebugTracer, if debug is true)."""
         # grab the "main" function frame and instantiate it
         if not 'main' in self.frame_templates:
             self.error('No "main" function')
-        frame = VMFrame(self.frame_templates['main'])
+        if debug:
+            self.add_tracer(DebugTracer())
+        self.link()
+        self.dispatch = self.handlers()
+        self.call_base = 0
+        frame = self.new_frame(self.frame_templates['main'])
         self.call_stack.append(frame)
+        self.collector.start()
+        self.next_collection = self.next_obj_id + self.collector.threshold
+        try:
+            self.execute(frame)
+        except MyPLError as ex:
+            # report where each active call was when the error happened
+            ex.args = (str(ex) + self.stack_trace(),)
+            raise
+        finally:
+            self.collector.stop()
+            self.output.flush()
+
+    def add_tracer(self, tracer):
+        """Installs a tracer (whose hooks are called as the program runs)."""
+        self.tracers.append(tracer)
+
+    def add_breakpoint(self, function_name, pc):
+        """Sets a breakpoint (reported to the tracers' on_breakpoint) on
+        the instruction at pc of the given function.
+
+        """
+        self.breakpoints.add((function_name, pc))
+
+    def location(self, template, pc):
+        """Returns the source location (file:line) of the instruction at
+        pc of the template.
+
+        """
+        line = template.line_table.line(max(pc, 0))
+        return self.source_name if line is None else f'{self.source_name}:{line}'
+
+    def stack_trace(self):
+        """Returns the active calls (most recent first), one per line."""
+        return ''.join(f'\n  at {frame.template.function_name}'
+                       f' ({self.location(frame.template, frame.pc - 1)})'
+                       for frame in reversed(self.call_stack))
+
+    def collect(self):
+        """Collects the unreachable heap objects (and schedules the next
+        collection).
+
+        """
+        self.collector.collect()
+        self.next_collection += self.collector.threshold
+
+    def execute(self, frame):
+        """Runs the instructions of the given (current) frame, and of the
+        frames it calls, until it returns (leaving the call stack at
+        self.call_base frames). Returns the frame's return value.
+
+        """
+        if self.tracers:
+            return self.execute_traced(frame)
+        handlers = self.dispatch
+        opcodes = frame.template.opcodes
+        operands = frame.template.operands
+        stack = self.stack
 
         # run loop (continue until run out of call frames or instructions)
-        while self.call_stack and frame.pc < len(frame.template.instructions):
+        while frame.pc < len(opcodes):
             # get the next instruction
-            instr = frame.template.instructions[frame.pc]
+            pc = frame.pc
             # increment the program count (pc)
-            frame.pc += 1
-            # for debugging:
-            if debug:
-                print('\n')
-                print('\t FRAME.........:', frame.template.function_name)
-                print('\t PC............:', frame.pc)
-                print('\t INSTRUCTION...:', instr)
-                val = None if not frame.operand_stack else frame.operand_stack[-1]
-                print('\t NEXT OPERAND..:', val)
-                cs = self.call_stack
-                fun = cs[-1].template.function_name if cs else None
-                print('\t NEXT FUNCTION..:', fun)
-
-            #------------------------------------------------------------
-            # Literals and Variables
-            #------------------------------------------------------------
-
-            if instr.opcode == OpCode.PUSH:
-                frame.operand_stack.append(instr.operand)
-
-            elif instr.opcode == OpCode.POP:
-                frame.operand_stack.pop()
-                
-            elif instr.opcode == OpCode.STORE:
-                x = frame.operand_stack.pop()
-                frame.variables.insert(instr.operand, x)
-                
-            elif instr.opcode == OpCode.LOAD:
-                x = frame.variables[instr.operand]
-                frame.operand_stack.append(x)
-            
-
-            #------------------------------------------------------------
-            # Operations
-            #------------------------------------------------------------
-            
-            # ARITHMETIC OPERATORS
-        
-            elif instr.opcode == OpCode.ADD:
-                if len(frame.operand_stack) >= 2:
-                    x = frame.operand_stack.pop()
-                    y = frame.operand_stack.pop()
-                    
-                    if x == None or y == None:
-                        raise MyPLError('VM Error: Stack must contain two valid ints or doubles')
-                    
-                    result = y + x
-                    frame.operand_stack.append(result)
-        
-            elif instr.opcode == OpCode.SUB:
-                if len(frame.operand_stack) >= 2:
-                    x = frame.operand_stack.pop()
-                    y = frame.operand_stack.pop()
-                    
-                    if x == None:
-                        raise MyPLError('VM Error: Stack must contain two valid ints or doubles')
-                    if y == None:
-                        raise MyPLError('VM Error: Stack must contain two valid ints or doubles')
-                    
-                    result = y - x
-                    frame.operand_stack.append(result)
-            
-            elif instr.opcode == OpCode.MUL:
-                if len(frame.operand_stack) >= 2:
-                    x = frame.operand_stack.pop()
-                    y = frame.operand_stack.pop()
-                    
-                    if x == None or y == None:
-                        raise MyPLError('VM Error: Stack must contain two valid ints or doubles')
-                    
-                    result = y * x
-                    frame.operand_stack.append(result)
-            
-            elif instr.opcode == OpCode.DIV:
-                if len(frame.operand_stack) >= 2:
-                    x = frame.operand_stack.pop()
-                    y = frame.operand_stack.pop()
-                    
-                    
-                    if x == None or y == None:
-                        raise MyPLError('VM Error: Stack must contain two valid ints or doubles')
-                    elif x == 0:
-                        raise MyPLError('VM Error: Division by 0 error')
-                    
-                    if type(x) == int and type(y) == int:
-                        result = int(y / x)
-                    else:
-                        result = y / x
-                    frame.operand_stack.append(result)
-             
-            # LOGICAL OPERATORS       
-            elif instr.opcode == OpCode.AND:
-                x = frame.operand_stack.pop()
-                y = frame.operand_stack.pop()
-                
-                if x == None or y == None:
-                    raise MyPLError('VM Error: Cannot contain None type')
-                
-                result = y and x
-                frame.operand_stack.append(result)
-            
-            elif instr.opcode == OpCode.OR:
-                x = frame.operand_stack.pop()
-                y = frame.operand_stack.pop()
-                
-                if x == None or y == None:
-                    raise MyPLError('VM Error: Cannot contain None type')
-                
-                result = y or x
-                frame.operand_stack.append(result)
-            
-            elif instr.opcode == OpCode.NOT:
-                x = frame.operand_stack.pop()
-                
-                if x == None:
-                    raise MyPLError('VM Error: Cannot contain None type')
-                
-                result = not x
-                frame.operand_stack.append(result)
-                
-            # RELATIONAL OPERATORS
-            elif instr.opcode == OpCode.CMPLT:
-                x = frame.operand_stack.pop()
-                y = frame.operand_stack.pop()
-                
-                if x == None or y == None:
-                    raise MyPLError('VM Error: Cannot contain None type')
-                
-                result = y < x
-                frame.operand_stack.append(result)
-            
-            elif instr.opcode == OpCode.CMPLE:
-                if len(frame.operand_stack) >= 2:
-                    x = frame.operand_stack.pop()
-                    y = frame.operand_stack.pop()
-                    
-                    if x == None:
-                        raise MyPLError('VM Error: Cannot contain None type')
-                    if y == None:
-                        raise MyPLError('VM Error: Cannot contain None type')
-                    
-                    result = y <= x
-                    frame.operand_stack.append(str(result).lower())
-            
-            elif instr.opcode == OpCode.CMPEQ:
-                x = frame.operand_stack.pop()
-                y = frame.operand_stack.pop()
-                
-                result = y == x
-                frame.operand_stack.append(result)
-            
-            elif instr.opcode == OpCode.CMPNE:
-                x = frame.operand_stack.pop()
-                y = frame.operand_stack.pop()
-                
-                result = y != x
-                frame.operand_stack.append(result)
-
-            #------------------------------------------------------------
-            # Branching
-            #------------------------------------------------------------
-
-            elif instr.opcode == OpCode.JMP:
-                frame.pc = instr.operand
-                
-            elif instr.opcode == OpCode.JMPF:
-                x = frame.operand_stack.pop()
-                if not x or x == 'false':
-                    frame.pc = instr.operand 
-                 
-            #------------------------------------------------------------
-            # Functions
-            #------------------------------------------------------------
-
-            elif instr.opcode == OpCode.RET:
-                return_val = frame.operand_stack.pop()
-                self.call_stack.pop()
-                if not len(self.call_stack) == 0:
-                    frame = self.call_stack[-1]
-                frame.operand_stack.append(return_val)
-            
-            elif instr.opcode == OpCode.CALL:
-                fun_name = instr.operand
-                new_frame_template = self.frame_templates[fun_name]
-                new_frame = VMFrame(new_frame_template)
-                self.call_stack.append(new_frame)
-                for _ in range(0, new_frame_template.arg_count):
-                    arg = frame.operand_stack.pop()
-                    new_frame.operand_stack.append(arg)
-                frame = new_frame
-                
-            #------------------------------------------------------------
-            # Built-In Functions
-            #------------------------------------------------------------
-
-            elif instr.opcode == OpCode.WRITE:
-                if not frame.operand_stack == []:
-                    x = frame.operand_stack.pop()
-                    
-                    if x == None:
-                        print('null', end='')
-                    else:
-                        if isinstance(x, bool):
-                            print(str(x).lower(), end='')
-                        else:
-                            print(x, end='')
-                            
-            elif instr.opcode == OpCode.READ:
-                result = input()
-                frame.operand_stack.append(result)
-                                 
-            elif instr.opcode == OpCode.LEN:
-                x = frame.operand_stack.pop()
-                if not x == None and type(x) == str:
-                    frame.operand_stack.append(len(x))
-                elif x == None:
-                    raise MyPLError('VM Error: Cannot get length of None type')
-                else:
-                    obj = self.array_heap
-                    frame.operand_stack.append(len(obj[x]))
-                
-            elif instr.opcode == OpCode.GETC:
-                x = frame.operand_stack.pop() 
-                if x == None:
-                    raise MyPLError('VM Error: Cannot be None type')
-                
-                y = frame.operand_stack.pop() 
-                if y == None:
-                    raise MyPLError('VM Error: Cannot be None type')
-                
-                if y > len(x) - 1 or y < 0:
-                    raise MyPLError('VM Error: Index too large for string')
-                result = x[y]
-                frame.operand_stack.append(result)
-                                
-            elif instr.opcode == OpCode.TOINT:
-                x = frame.operand_stack.pop()
-                if x == None:
-                    raise MyPLError('VM Error: Cannot be a None type')
-                
-                if type(x) == float:
-                    frame.operand_stack.append(int(x))
-                elif type(x) == str and x.isdigit():
-                    frame.operand_stack.append(int(x))
-                else:
-                    raise MyPLError('VM Error: TOINT opcode requires a string, int, or double')   
-                
-            elif instr.opcode == OpCode.TODBL:
-                x = frame.operand_stack.pop()
-                if x == None:
-                    raise MyPLError('VM Error: Cannot be a None type')
-                
-                if type(x) == str and not self.is_int_or_float(x):
-                    raise MyPLError('VM Error: String must just contain a int or double')
-                elif type(x) == int or type(x) == float:
-                    frame.operand_stack.append(float(x))
-                else:
-                    frame.operand_stack.append(float(x))
-                 
-            elif instr.opcode == OpCode.TOSTR:
-                x = frame.operand_stack.pop()
-                if x == None:
-                    raise MyPLError('VM Error: Cannot be a None type')
-                
-                frame.operand_stack.append(str(x))
-            
-            #------------------------------------------------------------
-            # Heap
-            #------------------------------------------------------------
-            elif instr.opcode == OpCode.ALLOCS:
-                oid = self.next_obj_id
-                self.next_obj_id += 1
-                self.struct_heap[oid] = {}
-                frame.operand_stack.append(oid)
-            
-            elif instr.opcode == OpCode.SETF:
-                a = instr.operand
-                value = frame.operand_stack.pop()
-                if value == None:
-                    raise MyPLError('VM Error: value is None. You cannot have any None types')
-                oid = frame.operand_stack.pop()
-                if oid == None:
-                    raise MyPLError('VM Error: oid is None. You cannot have any None types')
-                
-                obj = self.struct_heap
-                obj[oid][a] = value
-                self.struct_heap = obj
-                 
-            elif instr.opcode == OpCode.GETF:
-                oid = frame.operand_stack.pop()
-                if oid == None:
-                    raise MyPLError('VM Error: oid cannot be None type')
-                a = instr.operand
-                obj = self.struct_heap
-                frame.operand_stack.append(obj[oid][a])
-                
-            elif instr.opcode == OpCode.ALLOCA:
-                oid = self.next_obj_id
-                self.next_obj_id += 1
-                array_length = frame.operand_stack.pop()
-                if array_length == None or array_length < 0:
-                    raise MyPLError('VM Error: Array length cannot be None type or less than 0')
-                
-                self.array_heap[oid] = ['null' for _ in range(array_length)]
-                frame.operand_stack.append(oid)
-            
-            elif instr.opcode == OpCode.SETI:
-                value = frame.operand_stack.pop()
-                index = frame.operand_stack.pop()
-                oid = frame.operand_stack.pop()
-                
-                if index == None or oid == None:
-                    raise MyPLError('VM Error: Index cannot be None Type')
-                
-                obj = self.array_heap
-                if len(obj[oid]) <= index or index < 0:
-                    raise MyPLError('VM Error: Index is too large for allocated array')
-                
-                obj[oid][index] = value
-                self.array_heap = obj
-            
-            elif instr.opcode == OpCode.GETI:
-                index = frame.operand_stack.pop()
-                oid = frame.operand_stack.pop()
-                if index == None or oid == None:
-                    raise MyPLError('VM Error: Index or oid cannot be None')
-
-                obj = self.array_heap
-                if len(obj[oid]) <= index or index < 0:
-                    raise MyPLError('VM Error: Index too large for allocated array')
-                frame.operand_stack.append(obj[oid][index])
-
-            #------------------------------------------------------------
-            # Special 
-            #------------------------------------------------------------
-
-            elif instr.opcode == OpCode.DUP:
-                x = frame.operand_stack.pop()
-                frame.operand_stack.append(x)
-                frame.operand_stack.append(x)
-
-            elif instr.opcode == OpCode.NOP:
-                # do nothing
-                pass
+            frame.pc = pc + 1
+            # dispatch on the opcode's (dense, integer) enum value; only
+            # the function call handlers return a (new current) frame
+            next_frame = handlers[opcodes[pc]](frame, stack, operands[pc])
+            if next_frame is not None:
+                if len(self.call_stack) <= self.call_base:
+                    break
+                frame = next_frame
+                opcodes = frame.template.opcodes
+                operands = frame.template.operands
+        return self.return_value
+
+    def execute_traced(self, frame):
+        """Runs like execute(), calling the hooks of the installed tracers
+        for each instruction, call, return, allocation, and breakpoint.
+
+        """
+        handlers = self.dispatch
+        stack = self.stack
+        tracers = self.tracers
+        breakpoints = self.breakpoints
+        ret = OpCode.RET.value
+        while frame.pc < len(frame.template.opcodes):
+            pc = frame.pc
+            frame.pc = pc + 1
+            template = frame.template
+            if (template.function_name, pc) in breakpoints:
+                for tracer in tracers:
+                    tracer.on_breakpoint(self, frame, pc)
+            for tracer in tracers:
+                tracer.on_instruction(self, frame, pc, template.instructions[pc])
+            opcode = template.opcodes[pc]
+            if opcode == ret:
+                value = stack[-1] if len(stack) > frame.operand_base else None
+                for tracer in tracers:
+                    tracer.on_return(self, frame, value)
+            next_frame = handlers[opcode](frame, stack, template.operands[pc])
+            if opcode in ALLOC_OPCODES:
+                for tracer in tracers:
+                    tracer.on_alloc(self, stack[-1])
+            if next_frame is not None:
+                if len(self.call_stack) <= self.call_base:
+                    break
+                frame = next_frame
+                if opcode in CALL_OPCODES:
+                    for tracer in tracers:
+                        tracer.on_call(self, frame)
+        return self.return_value
+
+    def handlers(self):
+        """Returns the dispatch table: the handler for each opcode, indexed
+        by the opcode's enum value. Each handler takes the current frame,
+        the value stack, and the encoded operand of the instruction.
+
+        """
+        table = [self.unsupported] * (len(OpCode) + 1)
+        for opcode in OpCode:
+            table[opcode.value] = getattr(self, 'exec_' + opcode.name.lower())
+        return table
+
+    def unsupported(self, frame, stack, arg):
+        instr = frame.template.instructions[frame.pc - 1]
+        self.error(f'unsupported operation {instr}')
+
+    #------------------------------------------------------------
+    # Literals and Variables
+    #------------------------------------------------------------
+
+    def exec_push(self, frame, stack, arg):
+        stack.append(self.constants[arg])
+
+    def exec_pop(self, frame, stack, arg):
+        stack.pop()
+
+    def exec_store(self, frame, stack, arg):
+        stack[frame.base + arg] = stack.pop()
+
+    def exec_load(self, frame, stack, arg):
+        stack.append(stack[frame.base + arg])
+
+    #------------------------------------------------------------
+    # Superinstructions
+    #------------------------------------------------------------
+
+    def exec_loadload_add(self, frame, stack, arg):
+        addr1, addr2 = self.constants[arg]
+        y = stack[frame.base + addr1]
+        x = stack[frame.base + addr2]
+        if x == None or y == None:
+            raise MyPLError('VM Error: Stack must contain two valid ints or doubles')
+        stack.append(concat(y, x) if type(y) is str else y + x)
+
+    def exec_load_getf(self, frame, stack, arg):
+        addr, field_offset = self.constants[arg]
+        obj = stack[frame.base + addr]
+        if obj is None:
+            raise MyPLError('VM Error: oid cannot be None type')
+        stack.append(obj[field_offset])
+
+    def exec_inclocal(self, frame, stack, arg):
+        addr, value = self.constants[arg]
+        y = stack[frame.base + addr]
+        if y == None:
+            raise MyPLError('VM Error: Stack must contain two valid ints or doubles')
+        stack[frame.base + addr] = y + value
+
+    def exec_cmplt_jmpf(self, frame, stack, arg):
+        x = stack.pop()
+        y = stack.pop()
+        if x == None or y == None:
+            raise MyPLError('VM Error: Cannot contain None type')
+        if not y < x:
+            frame.pc = arg
 
+    def exec_initf(self, frame, stack, arg):
+        value = stack.pop()
+        stack[-1][arg] = value
+
+    #------------------------------------------------------------
+    # Operations
+    #------------------------------------------------------------
+
+    # ARITHMETIC OPERATORS
+
+    def exec_add(self, frame, stack, arg):
+        if len(stack) - frame.operand_base >= 2:
+            x = stack.pop()
+            y = stack.pop()
+            if x == None or y == None:
+                raise MyPLError('VM Error: Stack must contain two valid ints or doubles')
+            stack.append(concat(y, x) if type(y) is str else y + x)
+
+    def exec_sub(self, frame, stack, arg):
+        if len(stack) - frame.operand_base >= 2:
+            x = stack.pop()
+            y = stack.pop()
+            if x == None or y == None:
+                raise MyPLError('VM Error: Stack must contain two valid ints or doubles')
+            stack.append(y - x)
+
+    def exec_mul(self, frame, stack, arg):
+        if len(stack) - frame.operand_base >= 2:
+            x = stack.pop()
+            y = stack.pop()
+            if x == None or y == None:
+                raise MyPLError('VM Error: Stack must contain two valid ints or doubles')
+            stack.append(y * x)
+
+    def exec_div(self, frame, stack, arg):
+        if len(stack) - frame.operand_base >= 2:
+            x = stack.pop()
+            y = stack.pop()
+            if x == None or y == None:
+                raise MyPLError('VM Error: Stack must contain two valid ints or doubles')
+            elif x == 0:
+                raise MyPLError('VM Error: Division by 0 error')
+            if type(x) == int and type(y) == int:
+                stack.append(int(y / x))
             else:
-                self.error(f'unsupported operation {instr}')
\ No newline at end of file
+                stack.append(y / x)
+
+    # LOGICAL OPERATORS
+
+    def exec_and(self, frame, stack, arg):
+        x = stack.pop()
+        y = stack.pop()
+        if x == None or y == None:
+            raise MyPLError('VM Error: Cannot contain None type')
+        stack.append(y and x)
+
+    def exec_or(self, frame, stack, arg):
+        x = stack.pop()
+        y = stack.pop()
+        if x == None or y == None:
+            raise MyPLError('VM Error: Cannot contain None type')
+        stack.append(y or x)
+
+    def exec_not(self, frame, stack, arg):
+        x = stack.pop()
+        if x == None:
+            raise MyPLError('VM Error: Cannot contain None type')
+        stack.append(not x)
+
+    # RELATIONAL OPERATORS
+
+    def exec_cmplt(self, frame, stack, arg):
+        x = stack.pop()
+        y = stack.pop()
+        if x == None or y == None:
+            raise MyPLError('VM Error: Cannot contain None type')
+        stack.append(y < x)
+
+    def exec_cmple(self, frame, stack, arg):
+        if len(stack) - frame.operand_base >= 2:
+            x = stack.pop()
+            y = stack.pop()
+            if x == None or y == None:
+                raise MyPLError('VM Error: Cannot contain None type')
+            stack.append(y <= x)
+
+    def exec_cmpeq(self, frame, stack, arg):
+        x = stack.pop()
+        y = stack.pop()
+        stack.append(y == x)
+
+    def exec_cmpne(self, frame, stack, arg):
+        x = stack.pop()
+        y = stack.pop()
+        stack.append(y != x)
+
+    #------------------------------------------------------------
+    # Branching
+    #------------------------------------------------------------
+
+    def exec_jmp(self, frame, stack, arg):
+        frame.pc = arg
+
+    def exec_jmpf(self, frame, stack, arg):
+        x = stack.pop()
+        if not x:
+            frame.pc = arg
+
+    #------------------------------------------------------------
+    # Functions (these return the new current frame)
+    #------------------------------------------------------------
+
+    def exec_ret(self, frame, stack, arg):
+        # pop the frame's variables and operands, leaving the return value
+        # on top of the caller's operands
+        return_val = stack.pop()
+        del stack[frame.base:]
+        self.call_stack.pop()
+        free_frames = frame.template.free_frames
+        if len(free_frames) < FRAME_POOL_SIZE:
+            free_frames.append(frame)
+        if len(self.call_stack) > self.call_base:
+            stack.append(return_val)
+            return self.call_stack[-1]
+        self.return_value = return_val
+        return frame
+
+    def exec_call(self, frame, stack, arg):
+        # operand is the callee's template id, the arguments stay in place
+        new_frame = self.new_frame(self.templates[arg])
+        self.call_stack.append(new_frame)
+        return new_frame
+
+    def exec_tailcall(self, frame, stack, arg):
+        # reuse the current frame (its caller gets the result): move the
+        # arguments down to the frame's base
+        new_frame_template = self.templates[arg]
+        del stack[frame.base:len(stack) - new_frame_template.arg_count]
+        stack.extend(new_frame_template.blank_locals)
+        frame.template = new_frame_template
+        frame.pc = 0
+        frame.operand_base = len(stack)
+        return frame
+
+    #------------------------------------------------------------
+    # Built-In Functions
+    #------------------------------------------------------------
+
+    def exec_write(self, frame, stack, arg):
+        if len(stack) > frame.operand_base:
+            self.output.write_value(stack.pop())
+
+    def exec_read(self, frame, stack, arg):
+        self.output.flush()
+        stack.append(self.input.read_line())
+
+    def exec_readlines(self, frame, stack, arg):
+        oid = self.next_obj_id
+        self.next_obj_id += 1
+        if oid >= self.next_collection:
+            self.collect()
+        count = stack.pop()
+        if count == None:
+            raise MyPLError('VM Error: Cannot be None type')
+        self.output.flush()
+        stack.append(ArrayObject(oid, self.input.read_lines(count)))
+
+    def exec_len(self, frame, stack, arg):
+        # a string or an array
+        x = stack.pop()
+        if x is None:
+            raise MyPLError('VM Error: Cannot get length of None type')
+        stack.append(len(x))
+
+    def exec_getc(self, frame, stack, arg):
+        x = stack.pop()
+        if x == None:
+            raise MyPLError('VM Error: Cannot be None type')
+        y = stack.pop()
+        if y == None:
+            raise MyPLError('VM Error: Cannot be None type')
+        if y > len(x) - 1 or y < 0:
+            raise MyPLError('VM Error: Index too large for string')
+        stack.append(x[y])
+
+    def exec_toint(self, frame, stack, arg):
+        x = flat(stack.pop())
+        if x == None:
+            raise MyPLError('VM Error: Cannot be a None type')
+        if type(x) == float or (type(x) == str and x.isdigit()):
+            stack.append(int(x))
+        else:
+            raise MyPLError('VM Error: TOINT opcode requires a string, int, or double')
+
+    def exec_todbl(self, frame, stack, arg):
+        x = flat(stack.pop())
+        if x == None:
+            raise MyPLError('VM Error: Cannot be a None type')
+        if type(x) == str and not self.is_int_or_float(x):
+            raise MyPLError('VM Error: String must just contain a int or double')
+        stack.append(float(x))
+
+    def exec_tostr(self, frame, stack, arg):
+        x = stack.pop()
+        if x == None:
+            raise MyPLError('VM Error: Cannot be a None type')
+        stack.append(str(x))
+
+    def exec_builder(self, frame, stack, arg):
+        stack.append(Rope())
+
+    #------------------------------------------------------------
+    # Heap
+    #------------------------------------------------------------
+
+    def exec_allocs(self, frame, stack, arg):
+        oid = self.next_obj_id
+        self.next_obj_id += 1
+        if oid >= self.next_collection:
+            self.collect()
+        blank = self.blank_structs[self.constants[arg]]
+        stack.append(StructObject(oid, blank))
+
+    def exec_setf(self, frame, stack, arg):
+        value = stack.pop()
+        obj = stack.pop()
+        if obj is None:
+            raise MyPLError('VM Error: oid is None. You cannot have any None types')
+        obj[arg] = value
+
+    def exec_getf(self, frame, stack, arg):
+        obj = stack.pop()
+        if obj is None:
+            raise MyPLError('VM Error: oid cannot be None type')
+        stack.append(obj[arg])
+
+    def exec_alloca(self, frame, stack, arg):
+        oid = self.next_obj_id
+        self.next_obj_id += 1
+        if oid >= self.next_collection:
+            self.collect()
+        array_length = stack.pop()
+        if array_length == None or array_length < 0:
+            raise MyPLError('VM Error: Array length cannot be None type or less than 0')
+        stack.append(new_array(oid, array_length, self.constants[arg]))
+
+    def exec_seti(self, frame, stack, arg):
+        value = stack.pop()
+        index = stack.pop()
+        array = stack.pop()
+        if index is None or array is None:
+            raise MyPLError('VM Error: Index cannot be None Type')
+        # (indexing checks the upper bound, for boxed and typed arrays)
+        try:
+            if index < 0:
+                raise IndexError
+            array[index] = value
+        except IndexError:
+            raise MyPLError('VM Error: Index is too large for allocated array')
+
+    def exec_geti(self, frame, stack, arg):
+        index = stack.pop()
+        array = stack.pop()
+        if index is None or array is None:
+            raise MyPLError('VM Error: Index or oid cannot be None')
+        try:
+            if index < 0:
+                raise IndexError
+            stack.append(array[index])
+        except IndexError:
+            raise MyPLError('VM Error: Index too large for allocated array')
+
+    #------------------------------------------------------------
+    # Bulk array built ins
+    #------------------------------------------------------------
+
+    def exec_fill(self, frame, stack, arg):
+        value = stack.pop()
+        array_fill(stack.pop(), value)
+
+    def exec_copy(self, frame, stack, arg):
+        src = stack.pop()
+        array_copy(stack.pop(), src)
+
+    def exec_total(self, frame, stack, arg):
+        stack.append(array_total(stack.pop()))
+
+    def exec_min(self, frame, stack, arg):
+        stack.append(array_min(stack.pop()))
+
+    def exec_max(self, frame, stack, arg):
+        stack.append(array_max(stack.pop()))
+
+    def exec_scale(self, frame, stack, arg):
+        factor = stack.pop()
+        array_scale(stack.pop(), factor)
+
+    #------------------------------------------------------------
+    # Special
+    #------------------------------------------------------------
+
+    def exec_dup(self, frame, stack, arg):
+        x = stack.pop()
+        stack.append(x)
+        stack.append(x)
+
+    def exec_nop(self, frame, stack, arg):
+        # do nothing
+        pass
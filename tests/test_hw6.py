@@ -17,6 +17,10 @@ CLASS: CPSC 326
 
 import pytest
 import io
+import gc
+import os
+import threading
+import sys
 
 from src.mypl_error import *
 from src.mypl_iowrapper import *
@@ -1154,3 +1158,1444 @@ def test_string_get(capsys):
 # looking for places in your code that are not tested by the above.
 #----------------------------------------------------------------------
 
+
+#----------------------------------------------------------------------
+# LOOP-INVARIANT CODE MOTION
+#----------------------------------------------------------------------
+
+def test_invariant_condition_hoisted(capsys):
+    program = (
+        'void main() { \n'
+        '  string s = "abc"; \n'
+        '  for (int i = 0; i < length(s); i = i + 1) { \n'
+        '    print(get(i, s)); \n'
+        '  } \n'
+        '} \n'
+    )
+    vm = build(program)
+    instrs = vm.frame_templates['main'].instructions
+    assert instrs.count(LEN()) == 1
+    vm.run()
+    captured = capsys.readouterr()
+    assert captured.out == 'abc'
+
+def test_invariant_body_expr_hoisted(capsys):
+    program = (
+        'void main() { \n'
+        '  int k = 3; \n'
+        '  int t = 0; \n'
+        '  for (int i = 0; i < 4; i = i + 1) { \n'
+        '    t = t + (k * 10); \n'
+        '  } \n'
+        '  print(t); \n'
+        '} \n'
+    )
+    vm = build(program)
+    instrs = vm.frame_templates['main'].instructions
+    loop_start = [i for i in instrs if i.opcode == OpCode.JMP][-1].operand
+    assert MUL() not in instrs[loop_start:]
+    vm.run()
+    captured = capsys.readouterr()
+    assert captured.out == '120'
+
+def test_no_hoisting_past_heap_writes(capsys):
+    program = (
+        'struct T { int x; } \n'
+        'void main() { \n'
+        '  T t = new T(0); \n'
+        '  int i = 0; \n'
+        '  while (i < 3) { \n'
+        '    t.x = i; \n'
+        '    print(t.x + 1); \n'
+        '    i = i + 1; \n'
+        '  } \n'
+        '} \n'
+    )
+    build(program).run()
+    captured = capsys.readouterr()
+    assert captured.out == '123'
+
+def test_no_hoisted_eval_when_loop_not_entered(capsys):
+    program = (
+        'void main() { \n'
+        '  int z = 0; \n'
+        '  int i = 0; \n'
+        '  while (i < 0) { \n'
+        '    print(10 / z); \n'
+        '    i = i + 1; \n'
+        '  } \n'
+        '  print("done"); \n'
+        '} \n'
+    )
+    build(program).run()
+    captured = capsys.readouterr()
+    assert captured.out == 'done'
+
+def test_no_hoisting_errors_past_output(capsys):
+    program = (
+        'void main() { \n'
+        '  int z = 0; \n'
+        '  int i = 0; \n'
+        '  while (i < 2) { \n'
+        '    print("x"); \n'
+        '    int q = 10 / z; \n'
+        '    i = i + 1; \n'
+        '  } \n'
+        '} \n'
+    )
+    runs = []
+    for optimize in [False, True]:
+        vm = VM()
+        cg = CodeGenerator(vm, optimize=optimize)
+        ASTParser(Lexer(FileWrapper(io.StringIO(program)))).parse().accept(cg)
+        with pytest.raises(MyPLError) as e:
+            vm.run()
+        runs.append((capsys.readouterr().out, str(e.value).splitlines()[0]))
+    with pytest.raises(MyPLError) as e:
+        CompiledProgram(build(program)).run()
+    runs.append((capsys.readouterr().out, str(e.value).splitlines()[0]))
+    assert runs == [('x', 'VM Error: Division by 0 error')] * 3
+
+#----------------------------------------------------------------------
+# TAIL CALLS
+#----------------------------------------------------------------------
+
+def test_tail_call_emitted(capsys):
+    program = (
+        'int sum(int n, int acc) { \n'
+        '  if (n <= 0) {return acc;} \n'
+        '  return sum(n - 1, acc + n); \n'
+        '} \n'
+        'void main() { \n'
+        '  print(sum(2000, 0)); \n'
+        '} \n'
+    )
+    vm = build(program)
+    sum_template = vm.frame_templates['sum']
+    instrs = sum_template.instructions
+    assert TAILCALL(sum_template) in instrs
+    assert CALL(sum_template) not in instrs
+    vm.run()
+    captured = capsys.readouterr()
+    assert captured.out == '2001000'
+
+def test_tail_calls_run_in_constant_stack_depth(capsys):
+    program = (
+        'int sum(int n, int acc) { \n'
+        '  if (n <= 0) {return acc;} \n'
+        '  return sum(n - 1, acc + n); \n'
+        '} \n'
+        'void main() { \n'
+        '  int s = sum(100000, 0); \n'
+        '  print(s); \n'
+        '} \n'
+    )
+    class DepthTracer(Tracer):
+        def __init__(self):
+            self.depths = set()
+        def on_breakpoint(self, vm, frame, pc):
+            self.depths.add(len(vm.call_stack))
+    vm = build(program)
+    tracer = DepthTracer()
+    vm.add_tracer(tracer)
+    vm.add_breakpoint('sum', 0)
+    vm.run()
+    assert capsys.readouterr().out == '5000050000'
+    # main's frame and a single (reused) frame of sum
+    assert tracer.depths == {2}
+
+def test_non_tail_call_not_rewritten(capsys):
+    program = (
+        'int fac(int n) { \n'
+        '  if (n <= 0) {return 1;} \n'
+        '  return n * fac(n - 1); \n'
+        '} \n'
+        'void main() { \n'
+        '  print(fac(5)); \n'
+        '} \n'
+    )
+    vm = build(program)
+    fac_template = vm.frame_templates['fac']
+    assert CALL(fac_template) in fac_template.instructions
+    vm.run()
+    captured = capsys.readouterr()
+    assert captured.out == '120'
+
+#----------------------------------------------------------------------
+# SUPERINSTRUCTIONS
+#----------------------------------------------------------------------
+
+def test_superinstructions_emitted(capsys):
+    program = (
+        'struct T {int x; int y;} \n'
+        'void main() { \n'
+        '  T t = new T(1, 2); \n'
+        '  int s = 0; \n'
+        '  for (int i = 0; i < 3; i = i + 1) { \n'
+        '    s = s + i; \n'
+        '  } \n'
+        '  print(s); \n'
+        '  print(t.y); \n'
+        '} \n'
+    )
+    vm = build(program)
+    opcodes = [i.opcode for i in vm.frame_templates['main'].instructions]
+    assert OpCode.INITF in opcodes and OpCode.DUP not in opcodes
+    assert OpCode.INCLOCAL in opcodes
+    assert OpCode.LOADLOAD_ADD in opcodes
+    assert OpCode.CMPLT_JMPF in opcodes
+    assert OpCode.LOAD_GETF in opcodes
+    vm.run()
+    captured = capsys.readouterr()
+    assert captured.out == '32'
+
+def test_unoptimized_matches_optimized(capsys):
+    program = (
+        'struct T {int x; T next;} \n'
+        'void main() { \n'
+        '  T t = null; \n'
+        '  for (int i = 0; i < 4; i = i + 1) { \n'
+        '    t = new T(i, t); \n'
+        '  } \n'
+        '  while (t != null) { \n'
+        '    print(t.x); \n'
+        '    t = t.next; \n'
+        '  } \n'
+        '} \n'
+    )
+    vm = VM()
+    cg = CodeGenerator(vm, optimize=False)
+    ASTParser(Lexer(FileWrapper(io.StringIO(program)))).parse().accept(cg)
+    vm.run()
+    build(program).run()
+    captured = capsys.readouterr()
+    assert captured.out == '32103210'
+
+#----------------------------------------------------------------------
+# REGISTER VM
+#----------------------------------------------------------------------
+
+from src.mypl_reg_vm import *
+from src.mypl_reg_code_gen import *
+
+# helper function to build and return a register vm from the program string
+def build_reg(program):
+    vm = RegVM()
+    cg = RegCodeGenerator(vm)
+    ASTParser(Lexer(FileWrapper(io.StringIO(program)))).parse().accept(cg)
+    return vm
+
+def test_reg_arithmetic_and_loops(capsys):
+    program = (
+        'void main() { \n'
+        '  int x = 0; \n'
+        '  for (int i = 1; i <= 5; i = i + 1) { \n'
+        '    for (int j = 1; j <= 4; j = j + 1) { \n'
+        '      x = x + (i * j); \n'
+        '    } \n'
+        '  } \n'
+        '  print(x); \n'
+        '  print(" "); \n'
+        '  print(7 / 2); \n'
+        '  print(" "); \n'
+        '  print(3 >= 4); \n'
+        '} \n'
+    )
+    build_reg(program).run()
+    captured = capsys.readouterr()
+    assert captured.out == '150 3 false'
+
+def test_reg_function_calls(capsys):
+    program = (
+        'int fib(int n) { \n'
+        '  if (n < 2) {return n;} \n'
+        '  return fib(n - 1) + fib(n - 2); \n'
+        '} \n'
+        'string g(string s1, string s2) {return s1 + s2;} \n'
+        'void main() { \n'
+        '  print(fib(10)); \n'
+        '  print(g("a", "b")); \n'
+        '} \n'
+    )
+    build_reg(program).run()
+    captured = capsys.readouterr()
+    assert captured.out == '55ab'
+
+def test_reg_structs_and_arrays(capsys):
+    program = (
+        'struct Node {int val; Node next;} \n'
+        'void main() { \n'
+        '  array Node xs = new Node[2]; \n'
+        '  xs[0] = new Node(1, null); \n'
+        '  xs[1] = new Node(2, xs[0]); \n'
+        '  xs[1].next.val = 5; \n'
+        '  print(xs[0].val); \n'
+        '  print(length(xs)); \n'
+        '  Node n = xs[1]; \n'
+        '  print(n.next.val + n.val); \n'
+        '} \n'
+    )
+    build_reg(program).run()
+    captured = capsys.readouterr()
+    assert captured.out == '527'
+
+def test_reg_if_else(capsys):
+    program = (
+        'void main() { \n'
+        '  for (int i = 0; i < 4; i = i + 1) { \n'
+        '    string s = ""; \n'
+        '    if (i == 0) {s = "a";} \n'
+        '    elseif (i == 1) {s = "b";} \n'
+        '    else {s = "c";} \n'
+        '    print(s); \n'
+        '  } \n'
+        '} \n'
+    )
+    build_reg(program).run()
+    captured = capsys.readouterr()
+    assert captured.out == 'abcc'
+
+def test_reg_void_function_returns(capsys):
+    program = (
+        'void f(int x) {print(x);} \n'
+        'void main() { \n'
+        '  f(1); \n'
+        '  f(2); \n'
+        '} \n'
+    )
+    build_reg(program).run()
+    captured = capsys.readouterr()
+    assert captured.out == '12'
+
+
+#----------------------------------------------------------------------
+# STRUCT FIELD SLOTS
+#----------------------------------------------------------------------
+
+def test_struct_fields_compiled_to_slots(capsys):
+    program = (
+        'struct T {int x; string y;} \n'
+        'void main() { \n'
+        '  T t = new T(1, "a"); \n'
+        '  t.y = "b"; \n'
+        '  print(t.y); \n'
+        '} \n'
+    )
+    vm = build(program)
+    assert vm.struct_layouts == {'T': ['x', 'y']}
+    instrs = vm.frame_templates['main'].instructions
+    assert ALLOCS('T') in instrs
+    assert SETF(1) in instrs
+    vm.run()
+    captured = capsys.readouterr()
+    assert captured.out == 'b'
+
+def test_struct_field_slots_differ_by_type(capsys):
+    program = (
+        'struct A {int v; B b;} \n'
+        'struct B {string s; int v;} \n'
+        'void main() { \n'
+        '  A a = new A(1, new B("x", 2)); \n'
+        '  array B bs = new B[1]; \n'
+        '  bs[0] = a.b; \n'
+        '  a.b.v = a.v + bs[0].v; \n'
+        '  print(a.v); \n'
+        '  print(a.b.v); \n'
+        '  print(bs[0].s); \n'
+        '} \n'
+    )
+    build(program).run()
+    captured = capsys.readouterr()
+    assert captured.out == '13x'
+
+
+#----------------------------------------------------------------------
+# LINKING
+#----------------------------------------------------------------------
+
+def test_calls_linked_to_templates(capsys):
+    program = (
+        'int f(int x) {return x + 1;} \n'
+        'void main() { \n'
+        '  print(f(f(1))); \n'
+        '} \n'
+    )
+    vm = build(program)
+    f_template = vm.frame_templates['f']
+    assert [t.function_name for t in vm.templates] == ['f', 'main']
+    assert f_template.template_id == 0
+    assert CALL(f_template) in vm.frame_templates['main'].instructions
+    vm.run()
+    captured = capsys.readouterr()
+    assert captured.out == '3'
+
+def test_undefined_function_found_at_link_time():
+    program = (
+        'void main() { \n'
+        '  if (false) {g(1);} \n'
+        '} \n'
+    )
+    with pytest.raises(MyPLError) as e:
+        build(program)
+    assert str(e.value).startswith('VM Error: Undefined function "g"')
+
+
+#----------------------------------------------------------------------
+# DISPATCH TABLE
+#----------------------------------------------------------------------
+
+def test_every_opcode_has_a_handler():
+    vm = VM()
+    handlers = vm.handlers()
+    for opcode in OpCode:
+        assert handlers[opcode.value] != vm.unsupported
+
+def test_templates_encoded_with_constant_pool(capsys):
+    program = (
+        'void main() { \n'
+        '  string s = "ab"; \n'
+        '  print(s); \n'
+        '  print("ab"); \n'
+        '  print(1); \n'
+        '  print(1.0); \n'
+        '} \n'
+    )
+    vm = build(program)
+    template = vm.frame_templates['main']
+    assert len(template.opcodes) == len(template.instructions)
+    assert template.opcodes[0] == OpCode.PUSH.value
+    assert vm.constants[template.operands[0]] == 'ab'
+    # equal constants share one pool entry, 1 and 1.0 do not
+    assert vm.constants.count('ab') == 1
+    assert 1 in vm.constants and 1.0 in vm.constants
+    assert len([c for c in vm.constants if c == 1]) == 2
+    vm.run()
+    captured = capsys.readouterr()
+    assert captured.out == 'abab11.0'
+
+def test_struct_field_through_array_element_assigned(capsys):
+    program = (
+        'struct A {int v;} \n'
+        'struct B {A a;} \n'
+        'void main() { \n'
+        '  array B bs = new B[1]; \n'
+        '  bs[0] = new B(new A(1)); \n'
+        '  bs[0].a.v = 2; \n'
+        '  print(bs[0].a.v); \n'
+        '} \n'
+    )
+    build(program).run()
+    captured = capsys.readouterr()
+    assert captured.out == '2'
+
+
+#----------------------------------------------------------------------
+# FRAME POOLING
+#----------------------------------------------------------------------
+
+def test_call_frames_reused(capsys):
+    program = (
+        'int f(int n) { \n'
+        '  int x = n * 2; \n'
+        '  return x; \n'
+        '} \n'
+        'void main() { \n'
+        '  for (int i = 0; i < 5; i = i + 1) { \n'
+        '    int y = f(i); \n'
+        '    print(y); \n'
+        '  } \n'
+        '} \n'
+    )
+    vm = build(program)
+    vm.run()
+    assert capsys.readouterr().out == '02468'
+    template = vm.frame_templates['f']
+    assert template.local_count == 2
+    # every call reused the frame released by the previous one
+    assert len(template.free_frames) == 1
+    frame = template.free_frames[0]
+    # the argument becomes the first variable slot, in place
+    vm.stack.append(7)
+    assert vm.new_frame(template) is frame
+    assert vm.stack == [7, None]
+    assert (frame.pc, frame.base, frame.operand_base) == (0, 0, 2)
+
+
+def test_arguments_are_first_variables(capsys):
+    program = (
+        'int f(int a, int b) {return a - b;} \n'
+        'void main() { \n'
+        '  int x = 1; \n'
+        '  print(f(10, 3)); \n'
+        '} \n'
+    )
+    vm = build(program)
+    # no prologue: the arguments are already in variable slots 0 and 1
+    assert vm.frame_templates['f'].instructions == [LOAD(0), LOAD(1), SUB(), RET()]
+    vm.run()
+    assert capsys.readouterr().out == '7'
+    # returns truncate the value stack
+    assert vm.stack == []
+
+
+#----------------------------------------------------------------------
+# VALUE MODEL
+#----------------------------------------------------------------------
+
+def test_null_and_bools_are_python_values(capsys):
+    program = (
+        'struct T {int x;} \n'
+        'void main() { \n'
+        '  string s = "null"; \n'
+        '  T t = null; \n'
+        '  print(s == null); \n'
+        '  print(t == null); \n'
+        '  print(1 <= 2); \n'
+        '  if (2 <= 1) {print("no");} \n'
+        '  T u = new T(null); \n'
+        '  print(u.x); \n'
+        '} \n'
+    )
+    vm = build(program)
+    instrs = vm.frame_templates['main'].instructions
+    # the string "null" and null are distinct constants
+    assert PUSH(None) in instrs and PUSH('null') in instrs
+    vm.run()
+    assert capsys.readouterr().out == 'falsetruetruenull'
+    # CMPLE pushes a bool (not the string 'true')
+    vm = VM()
+    vm.add_frame_template(VMFrameTemplate('main', 0, [PUSH(1), PUSH(2), CMPLE(), RET()]))
+    vm.run()
+    assert vm.return_value is True
+
+
+#----------------------------------------------------------------------
+# HEAP OBJECTS
+#----------------------------------------------------------------------
+
+def test_heap_objects_referenced_directly(capsys):
+    program = (
+        'struct T {int x;} \n'
+        'T main() { \n'
+        '  T t1 = new T(1); \n'
+        '  T t2 = new T(1); \n'
+        '  print(t1 == t2); \n'
+        '  print(t1); \n'
+        '  return t1; \n'
+        '} \n'
+    )
+    vm = build(program)
+    vm.run()
+    # objects compare by identity and print as their object id
+    assert capsys.readouterr().out == 'false2024'
+    assert isinstance(vm.return_value, StructObject)
+    assert vm.return_value == [1]
+    assert vm.return_value.oid == 2024
+
+def test_nested_array_field_path_assigned(capsys):
+    program = (
+        'struct N {array int xs;} \n'
+        'void main() { \n'
+        '  array N ns = new N[2]; \n'
+        '  ns[1] = new N(new int[3]); \n'
+        '  ns[1].xs[2] = 7; \n'
+        '  print(ns[1].xs[2]); \n'
+        '} \n'
+    )
+    build(program).run()
+    assert capsys.readouterr().out == '7'
+
+def test_unreachable_cycles_collected(capsys):
+    program = (
+        'struct N {N next;} \n'
+        'void main() { \n'
+        '  N keep = new N(null); \n'
+        '  keep.next = keep; \n'
+        '  for (int i = 0; i < 100; i = i + 1) { \n'
+        '    N n = new N(null); \n'
+        '    n.next = n; \n'
+        '  } \n'
+        '  print(keep.next == keep); \n'
+        '} \n'
+    )
+    gc.freeze()
+    try:
+        for incremental in [False, True]:
+            vm = build(program)
+            gc.collect()
+            vm.collector = HeapCollector(10, incremental, full_interval=2)
+            vm.run()
+            assert capsys.readouterr().out == 'true'
+            stats = vm.collector.stats
+            assert stats.collections == 10
+            assert stats.full_collections == (5 if incremental else 10)
+            # only the program's unreachable structs are counted
+            assert 90 <= stats.cyclic <= 100
+            assert len(stats.pauses) == 10
+            # python's collector is handed back as it was (still frozen)
+            assert gc.isenabled() and gc.get_freeze_count() > 0
+    finally:
+        gc.unfreeze()
+
+def test_acyclic_objects_not_counted_as_collected(capsys):
+    program = (
+        'struct P {int x;} \n'
+        'void main() { \n'
+        '  for (int i = 0; i < 1000; i = i + 1) { \n'
+        '    P p = new P(i); \n'
+        '  } \n'
+        '} \n'
+    )
+    vm = build(program)
+    vm.collector = HeapCollector(100)
+    gc.collect()
+    vm.run()
+    # dropped structs are freed (by reference counting) between collections
+    assert vm.collector.stats.collections == 9
+    assert vm.collector.stats.cyclic == 0
+    assert 'cyclic collected...: 0' in vm.collector.gc_stats()
+
+def test_primitive_arrays_stored_unboxed(capsys):
+    program = (
+        'void main() { \n'
+        '  array int xs = new int[3]; \n'
+        '  array double ds = new double[2]; \n'
+        '  array bool bs = new bool[2]; \n'
+        '  array string ss = new string[2]; \n'
+        '  xs[0] = 5; \n'
+        '  print(xs[0]); print(xs[1]); \n'
+        '  xs[0] = null; \n'
+        '  print(xs[0]); \n'
+        '  ds[0] = 2.5; \n'
+        '  print(ds[0]); print(ds[1]); \n'
+        '  bs[1] = true; \n'
+        '  print(bs[0]); print(bs[1]); \n'
+        '  xs[2] = 100000000000000000000; \n'
+        '  print(xs[2]); print(length(xs)); \n'
+        '} \n'
+    )
+    vm = build(program)
+    instrs = vm.frame_templates['main'].instructions
+    assert ALLOCA('int') in instrs and ALLOCA('string') in instrs
+    out = run_both(program, capsys)
+    assert out == '5nullnull2.5nullnulltrue1000000000000000000003'
+    # the element type picks the storage; null is tracked separately
+    xs = new_array(2024, 3, 'int')
+    assert type(xs) == IntArray and xs.values.typecode == 'q'
+    assert xs[1] == None and len(xs) == 3
+    xs[1] = 7
+    assert xs[1] == 7 and xs.nulls[1] == 0
+    assert type(new_array(2025, 3, 'string')) == ArrayObject
+    # values the typed storage cannot hold move the elements to a list
+    ds = new_array(2026, 2, 'double')
+    ds[0] = 1.5
+    ds[1] = 3
+    assert type(ds) == BoxedArray and ds[0] == 1.5 and type(ds[1]) == int
+
+def test_typed_array_index_errors():
+    program = (
+        'void main() { \n'
+        '  array int xs = new int[3]; \n'
+        '  xs[3] = 1; \n'
+        '} \n'
+    )
+    with pytest.raises(MyPLError) as e:
+        build(program).run()
+    assert 'Index is too large' in str(e.value)
+    program = program.replace('xs[3] = 1', 'int x = xs[0 - 1]')
+    with pytest.raises(MyPLError) as e:
+        build(program).run()
+    assert 'Index too large' in str(e.value)
+
+
+#----------------------------------------------------------------------
+# BULK ARRAY BUILT-INS
+#----------------------------------------------------------------------
+
+from src.mypl_semantic_checker import *
+
+def test_bulk_array_built_ins(capsys):
+    program = (
+        'void main() { \n'
+        '  array int xs = new int[4]; \n'
+        '  fill(xs, 3); \n'
+        '  xs[1] = 7; \n'
+        '  scale(xs, 2); \n'
+        '  array int ys = new int[5]; \n'
+        '  copy(ys, xs); \n'
+        '  int t = total(xs); \n'
+        '  print(t); print(" "); \n'
+        '  print(min(xs)); print(" "); print(max(xs)); print(" "); \n'
+        '  print(ys[1]); print(ys[4]); print(" "); \n'
+        '  array double ds = new double[2]; \n'
+        '  fill(ds, 0.5); \n'
+        '  print(total(ds)); print(" "); \n'
+        '  array string ss = new string[0]; \n'
+        '  print(max(ss)); \n'
+        '} \n'
+    )
+    instrs = build(program).frame_templates['main'].instructions
+    for instr in [FILL(), SCALE(), COPY(), TOTAL(), MIN(), MAX()]:
+        assert instr in instrs
+    out = run_both(program, capsys)
+    assert out == '32 6 14 14null 1.0 null'
+    build_reg(program).run()
+    assert capsys.readouterr().out == out
+
+def test_bulk_array_built_ins_errors():
+    program = (
+        'void main() { \n'
+        '  array int xs = new int[2]; \n'
+        '  xs[0] = 1; \n'
+        '  int t = total(xs); \n'
+        '} \n'
+    )
+    with pytest.raises(MyPLError) as e:
+        build(program).run()
+    assert 'cannot contain None' in str(e.value)
+    program = program.replace('int[2]', 'int[1]')
+    program = program.replace('int t = total(xs)', 'copy(xs, new int[2])')
+    with pytest.raises(MyPLError) as e:
+        build(program).run()
+    assert 'shorter' in str(e.value)
+    program = 'void main() { \n  fill(1, 2); \n} \n'
+    ast = ASTParser(Lexer(FileWrapper(io.StringIO(program)))).parse()
+    with pytest.raises(MyPLError) as e:
+        ast.accept(SemanticChecker())
+    assert 'requires an array' in str(e.value)
+
+def test_bulk_array_built_ins_type_errors():
+    def check(stmt):
+        program = (
+            'struct S {array int xs;} \n'
+            'void main() { \n'
+            '  array int xs = new int[2]; \n'
+            '  array double ds = new double[2]; \n'
+            '  array string ss = new string[2]; \n'
+            '  S s = new S(xs); \n'
+            '  int x = 1; \n'
+            f'  {stmt}; \n'
+            '} \n'
+        )
+        ast = ASTParser(Lexer(FileWrapper(io.StringIO(program)))).parse()
+        ast.accept(SemanticChecker())
+    for stmt in ['fill(xs, 1)', 'fill(s.xs, x)', 'scale(ds, 2.5)',
+                 'copy(xs, s.xs)', 'fill(ss, "a")', 'copy(ds, new double[1])']:
+        check(stmt)
+    for stmt, msg in [('scale(xs, 2.5)', 'requires the array type int'),
+                      ('fill(xs, "hi")', 'requires the array type int'),
+                      ('fill(s.xs, 1.5)', 'requires the array type int'),
+                      ('fill(ds, xs)', 'requires the array type double'),
+                      ('scale(ss, 2)', 'int or double array'),
+                      ('copy(xs, ds)', 'arrays of the same type'),
+                      ('copy(xs, x)', 'arrays of the same type'),
+                      ('fill(x, 1)', 'requires an array'),
+                      ('total(x)', 'requires an array')]:
+        with pytest.raises(MyPLError) as e:
+            check(stmt)
+        assert msg in str(e.value)
+
+def test_bulk_array_writes_stop_hoisting(capsys):
+    program = (
+        'void main() { \n'
+        '  array int xs = new int[1]; \n'
+        '  fill(xs, 0); \n'
+        '  for (int i = 1; i <= 3; i = i + 1) { \n'
+        '    print(xs[0] + 1); \n'
+        '    fill(xs, i); \n'
+        '  } \n'
+        '} \n'
+    )
+    build(program).run()
+    assert capsys.readouterr().out == '123'
+
+
+#----------------------------------------------------------------------
+# STRING BUILDERS
+#----------------------------------------------------------------------
+
+from src.mypl_rope import *
+
+def test_long_string_concat_builds_rope(capsys):
+    program = (
+        'void main() { \n'
+        '  string s = "ab"; \n'
+        '  for (int i = 0; i < 1000; i = i + 1) { \n'
+        '    s = s + "cd"; \n'
+        '  } \n'
+        '  string t = s + "x"; \n'
+        '  string u = s + "y"; \n'
+        '  int n = length(t); \n'
+        '  print(n); \n'
+        '  n = 2002; \n'
+        '  string x = get(n, t); \n'
+        '  string y = get(n, u); \n'
+        '  print(x + y); \n'
+        '  print(t < u); \n'
+        '  int i = stoi(s); \n'
+        '} \n'
+    )
+    vm = build(program)
+    with pytest.raises(MyPLError):
+        vm.run()
+    assert capsys.readouterr().out == '2003xytrue'
+    rope = Rope() + 'ab' + 'cd'
+    assert type(rope) == Rope and len(rope) == 4 and rope.count == 2
+    assert rope == 'abcd' and 'abcd' == rope and rope + 'e' != rope
+    assert str(rope) == 'abcd' and rope.count == 1
+
+def test_string_builder_built_ins(capsys):
+    program = (
+        'struct Doc { \n'
+        '  string text; \n'
+        '} \n'
+        'void main() { \n'
+        '  string b = builder(); \n'
+        '  Doc d = new Doc(b); \n'
+        '  for (int i = 0; i < 3; i = i + 1) { \n'
+        '    string k = itos(i); \n'
+        '    append(b, k); \n'
+        '    append(d.text, "-"); \n'
+        '  } \n'
+        '  string t = b; \n'
+        '  append(b, "!"); \n'
+        '  print(t); print(" "); print(b); print(" "); print(d.text); \n'
+        '  int n = length(b); \n'
+        '  print(n); print(b == "012!"); \n'
+        '} \n'
+    )
+    build(program).run()
+    assert capsys.readouterr().out == '012 012! ---4true'
+    program = 'void main() { \n  append("a", "b"); \n} \n'
+    ast = ASTParser(Lexer(FileWrapper(io.StringIO(program)))).parse()
+    with pytest.raises(MyPLError) as e:
+        ast.accept(SemanticChecker())
+    assert 'requires a string variable' in str(e.value)
+
+
+#----------------------------------------------------------------------
+# BUFFERED OUTPUT
+#----------------------------------------------------------------------
+
+from src.mypl_io import *
+
+def test_output_written_to_vm_sink(capsys):
+    program = (
+        'void main() { \n'
+        '  print("x="); \n'
+        '  print(1.5); \n'
+        '  print(true); \n'
+        '  string s = null; \n'
+        '  print(s); \n'
+        '} \n'
+    )
+    vm = build(program)
+    vm.output = OutputBuffer(io.StringIO())
+    vm.run()
+    assert vm.output.sink.getvalue() == 'x=1.5truenull'
+    vm = build(program)
+    vm.output = OutputBuffer(io.BytesIO(), size=4)
+    vm.run()
+    assert vm.output.sink.getvalue() == b'x=1.5truenull'
+    assert capsys.readouterr().out == ''
+
+def test_output_flushed_before_read_and_on_error(capsys):
+    program = (
+        'void main() { \n'
+        '  print("name?"); \n'
+        '  string name = input(); \n'
+        '  print("hi," + name); \n'
+        '  int x = 1 / 0; \n'
+        '} \n'
+    )
+    prompts = []
+    class Source(io.StringIO):
+        def read(self, size=-1):
+            prompts.append(capsys.readouterr().out)
+            return super().read(size)
+    vm = build(program)
+    vm.input = InputBuffer(Source('ann\n'))
+    with pytest.raises(MyPLError):
+        vm.run()
+    assert prompts == ['name?']
+    assert capsys.readouterr().out == 'hi,ann'
+
+
+def test_input_lines_read_into_arrays(capsys):
+    program = (
+        'void main() { \n'
+        '  string first = input(); \n'
+        '  array string two = input_lines(2); \n'
+        '  array string rest = input_lines(); \n'
+        '  int n = length(rest); \n'
+        '  print(first + two[0] + two[1]); \n'
+        '  print(n); \n'
+        '  print(rest[n - 1]); \n'
+        '  string end = input(); \n'
+        '  print(end); \n'
+        '} \n'
+    )
+    vm = build(program)
+    vm.input = InputBuffer(io.BytesIO('a\nb\nc\nd\né\nf'.encode()), size=3)
+    vm.run()
+    assert capsys.readouterr().out == 'abc3fnull'
+    program = 'void main() { \n  array string xs = input_lines(1, 2); \n} \n'
+    ast = ASTParser(Lexer(FileWrapper(io.StringIO(program)))).parse()
+    with pytest.raises(MyPLError) as e:
+        ast.accept(SemanticChecker())
+    assert 'at most one argument' in str(e.value)
+
+def test_input_read_from_pipe_as_lines_arrive():
+    read_fd, write_fd = os.pipe()
+    answered = []
+    first_line_read = threading.Event()
+    def producer():
+        os.write(write_fd, b'a\n')
+        # the second line is only written once the first is read
+        answered.append(first_line_read.wait(5))
+        os.write(write_fd, b'b\n')
+        os.close(write_fd)
+    thread = threading.Thread(target=producer)
+    thread.start()
+    with open(read_fd, 'rb') as source:
+        buffer = InputBuffer(source)
+        assert buffer.read_line() == 'a'
+        first_line_read.set()
+        assert buffer.read_lines() == ['b']
+    thread.join()
+    assert answered == [True]
+
+
+#----------------------------------------------------------------------
+# TRACING HOOKS
+#----------------------------------------------------------------------
+
+from src.mypl_trace import *
+
+class RecordingTracer(Tracer):
+    def __init__(self):
+        self.events = []
+        self.instructions = 0
+    def on_instruction(self, vm, frame, pc, instr):
+        self.instructions += 1
+    def on_call(self, vm, frame):
+        self.events.append(('call', frame.template.function_name))
+    def on_return(self, vm, frame, value):
+        self.events.append(('return', frame.template.function_name, value))
+    def on_alloc(self, vm, obj):
+        self.events.append(('alloc', len(obj)))
+    def on_breakpoint(self, vm, frame, pc):
+        self.events.append(('break', frame.template.function_name, pc))
+
+def test_tracer_hooks(capsys):
+    program = (
+        'int f(int x) { \n'
+        '  array int xs = new int[x]; \n'
+        '  return x + 1; \n'
+        '} \n'
+        'void main() { \n'
+        '  int y = f(2); \n'
+        '  print(y); \n'
+        '} \n'
+    )
+    vm = build(program)
+    tracer = RecordingTracer()
+    vm.add_tracer(tracer)
+    vm.add_breakpoint('f', 0)
+    vm.run()
+    assert capsys.readouterr().out == '3'
+    assert tracer.events == [('call', 'f'), ('break', 'f', 0), ('alloc', 2),
+                             ('return', 'f', 3), ('return', 'main', None)]
+    assert tracer.instructions == sum(len(t.instructions) for t in vm.templates)
+
+def test_debug_run_prints_instructions(capsys):
+    vm = build('void main() { \n  print("hi"); \n} \n')
+    vm.run(debug=True)
+    out = capsys.readouterr().out
+    assert 'FRAME.........: main' in out and 'INSTRUCTION...:' in out
+    # program output is flushed before the next instruction is printed
+    assert 'NEXT OPERAND..: hi\n\t NEXT FUNCTION..: main\nhi\n' in out
+
+
+#----------------------------------------------------------------------
+# PROFILER
+#----------------------------------------------------------------------
+
+import json
+import signal
+from src.mypl_profile import *
+
+def test_profiler_counts(capsys):
+    program = (
+        'int f(int n) { \n'
+        '  if (n <= 0) { \n'
+        '    return 0; \n'
+        '  } \n'
+        '  int r = f(n - 1); \n'
+        '  return r + 1; \n'
+        '} \n'
+        'void main() { \n'
+        '  int x = f(3); \n'
+        '  print(x); \n'
+        '} \n'
+    )
+    vm = build(program)
+    profiler = Profiler()
+    vm.add_tracer(profiler)
+    profiler.start(vm)
+    vm.run()
+    profiler.stop()
+    assert capsys.readouterr().out == '3'
+    main, f = profiler.profile()
+    assert (main.function_name, main.calls) == ('main', 1)
+    assert (f.function_name, f.calls) == ('f', 4)
+    assert main.inclusive == profiler.total == main.exclusive + f.exclusive
+    assert f.inclusive == f.exclusive
+    assert sum(profiler.opcode_counts().values()) == profiler.total
+    assert profiler.opcode_counts()['CALL'] == 4
+    runs, function_name, pc, instr = profiler.hottest()[0]
+    assert (runs, function_name) == (4, 'f')
+    report = json.loads(profiler.to_json())
+    assert report['instructions'] == profiler.total
+    assert [p['calls'] for p in report['functions']] == [1, 4]
+    assert 'Hottest instructions' in profiler.report()
+
+
+class SamplingTracer(Tracer):
+    def __init__(self, sampler):
+        self.sampler = sampler
+    def on_breakpoint(self, vm, frame, pc):
+        self.sampler.sample()
+
+def test_sampling_profiler_collapsed_stacks(capsys):
+    program = (
+        'int f(int n) { \n'
+        '  if (n <= 0) { \n'
+        '    return 0; \n'
+        '  } \n'
+        '  int r = f(n - 1); \n'
+        '  return r + 1; \n'
+        '} \n'
+        'void main() { \n'
+        '  int x = f(2); \n'
+        '  print(x); \n'
+        '} \n'
+    )
+    vm = build(program)
+    # (samples taken at breakpoints: the timer interval is never reached)
+    sampler = SamplingProfiler(vm, interval=60)
+    vm.add_tracer(SamplingTracer(sampler))
+    vm.add_breakpoint('f', 0)
+    vm.add_breakpoint('main', 0)
+    handler = signal.getsignal(signal.SIGPROF)
+    sampler.start()
+    vm.run()
+    sampler.stop()
+    assert signal.getsignal(signal.SIGPROF) == handler
+    assert capsys.readouterr().out == '2'
+    assert sampler.samples == 4
+    assert sampler.collapsed() == (
+        'main (<mypl>:9) 1\n'
+        'main (<mypl>:9);f (<mypl>:2) 1\n'
+        'main (<mypl>:9);f (<mypl>:5);f (<mypl>:2) 1\n'
+        'main (<mypl>:9);f (<mypl>:5);f (<mypl>:5);f (<mypl>:2) 1\n')
+
+
+#----------------------------------------------------------------------
+# SOURCE LOCATIONS
+#----------------------------------------------------------------------
+
+def test_line_table_runs():
+    table = LineTable()
+    table.add(0, 1, 3)
+    table.add(2, 1, 3)
+    table.add(2, 2, 3)
+    table.add(5, 4, 5)
+    assert list(table.starts) == [0, 2, 5]
+    assert [table.line(pc) for pc in range(7)] == [1, 1, 2, 2, 2, 4, 4]
+    assert table.position(5) == (4, 5)
+    # instructions 1 and 2 fused into one
+    table.remap({0: 0, 1: 1, 2: 1, 3: 2, 4: 3, 5: 4, 6: 5})
+    assert list(table.starts) == [0, 1, 4]
+    assert [table.line(pc) for pc in range(5)] == [1, 2, 2, 2, 4]
+    assert LineTable().position(0) == None
+
+def test_instructions_map_to_statement_lines():
+    program = (
+        'void main() { \n'
+        '  int x = 0; \n'
+        '  for (int i = 0; i < 3; i = i + 1) { \n'
+        '    x = x + i; \n'
+        '  } \n'
+        '  print(x); \n'
+        '} \n'
+    )
+    vm = build(program)
+    template = vm.frame_templates['main']
+    lines = [template.line_table.line(pc)
+             for pc in range(len(template.instructions))]
+    assert lines[0] == 2 and lines[-1] == 6
+    for pc, instr in enumerate(template.instructions):
+        if instr.opcode == OpCode.CMPLT_JMPF or instr.opcode == OpCode.JMP:
+            assert lines[pc] == 3
+        if instr.opcode == OpCode.WRITE:
+            assert lines[pc] == 6
+    assert set(lines) == {2, 3, 4, 6}
+
+def test_runtime_error_reports_stack_trace():
+    program = (
+        'int f(int n) { \n'
+        '  if (n == 0) { \n'
+        '    return 1 / n; \n'
+        '  } \n'
+        '  int r = f(n - 1); \n'
+        '  return r; \n'
+        '} \n'
+        'void main() { \n'
+        '  int x = f(1); \n'
+        '} \n'
+    )
+    vm = build(program)
+    vm.source_name = 'div.mypl'
+    with pytest.raises(MyPLError) as e:
+        vm.run()
+    assert str(e.value).splitlines() == [
+        'VM Error: Division by 0 error',
+        '  at f (div.mypl:3)',
+        '  at f (div.mypl:5)',
+        '  at main (div.mypl:9)',
+    ]
+
+
+#----------------------------------------------------------------------
+# PHASE TIMING
+#----------------------------------------------------------------------
+
+from src.mypl_phases import *
+
+def test_phase_timer_counts_each_phase(capsys):
+    program = (
+        'void main() { \n'
+        '  int x = 0; \n'
+        '  for (int i = 0; i < 3; i = i + 1) { \n'
+        '    x = x + i; \n'
+        '  } \n'
+        '  print(x); \n'
+        '} \n'
+    )
+    timer = PhaseTimer()
+    timer.begin('lex', 'tokens')
+    lexer = TokenList(Lexer(FileWrapper(io.StringIO(program))))
+    timer.end(lambda: len(lexer.tokens))
+    timer.begin('parse', 'nodes')
+    ast = ASTParser(lexer).parse()
+    timer.end(lambda: count_nodes(ast))
+    timer.begin('codegen', 'instructions')
+    vm = VM()
+    ast.accept(CodeGenerator(vm))
+    timer.end(lambda: instruction_count(vm))
+    counter = InstructionCounter()
+    vm.add_tracer(counter)
+    timer.begin('execute', 'executed')
+    vm.run()
+    timer.end(lambda: counter.count)
+    timer.stop()
+    assert capsys.readouterr().out == '3'
+    lex, parse, codegen, execute = timer.phases
+    assert lex.count == 42 and lexer.tokens[-1].token_type == TokenType.EOS
+    direct = ASTParser(Lexer(FileWrapper(io.StringIO(program)))).parse()
+    assert parse.count == count_nodes(direct) > 0
+    assert codegen.count == len(vm.frame_templates['main'].instructions)
+    assert execute.count > codegen.count
+    assert all(p.wall >= 0 and p.peak_memory > 0 for p in timer.phases)
+    report = json.loads(timer.to_json())
+    assert [p['name'] for p in report['phases']] == [
+        'lex', 'parse', 'codegen', 'execute']
+    assert report['total']['wall'] == sum(p.wall for p in timer.phases)
+    assert timer.report().splitlines()[-1].startswith('total')
+
+def test_disabled_phase_timer_does_nothing():
+    timer = PhaseTimer(False)
+    timer.begin('lex')
+    timer.end(lambda: 1 / 0)
+    timer.stop()
+    assert timer.phases == []
+
+
+#----------------------------------------------------------------------
+# COMPILED (PYTHON) BACKEND
+#----------------------------------------------------------------------
+
+from src.mypl_compiler import *
+
+def build_py(program):
+    return CompiledProgram(build(program))
+
+def run_both(program, capsys):
+    build(program).run()
+    vm_out = capsys.readouterr().out
+    build_py(program).run()
+    py_out = capsys.readouterr().out
+    assert py_out == vm_out
+    return py_out
+
+def test_py_functions_and_recursion(capsys):
+    program = (
+        'int fib(int n) { \n'
+        '  if (n < 2) {return n;} \n'
+        '  return fib(n - 1) + fib(n - 2); \n'
+        '} \n'
+        'int sum(int n, int acc) { \n'
+        '  if (n <= 0) {return acc;} \n'
+        '  return sum(n - 1, acc + n); \n'
+        '} \n'
+        'int depth(int n) { \n'
+        '  if (n == 0) {return 0;} \n'
+        '  int d = depth(n - 1); \n'
+        '  return d + 1; \n'
+        '} \n'
+        'void main() { \n'
+        '  print(fib(12)); \n'
+        '  print(" "); \n'
+        '  print(sum(20000, 0)); \n'
+        '  print(" "); \n'
+        '  print(depth(5000)); \n'
+        '} \n'
+    )
+    assert run_both(program, capsys) == '144 200010000 5000'
+
+def test_py_loops_and_conditions(capsys):
+    program = (
+        'void main() { \n'
+        '  int total = 0; \n'
+        '  for (int i = 0; i < 10; i = i + 1) { \n'
+        '    if (i < 3) {total = total + 1;} \n'
+        '    elseif (i <= 6) {total = total + 10;} \n'
+        '    else {total = total + 100;} \n'
+        '  } \n'
+        '  int j = 0; \n'
+        '  while (j < 5) {j = j + 2;} \n'
+        '  print(total); \n'
+        '  print(j); \n'
+        '  print(7 / 2); \n'
+        '  print(7.0 / 2); \n'
+        '} \n'
+    )
+    assert run_both(program, capsys) == '343633.5'
+
+def test_py_structs_and_arrays(capsys):
+    program = (
+        'struct Node {int val; Node next;} \n'
+        'void main() { \n'
+        '  Node head = null; \n'
+        '  for (int i = 0; i < 5; i = i + 1) {head = new Node(i, head);} \n'
+        '  array int xs = new int[5]; \n'
+        '  int k = 0; \n'
+        '  while (head != null) { \n'
+        '    xs[k] = head.val * 2; \n'
+        '    head = head.next; \n'
+        '    k = k + 1; \n'
+        '  } \n'
+        '  for (int i = 0; i < length(xs); i = i + 1) {print(xs[i]);} \n'
+        '  print(head); \n'
+        '} \n'
+    )
+    assert run_both(program, capsys) == '86420null'
+
+def test_py_runtime_error_matches_vm():
+    program = (
+        'void main() { \n'
+        '  array int xs = new int[2]; \n'
+        '  print(xs[2]); \n'
+        '} \n'
+    )
+    with pytest.raises(MyPLError) as e:
+        build_py(program).run()
+    assert str(e.value) == 'VM Error: Index too large for allocated array'
+
+def test_py_call_statements_in_loops(capsys):
+    program = (
+        'void f(int x) {} \n'
+        'int g(int x) {return x;} \n'
+        'void main() { \n'
+        '  int i = 0; \n'
+        '  while (i < 3) { \n'
+        '    f(i); \n'
+        '    g(i); \n'
+        '    i = i + 1; \n'
+        '  } \n'
+        '  for (int j = 0; j < 2; j = j + 1) { \n'
+        '    g(j); \n'
+        '  } \n'
+        '  print("done"); \n'
+        '} \n'
+    )
+    assert run_both(program, capsys) == 'done'
+
+def test_py_deep_recursion_reports_vm_error(capsys):
+    program = (
+        'int f(int n) { \n'
+        '  if (n == 0) {return 0;} \n'
+        '  int r = f(n - 1); \n'
+        '  return r + 1; \n'
+        '} \n'
+        'void main() { \n'
+        '  print(f(200000)); \n'
+        '} \n'
+    )
+    limit = sys.getrecursionlimit()
+    with pytest.raises(MyPLError) as e:
+        build_py(program).run()
+    assert str(e.value) == 'VM Error: Call stack too deep for compiled code'
+    assert sys.getrecursionlimit() == limit
+
+
+#----------------------------------------------------------------------
+# TIERED EXECUTION
+#----------------------------------------------------------------------
+
+from src.mypl_tier import *
+
+def build_tiered(program, call_threshold, loop_threshold):
+    vm = TieredVM(call_threshold, loop_threshold)
+    ASTParser(Lexer(FileWrapper(io.StringIO(program)))).parse().accept(CodeGenerator(vm))
+    return vm
+
+def test_tiered_promotes_hot_function(capsys):
+    program = (
+        'int fib(int n) { \n'
+        '  if (n < 2) {return n;} \n'
+        '  return fib(n - 1) + fib(n - 2); \n'
+        '} \n'
+        'int once(int n) {return n + 1;} \n'
+        'void main() { \n'
+        '  print(fib(15)); \n'
+        '  print(once(1)); \n'
+        '} \n'
+    )
+    vm = build_tiered(program, 10, 1000)
+    vm.run()
+    assert capsys.readouterr().out == '6102'
+    templates = vm.frame_templates
+    assert templates['fib'].compiled != None
+    assert templates['once'].compiled == None
+    assert templates['once'].calls == 1
+    assert [(p.function_name, p.reason, p.calls) for p in vm.promotions] == [
+        ('fib', 'calls', 10)]
+
+def test_tiered_on_stack_replacement_of_loop(capsys):
+    program = (
+        'void main() { \n'
+        '  int total = 0; \n'
+        '  for (int i = 0; i < 100; i = i + 1) { \n'
+        '    if (i < 50) {total = total + 1;} \n'
+        '    else {total = total + 2;} \n'
+        '  } \n'
+        '  print(total); \n'
+        '} \n'
+    )
+    vm = build_tiered(program, 100, 10)
+    vm.run()
+    assert capsys.readouterr().out == '150'
+    main = vm.frame_templates['main']
+    # the loop finished in python: the VM only saw the first iterations
+    assert main.back_edges == 10
+    assert [(p.function_name, p.reason) for p in vm.promotions] == [
+        ('main', 'loops')]
+    assert 'main on loops' in vm.tier_stats()
+
+def test_tiered_vm_streams(capsys):
+    program = (
+        'int twice(int x) {return 2 * x;} \n'
+        'void main() { \n'
+        '  for (int i = 0; i < 3; i = i + 1) { \n'
+        '    string line = input(); \n'
+        '    int x = stoi(line); \n'
+        '    int y = twice(x); \n'
+        '    print(y); \n'
+        '  } \n'
+        '} \n'
+    )
+    output = io.StringIO()
+    vm = TieredVM(2, 2, output, io.StringIO('1\n2\n3\n'))
+    ASTParser(Lexer(FileWrapper(io.StringIO(program)))).parse().accept(CodeGenerator(vm))
+    vm.run()
+    assert output.getvalue() == '246'
+    assert vm.promotions != []
+    assert capsys.readouterr().out == ''
+
+def test_tiered_promotes_loops_with_call_statements(capsys):
+    program = (
+        'void f(int x) {} \n'
+        'void main() { \n'
+        '  int i = 0; \n'
+        '  while (i < 30) { \n'
+        '    f(i); \n'
+        '    i = i + 1; \n'
+        '  } \n'
+        '  for (int j = 0; j < 30; j = j + 1) { \n'
+        '    f(j); \n'
+        '  } \n'
+        '  print(i); \n'
+        '} \n'
+    )
+    vm = build_tiered(program, 10, 10)
+    vm.run()
+    assert capsys.readouterr().out == '30'
+    assert vm.failed == set()
+    assert [(p.function_name, p.error) for p in vm.promotions] == [
+        ('f', None), ('main', None)]
+
+def test_tiered_compiled_calls_interpreted(capsys):
+    program = (
+        'int twice(int x) {return 2 * x;} \n'
+        'int hot(int x) { \n'
+        '  int y = twice(x); \n'
+        '  return y + 1; \n'
+        '} \n'
+        'void main() { \n'
+        '  int total = 0; \n'
+        '  for (int i = 0; i < 20; i = i + 1) { \n'
+        '    int h = hot(i); \n'
+        '    total = total + h; \n'
+        '  } \n'
+        '  print(total); \n'
+        '} \n'
+    )
+    vm = build_tiered(program, 5, 1000)
+    vm.run()
+    assert capsys.readouterr().out == '400'
+    templates = vm.frame_templates
+    assert templates['hot'].compiled != None
+    # called through the stub (interpreted) until promoted itself
+    assert templates['twice'].compiled != None
+    assert templates['twice'].calls == 5
+
+def test_tiered_deep_recursion_interpreted_past_depth_limit(capsys):
+    program = (
+        'int f(int n) { \n'
+        '  if (n == 0) {return 0;} \n'
+        '  int r = f(n - 1); \n'
+        '  return r + 1; \n'
+        '} \n'
+        'int g(int n) {return n + 1;} \n'
+        'void main() { \n'
+        '  int x = f(200000); \n'
+        '  int y = g(x); \n'
+        '  int z = g(y); \n'
+        '  print(z); \n'
+        '} \n'
+    )
+    build(program).run()
+    assert capsys.readouterr().out == '200002'
+    limit = sys.getrecursionlimit()
+    vm = build_tiered(program, 2, 3)
+    vm.run()
+    assert capsys.readouterr().out == '200002'
+    templates = vm.frame_templates
+    assert templates['f'].compiled != None
+    assert templates['g'].compiled != None
+    # only recursive templates count their active calls
+    assert vm.recursive == {templates['f'].template_id}
+    assert vm.namespace['depth'] == 0
+    assert sys.getrecursionlimit() == limit